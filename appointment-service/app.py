@@ -1,63 +1,139 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, request, jsonify
+from sqlalchemy import insert, update
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from datetime import datetime
-from model import db, Appointment
+from datetime import datetime, timedelta
+from functools import partial
+import click
+import os
+import sys
 
-app = Flask(__name__)
-CORS(app)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///appointments.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-db.init_app(app)
+from common.archive import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, wants_archived, with_archive
+from common.batch import init_batch
+from common.compression import init_compression
+from common.conditional import CollectionVersion
+from common.database import database_config, init_database
+from common.http_client import ServiceClient
+from common.log import get_logger, init_logging
+from common.metrics import init_metrics
+from common.migrations import run_migrations
+from common.pagination import (
+    fetch_page, is_paginated, keyset_after, ndjson_response, parse_limit, wants_stream
+)
+from common.serialization import init_json
+from common.serving import env_url, on_shutdown, on_warmup, warm_up_database
+from model import db, Appointment, MIGRATIONS, appointment_archive, appointment_serializer, archive_appointments
+from availability import (
+    FREE_STATUSES, OPENING_HOURS_MESSAGE, AvailabilityEngine, TreatmentDurations, TreatmentNotFound
+)
 
-with app.app_context():
-    db.create_all()
+log = get_logger('appointment')
 
-@app.route('/health', methods=['GET'])
+TREATMENT_SERVICE_URL = env_url('TREATMENT_SERVICE_URL', 'http://localhost:5003')
+
+treatment_client = ServiceClient('treatment-service', TREATMENT_SERVICE_URL)
+availability = AvailabilityEngine(TreatmentDurations(treatment_client))
+
+bp = Blueprint('appointment', __name__, cli_group=None)
+
+def create_app(config=None):
+    app = Flask(__name__)
+    CORS(app)
+    init_logging(app, 'appointment-service')
+    init_json(app)
+    init_compression(app)
+    app.config.update(database_config('sqlite:///appointments.db'))
+    if config:
+        app.config.update(config)
+    
+    init_database(app, db)
+    init_metrics(app, 'appointment-service', db)
+    
+    with app.app_context():
+        run_migrations(db.engine, db.metadata, MIGRATIONS)
+    
+    app.register_blueprint(bp)
+    init_batch(app, db)
+    on_warmup(app, warm_up_database(db))
+    on_shutdown(app, treatment_client.close)
+    return app
+
+MAX_BULK_APPOINTMENTS = 10000
+APPOINTMENT_STATUSES = ('pending', 'confirmed', 'paid', 'cancelled', 'completed')
+DATE_FORMAT_MESSAGE = 'Invalid date format. Use YYYY-MM-DD HH:MM or YYYY-MM-DDTHH:MM'
+
+def parse_appointment_date(value):
+    if 'T' in value:
+        return datetime.strptime(value, '%Y-%m-%dT%H:%M')
+    return datetime.strptime(value, '%Y-%m-%d %H:%M')
+
+def validate_bulk_item(item):
+    if not isinstance(item, dict):
+        raise ValueError('Each appointment must be an object')
+    for field in ['user_id', 'treatment_id', 'appointment_date']:
+        if field not in item:
+            raise ValueError(f'Missing required field: {field}')
+    try:
+        user_id = int(item['user_id'])
+        treatment_id = int(item['treatment_id'])
+    except (TypeError, ValueError):
+        raise ValueError('user_id and treatment_id must be integers')
+    try:
+        appointment_date = parse_appointment_date(str(item['appointment_date']))
+    except ValueError:
+        raise ValueError(DATE_FORMAT_MESSAGE)
+    return {
+        'user_id': user_id,
+        'treatment_id': treatment_id,
+        'appointment_date': appointment_date,
+        'status': 'pending'
+    }
+
+@bp.route('/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy', 'service': 'appointment-service'}), 200
 
-@app.route('/', methods=['GET'])
+@bp.route('/', methods=['GET'])
 def home():
     return jsonify({
         'message': 'GlowCare Appointment Service',
         'version': '1.0.0',
         'endpoints': {
             'health': '/health',
-            'appointments': '/appointments (GET/POST)',
-            'appointment': '/appointments/<id> (GET/PUT/DELETE)',
+            'metrics': '/metrics (Prometheus)',
+            'batch': '/batch (POST, several requests in one call)',
+            'appointments': '/appointments (GET/POST, GET supports ?limit=&cursor=, ?stream=1, ?fields=id,status,... and ?include_archived=1; ETag/Last-Modified)',
+            'bulk': '/appointments/bulk (POST)',
+            'bulk_status': '/appointments/bulk/status (PUT)',
+            'appointment': '/appointments/<id> (GET/PUT/DELETE, GET supports ?include_archived=1)',
+            'availability': '/availability?date=YYYY-MM-DD&treatment_id=<id> (GET)',
             'cancel': '/appointments/<id>/cancel (POST)',
             'confirm_payment': '/appointments/<id>/confirm-payment (POST)'
         }
     }), 200
 
-@app.route('/appointments', methods=['POST'])
+@bp.route('/appointments', methods=['POST'])
 def create_appointment():
     try:
         data = request.get_json()
-        print(f"=== CREATE APPOINTMENT ===")
-        print(f"Received data: {data}")
         
         if not data:
-            print("❌ No data provided")
+            log.info('Appointment rejected', reason='no data')
             return jsonify({'message': 'No data provided'}), 400
             
         required_fields = ['user_id', 'treatment_id', 'appointment_date']
         for field in required_fields:
             if field not in data:
-                print(f"❌ Missing field: {field}")
+                log.info('Appointment rejected', reason='missing field', field=field)
                 return jsonify({'message': f'Missing required field: {field}'}), 400
         
-        appointment_date_str = data['appointment_date']
         try:
-            if 'T' in appointment_date_str:
-                appointment_date = datetime.strptime(appointment_date_str, '%Y-%m-%dT%H:%M')
-            else:
-                appointment_date = datetime.strptime(appointment_date_str, '%Y-%m-%d %H:%M')
-        except ValueError as e:
-            print(f"❌ Date parsing error: {e}")
-            return jsonify({'message': 'Invalid date format. Use YYYY-MM-DD HH:MM or YYYY-MM-DDTHH:MM'}), 400
+            appointment_date = parse_appointment_date(data['appointment_date'])
+        except ValueError:
+            log.info('Appointment rejected', reason='invalid date')
+            return jsonify({'message': DATE_FORMAT_MESSAGE}), 400
         
         appointment = Appointment(
             user_id=int(data['user_id']),
@@ -66,104 +142,342 @@ def create_appointment():
             status='pending'
         )
         
+        slot = {'appointment_date': appointment_date, 'treatment_id': appointment.treatment_id}
+        if availability.outside_opening_hours(slot):
+            log.info('Appointment rejected', reason='outside opening hours', appointment_date=appointment_date)
+            return jsonify({'message': OPENING_HOURS_MESSAGE}), 400
+        
+        availability.lock_for_booking([slot])
+        if availability.check_conflicts([slot])[0]:
+            db.session.rollback()
+            log.info('Appointment rejected', reason='slot taken', appointment_date=appointment_date)
+            return jsonify({
+                'success': False,
+                'message': 'The selected time slot is no longer available'
+            }), 409
+        
         db.session.add(appointment)
         db.session.commit()
+        availability.invalidate(appointment_date.date())
         
-        print(f"✅ Appointment created successfully: ID={appointment.id}, User={appointment.user_id}, Treatment={appointment.treatment_id}")
+        log.info('Appointment created', appointment_id=appointment.id, user_id=appointment.user_id,
+                 treatment_id=appointment.treatment_id, sample=True)
         
         return jsonify({
             'success': True,
             'message': f'Appointment created successfully! Your appointment ID is #{appointment.id}',
-            'appointment': {
-                'id': appointment.id,
-                'user_id': appointment.user_id,
-                'treatment_id': appointment.treatment_id,
-                'appointment_date': appointment.appointment_date.isoformat(),
-                'status': appointment.status,
-                'created_at': appointment.created_at.isoformat()
-            }
+            'appointment': appointment_serializer.dump(appointment)
         }), 201
         
     except Exception as e:
-        print(f"❌ Error creating appointment: {str(e)}")
+        log.exception('Error creating appointment')
         db.session.rollback()
         return jsonify({
             'success': False,
             'message': f'Failed to create appointment: {str(e)}'
         }), 500
 
-@app.route('/appointments', methods=['GET'])
+@bp.route('/appointments/bulk', methods=['POST'])
+def create_appointments_bulk():
+    try:
+        data = request.get_json()
+        
+        if isinstance(data, dict):
+            items = data.get('appointments')
+            atomic = bool(data.get('atomic', False))
+        else:
+            items = data
+            atomic = False
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({'message': 'Provide a non-empty list of appointments'}), 400
+        if len(items) > MAX_BULK_APPOINTMENTS:
+            return jsonify({'message': f'At most {MAX_BULK_APPOINTMENTS} appointments per request'}), 413
+        
+        results = [{'index': index} for index in range(len(items))]
+        rows = {}
+        for index, item in enumerate(items):
+            try:
+                rows[index] = validate_bulk_item(item)
+            except ValueError as e:
+                results[index]['error'] = str(e)
+                continue
+            if availability.outside_opening_hours(rows[index]):
+                results[index]['error'] = OPENING_HOURS_MESSAGE
+                del rows[index]
+        
+        if rows:
+            availability.lock_for_booking(list(rows.values()))
+            conflicts = availability.check_conflicts(list(rows.values()))
+            for index, error in zip(list(rows), conflicts):
+                if error:
+                    results[index]['error'] = error
+                    del rows[index]
+        
+        failed = len(items) - len(rows)
+        if failed and (atomic or not rows):
+            db.session.rollback()
+            return jsonify({
+                'success': False,
+                'message': f'{failed} of {len(items)} appointments were rejected, nothing was created',
+                'created': 0,
+                'failed': failed,
+                'results': results
+            }), 400
+        
+        # One executemany INSERT ... RETURNING in a single transaction.
+        ids = db.session.scalars(
+            insert(Appointment).returning(Appointment.id, sort_by_parameter_order=True),
+            list(rows.values())
+        ).all()
+        db.session.commit()
+        availability.invalidate(*{row['appointment_date'].date() for row in rows.values()})
+        
+        for index, appointment_id in zip(rows, ids):
+            results[index]['id'] = appointment_id
+        
+        log.info('Bulk created appointments', created=len(ids), rejected=failed)
+        
+        return jsonify({
+            'success': failed == 0,
+            'message': f'Created {len(ids)} of {len(items)} appointments',
+            'created': len(ids),
+            'failed': failed,
+            'results': results
+        }), 201
+        
+    except Exception as e:
+        log.exception('Error creating appointments in bulk')
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'Failed to create appointments: {str(e)}'
+        }), 500
+
+@bp.route('/appointments/bulk/status', methods=['PUT'])
+def update_appointment_status_bulk():
+    try:
+        data = request.get_json()
+        items = data.get('updates') if isinstance(data, dict) else data
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({'message': 'Provide a non-empty list of updates'}), 400
+        if len(items) > MAX_BULK_APPOINTMENTS:
+            return jsonify({'message': f'At most {MAX_BULK_APPOINTMENTS} updates per request'}), 413
+        
+        results = []
+        parsed = []
+        for index, item in enumerate(items):
+            result = {'id': item.get('id') if isinstance(item, dict) else None}
+            results.append(result)
+            if isinstance(item, dict) and 'event_id' in item:
+                result['event_id'] = item['event_id']
+            try:
+                appointment_id = int(item['id'])
+            except (TypeError, ValueError, KeyError):
+                result['error'] = 'Each update needs an integer id'
+                continue
+            if item.get('status') not in APPOINTMENT_STATUSES:
+                result['error'] = f"status must be one of {', '.join(APPOINTMENT_STATUSES)}"
+                continue
+            parsed.append((index, appointment_id, item['status']))
+        
+        ids = {appointment_id for _, appointment_id, _ in parsed}
+        appointments = {appointment.id: appointment
+                        for appointment in Appointment.query.filter(Appointment.id.in_(ids))} if ids else {}
+        
+        # Updates apply in request order, so several changes to one
+        # appointment end with the last one.
+        final = {}
+        for index, appointment_id, status in parsed:
+            appointment = appointments.get(appointment_id)
+            if appointment is None:
+                results[index]['error'] = 'Appointment not found'
+                continue
+            results[index]['old_status'] = final.get(appointment_id, appointment.status)
+            results[index]['new_status'] = status
+            final[appointment_id] = status
+        
+        # Appointments coming back from cancelled need their slot again.
+        revived = [appointments[appointment_id] for appointment_id, status in final.items()
+                   if appointments[appointment_id].status in FREE_STATUSES and status not in FREE_STATUSES]
+        if revived:
+            slots = [{'appointment_date': appointment.appointment_date, 'treatment_id': appointment.treatment_id}
+                     for appointment in revived]
+            availability.lock_for_booking(slots)
+            for appointment, error in zip(revived, availability.check_conflicts(slots)):
+                if error:
+                    del final[appointment.id]
+                    for index, appointment_id, _ in parsed:
+                        if appointment_id == appointment.id:
+                            results[index].pop('new_status', None)
+                            results[index]['error'] = error
+        
+        changed_days = {appointments[appointment_id].appointment_date.date() for appointment_id, status in final.items()
+                        if (appointments[appointment_id].status in FREE_STATUSES) != (status in FREE_STATUSES)}
+        if final:
+            db.session.execute(update(Appointment), [
+                {'id': appointment_id, 'status': status} for appointment_id, status in final.items()
+            ])
+        db.session.commit()
+        availability.invalidate(*changed_days)
+        
+        succeeded = sum(1 for result in results if 'error' not in result)
+        log.info('Bulk updated appointment statuses', updated=len(final), rejected=len(items) - succeeded)
+        
+        return jsonify({
+            'success': succeeded == len(items),
+            'message': f'Updated {succeeded} of {len(items)} appointment statuses',
+            'succeeded': succeeded,
+            'failed': len(items) - succeeded,
+            'results': results
+        }), 200 if succeeded else 400
+        
+    except Exception as e:
+        log.exception('Error updating appointment statuses in bulk')
+        db.session.rollback()
+        return jsonify({'message': f'Failed to update appointment statuses: {str(e)}'}), 500
+
+@bp.route('/availability', methods=['GET'])
+def get_availability():
+    try:
+        day = datetime.strptime(request.args.get('date', ''), '%Y-%m-%d').date()
+        treatment_id = int(request.args.get('treatment_id', ''))
+    except ValueError:
+        return jsonify({'message': 'date (YYYY-MM-DD) and integer treatment_id are required'}), 400
+    
+    try:
+        duration, slots = availability.free_slots(day, treatment_id)
+    except TreatmentNotFound:
+        return jsonify({'message': 'Treatment not found'}), 404
+    
+    return jsonify({
+        'date': day.isoformat(),
+        'treatment_id': treatment_id,
+        'duration': duration,
+        'slots': [slot.strftime('%Y-%m-%dT%H:%M') for slot in slots]
+    })
+
+def appointment_source():
+    # ?include_archived=1 reads history from the archive table as well.
+    if wants_archived(request.args):
+        return with_archive(Appointment, appointment_archive)
+    return Appointment
+
+@bp.route('/appointments', methods=['GET'])
 def get_appointments():
     user_id = request.args.get('user_id')
+    try:
+        fields = appointment_serializer.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     
+    source = appointment_source()
+    query = db.session.query(source)
     if user_id:
-        appointments = Appointment.query.filter_by(user_id=user_id).all()
-    else:
-        appointments = Appointment.query.all()
-    
-    result = []
-    for appointment in appointments:
-        result.append({
-            'id': appointment.id,
-            'user_id': appointment.user_id,
-            'treatment_id': appointment.treatment_id,
-            'appointment_date': appointment.appointment_date.isoformat(),
-            'status': appointment.status,
-            'created_at': appointment.created_at.isoformat()
-        })
-    
-    return jsonify(result)
-
-@app.route('/appointments/<int:appointment_id>', methods=['GET'])
+        query = query.filter_by(user_id=user_id)
+    query = query.order_by(source.appointment_date, source.id)
+    
+    stream = wants_stream(request)
+    version = CollectionVersion(query, source.updated_at, stream)
+    not_modified = version.not_modified()
+    if not_modified is not None:
+        return not_modified
+    
+    query = appointment_serializer.project(query, fields, extra=('appointment_date', 'id'), entity=source)
+    
+    if stream:
+        return version.apply(ndjson_response(query, partial(appointment_serializer.dump_row, fields=fields)))
+    
+    if not is_paginated(request.args):
+        return version.apply(jsonify(appointment_serializer.dump_many(query.all(), fields)))
+    
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        cursor = request.args.get('cursor')
+        if cursor:
+            query = keyset_after(query, source.appointment_date, source.id, cursor)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    appointments, next_cursor = fetch_page(query, limit, 'appointment_date')
+    
+    return version.apply(jsonify({
+        'appointments': appointment_serializer.dump_many(appointments, fields),
+        'next_cursor': next_cursor
+    }))
+
+@bp.route('/appointments/<int:appointment_id>', methods=['GET'])
 def get_appointment(appointment_id):
-    appointment = Appointment.query.get_or_404(appointment_id)
+    try:
+        fields = appointment_serializer.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     
-    return jsonify({
-        'id': appointment.id,
-        'user_id': appointment.user_id,
-        'treatment_id': appointment.treatment_id,
-        'appointment_date': appointment.appointment_date.isoformat(),
-        'status': appointment.status,
-        'created_at': appointment.created_at.isoformat()
-    })
+    source = appointment_source()
+    appointment = appointment_serializer.project(db.session.query(source), fields, entity=source).filter(
+        source.id == appointment_id
+    ).first_or_404()
+    
+    return jsonify(appointment_serializer.dump_row(appointment, fields))
 
-@app.route('/appointments/<int:appointment_id>', methods=['PUT'])
+@bp.route('/appointments/<int:appointment_id>', methods=['PUT'])
 def update_appointment(appointment_id):
     appointment = Appointment.query.get_or_404(appointment_id)
     data = request.get_json()
     
-    if 'appointment_date' in data:
-        appointment.appointment_date = datetime.strptime(data['appointment_date'], '%Y-%m-%d %H:%M')
+    old_day = appointment.appointment_date.date()
+    try:
+        appointment_date = (parse_appointment_date(data['appointment_date'])
+                            if 'appointment_date' in data else appointment.appointment_date)
+    except ValueError:
+        return jsonify({'message': DATE_FORMAT_MESSAGE}), 400
+    treatment_id = int(data['treatment_id']) if 'treatment_id' in data else appointment.treatment_id
+    status = data.get('status', appointment.status)
     
-    if 'status' in data:
-        appointment.status = data['status']
+    # Re-check the slot when the booking moves, changes length or is revived.
+    holds_slot = status not in FREE_STATUSES
+    moved = (appointment_date != appointment.appointment_date or treatment_id != appointment.treatment_id
+             or appointment.status in FREE_STATUSES)
+    if holds_slot and moved:
+        slot = {'appointment_date': appointment_date, 'treatment_id': treatment_id}
+        if availability.outside_opening_hours(slot):
+            return jsonify({'message': OPENING_HOURS_MESSAGE}), 400
+        availability.lock_for_booking([slot])
+        if availability.check_conflicts([slot], exclude_ids=[appointment.id])[0]:
+            db.session.rollback()
+            return jsonify({'message': 'The selected time slot is not available'}), 409
     
-    if 'treatment_id' in data:
-        appointment.treatment_id = data['treatment_id']
+    appointment.appointment_date = appointment_date
+    appointment.treatment_id = treatment_id
+    appointment.status = status
     
     db.session.commit()
+    availability.invalidate(old_day, appointment_date.date())
     
     return jsonify({'message': 'Appointment updated successfully'})
 
-@app.route('/appointments/<int:appointment_id>', methods=['DELETE'])
+@bp.route('/appointments/<int:appointment_id>', methods=['DELETE'])
 def delete_appointment(appointment_id):
     appointment = Appointment.query.get_or_404(appointment_id)
     
     db.session.delete(appointment)
     db.session.commit()
+    availability.invalidate(appointment.appointment_date.date())
     
     return jsonify({'message': 'Appointment deleted successfully'})
 
-@app.route('/appointments/<int:appointment_id>/cancel', methods=['POST'])
+@bp.route('/appointments/<int:appointment_id>/cancel', methods=['POST'])
 def cancel_appointment(appointment_id):
     appointment = Appointment.query.get_or_404(appointment_id)
     appointment.status = 'cancelled'
     
     db.session.commit()
+    availability.invalidate(appointment.appointment_date.date())
     
     return jsonify({'message': 'Appointment cancelled successfully'})
 
-@app.route('/appointments/<int:appointment_id>/confirm-payment', methods=['POST'])
+@bp.route('/appointments/<int:appointment_id>/confirm-payment', methods=['POST'])
 def confirm_payment(appointment_id):
     appointment = Appointment.query.get_or_404(appointment_id)
     appointment.status = 'paid'
@@ -172,5 +486,14 @@ def confirm_payment(appointment_id):
     
     return jsonify({'message': 'Payment confirmed for appointment'})
 
+@bp.cli.command('archive')
+@click.option('--days', type=float, default=ARCHIVE_AFTER_DAYS, show_default=True,
+              help='Archive finished appointments older than this many days')
+@click.option('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, show_default=True)
+def archive_command(days, batch_size):
+    """Move completed and cancelled appointments into the archive table."""
+    moved = archive_appointments(db.engine, datetime.utcnow() - timedelta(days=days), batch_size)
+    click.echo(f"Archived {moved} appointments")
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5002)
\ No newline at end of file
+    create_app().run(debug=True, port=5002)
\ No newline at end of file
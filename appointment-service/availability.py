@@ -0,0 +1,264 @@
+import os
+import threading
+import time
+from datetime import datetime, time as dt_time, timedelta
+
+from sqlalchemy import or_, select, text
+
+from common.log import get_logger
+from model import db, Appointment
+
+# Slot availability and overlap detection.
+#
+# Each day is kept as occupancy timelines: one counter per minute saying how
+# many bookings are running at that minute, per treatment and for the whole
+# salon. Booking a treatment for [start, end) fits when max(occupancy[start:
+# end]) for that treatment is below its capacity (the treatment's own
+# capacity from treatment-service, how many can be done at once, else
+# TREATMENT_CAPACITY), and, when SALON_CAPACITY is set, the salon-wide
+# maximum is below that too. Listing free slots is a handful of slice
+# maxima over a cached timeline, so it never touches the database while the
+# cache is fresh.
+#
+# Cached days can go stale when another worker process books, so writes
+# never trust the cache: they take SQLite's write lock (lock_for_booking),
+# rebuild the affected days from the database inside that transaction and
+# only then check for conflicts. Writers invalidate the days they touched
+# once they commit. Treatment durations for those days are fetched before
+# the lock is taken; under the lock only the duration cache is read.
+#
+# A booking has to start and end within opening hours.
+
+TREATMENT_CAPACITY = int(os.environ.get('TREATMENT_CAPACITY', '1'))
+# 0 means no salon-wide limit, only the per-treatment ones.
+SALON_CAPACITY = int(os.environ.get('SALON_CAPACITY', '0'))
+OPENING_MINUTE = int(os.environ.get('SALON_OPENING_HOUR', '9')) * 60
+CLOSING_MINUTE = int(os.environ.get('SALON_CLOSING_HOUR', '21')) * 60
+SLOT_STEP = int(os.environ.get('SLOT_STEP_MINUTES', '15'))
+DEFAULT_DURATION = int(os.environ.get('DEFAULT_TREATMENT_DURATION', '60'))
+DAY_CACHE_TTL = float(os.environ.get('AVAILABILITY_CACHE_TTL', '5'))
+DURATION_CACHE_TTL = float(os.environ.get('TREATMENT_DURATION_CACHE_TTL', '300'))
+MINUTES_PER_DAY = 24 * 60
+
+log = get_logger('availability')
+
+# Statuses that no longer hold a slot.
+FREE_STATUSES = ('cancelled',)
+OPENING_HOURS_MESSAGE = (f'Appointments must start at or after {OPENING_MINUTE // 60:02d}:{OPENING_MINUTE % 60:02d} '
+                         f'and end by {CLOSING_MINUTE // 60:02d}:{CLOSING_MINUTE % 60:02d}')
+
+
+def in_sqlite_transaction():
+    return db.session.connection().connection.dbapi_connection.in_transaction
+
+
+def holds_write_lock():
+    return db.session.get_bind().dialect.name == 'sqlite' and in_sqlite_transaction()
+
+
+class TreatmentNotFound(Exception):
+    pass
+
+
+class TreatmentDurations:
+    # treatment_id -> duration in minutes (and capacity), from
+    # treatment-service's catalog (small, and served from its ETag cache).
+    # The whole catalog is refreshed when it is older than the TTL, or at
+    # most every few seconds when an unknown id shows up. If
+    # treatment-service can't be reached the default duration is used
+    # rather than failing the booking, and no refresh is tried again for
+    # FAILURE_BACKOFF seconds. Only one thread refreshes at a time; the
+    # others use what is cached meanwhile.
+    # refresh=False reads the cache only, for callers holding the write lock.
+
+    MISS_REFRESH_INTERVAL = 5
+    FAILURE_BACKOFF = 10
+
+    def __init__(self, client):
+        self.client = client
+        self._lock = threading.Lock()
+        self._durations = {}
+        self._capacities = {}
+        self._loaded_at = None
+        self._retry_at = 0
+
+    def _refresh(self):
+        with self._lock:
+            if time.monotonic() < self._retry_at:
+                return
+            self._retry_at = time.monotonic() + self.FAILURE_BACKOFF
+        try:
+            response = self.client.get('/treatments')
+            response.raise_for_status()
+            catalog = response.json()
+            durations = {treatment['id']: treatment['duration'] for treatment in catalog}
+            capacities = {treatment['id']: treatment.get('capacity') or TREATMENT_CAPACITY for treatment in catalog}
+        except Exception as e:
+            log.warning('Could not fetch treatment durations', error=str(e), retry_in=self.FAILURE_BACKOFF)
+            return
+        with self._lock:
+            self._durations = durations
+            self._capacities = capacities
+            self._loaded_at = time.monotonic()
+            self._retry_at = 0
+
+    def get_many(self, treatment_ids, strict=False, refresh=True):
+        loaded_at = self._loaded_at
+        age = None if loaded_at is None else time.monotonic() - loaded_at
+        missing = any(treatment_id not in self._durations for treatment_id in treatment_ids)
+        stale = age is None or age > DURATION_CACHE_TTL or (missing and age > self.MISS_REFRESH_INTERVAL)
+        if refresh and stale:
+            self._refresh()
+        durations = self._durations
+        if strict and self._loaded_at is not None:
+            for treatment_id in treatment_ids:
+                if treatment_id not in durations:
+                    raise TreatmentNotFound(treatment_id)
+        return {treatment_id: durations.get(treatment_id, DEFAULT_DURATION) for treatment_id in treatment_ids}
+
+    def get(self, treatment_id, strict=False, refresh=True):
+        return self.get_many({treatment_id}, strict=strict, refresh=refresh)[treatment_id]
+
+    def capacity(self, treatment_id):
+        # Cache only; loaded together with the durations.
+        return self._capacities.get(treatment_id, TREATMENT_CAPACITY)
+
+
+def minute_of_day(moment):
+    return moment.hour * 60 + moment.minute
+
+
+def on_day(day):
+    start = datetime.combine(day, dt_time.min)
+    return (Appointment.appointment_date >= start) & (Appointment.appointment_date < start + timedelta(days=1))
+
+
+def running_counts(bookings):
+    occupancy = [0] * MINUTES_PER_DAY
+    delta = [0] * (MINUTES_PER_DAY + 1)
+    for start, end, _ in bookings:
+        delta[start] += 1
+        delta[end] -= 1
+    running = 0
+    for minute in range(MINUTES_PER_DAY):
+        running += delta[minute]
+        occupancy[minute] = running
+    return occupancy
+
+
+class DayTimeline:
+    def __init__(self, day, bookings):
+        # bookings: (start, end, treatment_id) in minutes of the day.
+        self.day = day
+        self.loaded_at = time.monotonic()
+        self.occupancy = running_counts(bookings)
+        by_treatment = {}
+        for booking in bookings:
+            by_treatment.setdefault(booking[2], []).append(booking)
+        self.treatments = {treatment_id: running_counts(items) for treatment_id, items in by_treatment.items()}
+
+    def fits(self, start, end, treatment_id, capacity):
+        if end > MINUTES_PER_DAY:
+            return False
+        if SALON_CAPACITY and max(self.occupancy[start:end], default=0) >= SALON_CAPACITY:
+            return False
+        occupancy = self.treatments.get(treatment_id)
+        return occupancy is None or max(occupancy[start:end], default=0) < capacity
+
+    def add(self, start, end, treatment_id):
+        occupancy = self.treatments.setdefault(treatment_id, [0] * MINUTES_PER_DAY)
+        for minute in range(start, min(end, MINUTES_PER_DAY)):
+            self.occupancy[minute] += 1
+            occupancy[minute] += 1
+
+    def free_slots(self, duration, treatment_id, capacity):
+        return [start for start in range(OPENING_MINUTE, CLOSING_MINUTE - duration + 1, SLOT_STEP)
+                if self.fits(start, start + duration, treatment_id, capacity)]
+
+
+class AvailabilityEngine:
+    def __init__(self, durations):
+        self.durations = durations
+        self._lock = threading.Lock()
+        self._days = {}
+
+    def _build_day(self, day, exclude_ids=(), refresh=True):
+        query = (
+            select(Appointment.appointment_date, Appointment.treatment_id)
+            .where(on_day(day), Appointment.status.notin_(FREE_STATUSES))
+        )
+        if exclude_ids:
+            query = query.where(Appointment.id.notin_(exclude_ids))
+        rows = db.session.execute(query).all()
+        durations = self.durations.get_many({treatment_id for _, treatment_id in rows}, refresh=refresh)
+        bookings = []
+        for appointment_date, treatment_id in rows:
+            begin = minute_of_day(appointment_date)
+            bookings.append((begin, min(begin + durations[treatment_id], MINUTES_PER_DAY), treatment_id))
+        return DayTimeline(day, bookings)
+
+    def timeline(self, day):
+        with self._lock:
+            timeline = self._days.get(day)
+        if timeline is None or time.monotonic() - timeline.loaded_at > DAY_CACHE_TTL:
+            timeline = self._build_day(day)
+            with self._lock:
+                self._days[day] = timeline
+        return timeline
+
+    def free_slots(self, day, treatment_id):
+        duration = self.durations.get(treatment_id, strict=True)
+        starts = self.timeline(day).free_slots(duration, treatment_id, self.durations.capacity(treatment_id))
+        return duration, [datetime.combine(day, dt_time(minute // 60, minute % 60)) for minute in starts]
+
+    def invalidate(self, *days):
+        with self._lock:
+            for day in days:
+                self._days.pop(day, None)
+
+    def outside_opening_hours(self, row):
+        # Checked before lock_for_booking; the caller answers 400.
+        duration = self.durations.get(row['treatment_id'], refresh=not holds_write_lock())
+        start = minute_of_day(row['appointment_date'])
+        return start < OPENING_MINUTE or start + duration > CLOSING_MINUTE
+
+    def lock_for_booking(self, rows):
+        # Resolve the durations of the new rows and of everything already
+        # booked on their days, so check_conflicts() needs no HTTP call, then
+        # take SQLite's write lock so no other process can book between our
+        # conflict check and our insert. Inside an atomic POST /batch the
+        # lock is already held and the cache is used as it is.
+        if holds_write_lock():
+            return
+        days = {row['appointment_date'].date() for row in rows}
+        booked = db.session.scalars(
+            select(Appointment.treatment_id).distinct()
+            .where(or_(*(on_day(day) for day in days)), Appointment.status.notin_(FREE_STATUSES))
+        ).all()
+        self.durations.get_many({row['treatment_id'] for row in rows} | set(booked))
+        if db.session.get_bind().dialect.name == 'sqlite':
+            db.session.execute(text('BEGIN IMMEDIATE'))
+
+    def check_conflicts(self, rows, exclude_ids=()):
+        # rows: dicts with appointment_date and treatment_id. Must run inside
+        # lock_for_booking(). Returns one error (or None) per row; accepted
+        # rows are added to the working timelines so later rows in the same
+        # batch see them. exclude_ids leaves out appointments being moved.
+        durations = self.durations.get_many({row['treatment_id'] for row in rows}, refresh=False)
+        timelines = {}
+        errors = []
+        for row in rows:
+            day = row['appointment_date'].date()
+            if day not in timelines:
+                timelines[day] = self._build_day(day, exclude_ids, refresh=False)
+            start = minute_of_day(row['appointment_date'])
+            end = start + durations[row['treatment_id']]
+            capacity = self.durations.capacity(row['treatment_id'])
+            if end > MINUTES_PER_DAY:
+                errors.append(OPENING_HOURS_MESSAGE)
+            elif timelines[day].fits(start, end, row['treatment_id'], capacity):
+                timelines[day].add(start, end, row['treatment_id'])
+                errors.append(None)
+            else:
+                errors.append('Time slot is not available')
+        return errors
@@ -1,5 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from common.archive import ARCHIVE_BATCH_SIZE, archive_rows, archive_table
+from common.migrations import add_column, autoincrement_ids, create_index, create_table
+from common.serialization import ModelSerializer
 
 db = SQLAlchemy()
 
@@ -10,6 +13,53 @@ class Appointment(db.Model):
     appointment_date = db.Column(db.DateTime, nullable=False)
     status = db.Column(db.String(20), nullable=False, default='pending')  # pending, confirmed, paid, cancelled, completed
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        # GET /appointments?user_id= and its keyset pages
+        db.Index('ix_appointment_user_date', 'user_id', 'appointment_date', 'id'),
+        # unfiltered admin/doctor listing in (appointment_date, id) order
+        db.Index('ix_appointment_date', 'appointment_date', 'id'),
+        # COUNT/MAX(updated_at) behind the list ETag and Last-Modified
+        db.Index('ix_appointment_user_updated', 'user_id', 'updated_at'),
+        db.Index('ix_appointment_updated', 'updated_at'),
+        # ids never go back to an archived or deleted row's id
+        {'sqlite_autoincrement': True},
+    )
     
     def __repr__(self):
-        return f'<Appointment {self.id}>'
\ No newline at end of file
+        return f'<Appointment {self.id}>'
+
+appointment_serializer = ModelSerializer(Appointment)
+
+# Finished appointments move here once their date and last change are
+# older than the archival cutoff; see common/archive.py.
+ARCHIVED_STATUSES = ('completed', 'cancelled')
+appointment_archive = archive_table(
+    Appointment.__table__,
+    db.Index('ix_appointment_archive_user_date', 'user_id', 'appointment_date', 'id'),
+    db.Index('ix_appointment_archive_date', 'appointment_date', 'id'),
+)
+
+def archive_appointments(engine, cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    table = Appointment.__table__
+    return archive_rows(engine, table, appointment_archive, (
+        table.c.status.in_(ARCHIVED_STATUSES) &
+        (table.c.appointment_date < cutoff) &
+        (table.c.updated_at < cutoff)
+    ), batch_size)
+
+MIGRATIONS = [
+    (1, 'Index appointments by user and date', [
+        create_index('appointment', 'ix_appointment_user_date', 'user_id', 'appointment_date', 'id'),
+        create_index('appointment', 'ix_appointment_date', 'appointment_date', 'id'),
+    ]),
+    (2, 'Add appointment.updated_at for conditional GET', [
+        add_column('appointment', 'updated_at', 'DATETIME'),
+        'UPDATE appointment SET updated_at = created_at WHERE updated_at IS NULL',
+        create_index('appointment', 'ix_appointment_user_updated', 'user_id', 'updated_at'),
+        create_index('appointment', 'ix_appointment_updated', 'updated_at'),
+    ]),
+    (3, 'Add appointment archive', [create_table(appointment_archive)]),
+    (4, 'Never reuse appointment ids', [autoincrement_ids('appointment', 'appointment_archive')]),
+]
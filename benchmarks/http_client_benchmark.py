@@ -0,0 +1,143 @@
+"""Connection reuse and latency of common.http_client.ServiceClient against
+bare requests.get, measured on a local keep-alive stub server.
+
+The stub counts accepted TCP connections and can simulate a slow or
+flaky upstream, so the run also checks the timeout and retry behaviour.
+
+    python benchmarks/http_client_benchmark.py --requests 2000 --threads 8
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common.http_client import ServiceClient
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.connections = 0
+        self.flaky_failures = 0
+        self.lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/slow':
+            time.sleep(2)
+            return self._send(200, {'slow': True})
+        if self.path == '/flaky':
+            with self.server.lock:
+                self.server.flaky_failures += 1
+                fail = self.server.flaky_failures <= 2
+            if fail:
+                return self._send(503, {'message': 'unavailable'})
+        self._send(200, [{'id': 1, 'status': 'pending'}])
+
+
+def run(label, call, total, threads):
+    latencies = []
+    lock = threading.Lock()
+
+    def one(_):
+        started = time.perf_counter()
+        response = call()
+        response.raise_for_status()
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(one, range(total)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'label': label,
+        'requests_per_second': round(total / wall),
+        'p50_ms': round(statistics.median(latencies), 3),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    server = StubServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    results = []
+    server.connections = 0
+    result = run('requests.get', lambda: requests.get(f'{server.url}/appointments'),
+                 args.requests, args.threads)
+    result['connections'] = server.connections
+    results.append(result)
+
+    client = ServiceClient('stub', server.url, pool_size=args.threads)
+    server.connections = 0
+    result = run('ServiceClient.get', lambda: client.get('/appointments'), args.requests, args.threads)
+    result['connections'] = server.connections
+    results.append(result)
+
+    print(f'{"client":<20}{"req/s":>8}{"p50 ms":>10}{"p99 ms":>10}{"connections":>13}')
+    for result in results:
+        print(f'{result["label"]:<20}{result["requests_per_second"]:>8}{result["p50_ms"]:>10}'
+              f'{result["p99_ms"]:>10}{result["connections"]:>13}')
+
+    assert results[1]['connections'] <= args.threads, 'pooled client opened more sockets than its pool'
+
+    timeout_client = ServiceClient('stub', server.url, read_timeout=0.2, retries=0)
+    started = time.perf_counter()
+    try:
+        timeout_client.get('/slow')
+        raise AssertionError('slow upstream did not time out')
+    except requests.exceptions.Timeout:
+        print(f'\nslow upstream timed out after {time.perf_counter() - started:.2f}s')
+
+    response = client.get('/flaky')
+    print(f'flaky upstream answered {response.status_code} after {server.flaky_failures - 1} retries')
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""Query timings on the hot appointment/payment lookups before and after the
+index migrations.
+
+Builds throwaway SQLite files shaped like pre-migration databases (tables
+without the new indexes), fills them with ROWS appointments and payments,
+times the queries the services run, then applies the services' migrations
+and times them again.
+
+    python benchmarks/index_benchmark.py --rows 1000000
+"""
+import argparse
+import importlib.util
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common.migrations import run_migrations
+
+
+def load_model(service):
+    path = os.path.join(ROOT, service, 'model.py')
+    spec = importlib.util.spec_from_file_location(f'{service.replace("-", "_")}_model', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+QUERIES = {
+    'appointments by user': (
+        'appointment',
+        'SELECT * FROM appointment WHERE user_id = ? ORDER BY appointment_date, id',
+        lambda rows: (random.randint(1, rows // 20),)
+    ),
+    'payments by user, newest first': (
+        'payment',
+        'SELECT * FROM payment WHERE user_id = ? ORDER BY created_at DESC, id DESC',
+        lambda rows: (random.randint(1, rows // 20),)
+    ),
+    'payment duplicate check': (
+        'payment',
+        'SELECT id FROM payment WHERE appointment_id = ? LIMIT 1',
+        lambda rows: (random.randint(1, rows),)
+    ),
+    'latest pending payments': (
+        'payment',
+        "SELECT * FROM payment WHERE status = 'pending' ORDER BY created_at DESC, id DESC LIMIT 50",
+        lambda rows: ()
+    ),
+}
+
+
+def seed(paths, rows):
+    start = datetime(2025, 1, 1)
+    conn = sqlite3.connect(paths['appointment'])
+    conn.executemany(
+        'INSERT INTO appointment (user_id, treatment_id, appointment_date, status, created_at) '
+        'VALUES (?, ?, ?, ?, ?)',
+        ((random.randint(1, rows // 20), random.randint(1, 5),
+          (start + timedelta(minutes=15 * i)).isoformat(' '), 'pending', start.isoformat(' '))
+         for i in range(rows))
+    )
+    conn.commit()
+    conn.close()
+
+    conn = sqlite3.connect(paths['payment'])
+    conn.executemany(
+        'INSERT INTO payment (user_id, appointment_id, amount, payment_method, payment_reference, '
+        'status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        ((random.randint(1, rows // 20), i + 1, 150000, random.choice(['transfer', 'cash', 'credit_card']),
+          f'PAY-{i}', random.choice(['pending', 'completed', 'completed', 'failed']),
+          (start + timedelta(minutes=15 * i)).isoformat(' '))
+         for i in range(rows))
+    )
+    conn.commit()
+    conn.close()
+
+
+def time_queries(paths, rows, repeat):
+    timings = {}
+    for name, (service, sql, params) in QUERIES.items():
+        conn = sqlite3.connect(paths[service])
+        random.seed(42)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, params(rows)).fetchall()
+        timings[name] = (time.perf_counter() - started) / repeat * 1000
+        conn.close()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    appointment_model = load_model('appointment-service')
+    payment_model = load_model('payment-service')
+
+    models = {
+        'appointment': (appointment_model, appointment_model.Appointment),
+        'payment': (payment_model, payment_model.Payment),
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {service: os.path.join(tmp, f'{service}.db') for service in models}
+        engines = {service: create_engine(f'sqlite:///{path}') for service, path in paths.items()}
+
+        # Recreate the shipped schema: tables only, no secondary indexes.
+        for service, (_, model) in models.items():
+            table = model.__table__
+            indexes = set(table.indexes)
+            table.indexes.clear()
+            table.create(engines[service])
+            table.indexes.update(indexes)
+
+        print(f'Seeding {args.rows:,} appointments and payments...')
+        seed(paths, args.rows)
+
+        before = time_queries(paths, args.rows, args.repeat)
+
+        started = time.perf_counter()
+        for service, (module, _) in models.items():
+            run_migrations(engines[service], module.db.metadata, module.MIGRATIONS)
+        migrate_seconds = time.perf_counter() - started
+
+        after = time_queries(paths, args.rows, args.repeat)
+        for engine in engines.values():
+            engine.dispose()
+
+    print(f'Migrations applied in {migrate_seconds:.1f}s\n')
+    print(f'{"query":<32}{"before ms":>12}{"after ms":>12}{"speedup":>10}')
+    for name in QUERIES:
+        speedup = before[name] / after[name] if after[name] else float('inf')
+        print(f'{name:<32}{before[name]:>12.2f}{after[name]:>12.3f}{speedup:>9.0f}x')
+
+
+if __name__ == '__main__':
+    main()
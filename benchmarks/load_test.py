@@ -0,0 +1,503 @@
+"""End-to-end load test of all four services: throughput and p50/p95/p99
+latency per endpoint under a mixed patient workload, reported as JSON.
+
+Each service is started in its own process on a temporary SQLite file and
+wired to the others through the same *_SERVICE_URL variables
+docker-compose uses. The databases are seeded with a treatment catalog,
+--users patients and their appointment and payment history. Then
+--concurrency virtual users, each logged in as its own seeded patient,
+pick operations by weight from --mix until --duration runs out. Requests
+made during the first --warmup seconds are not counted.
+
+    python benchmarks/load_test.py --concurrency 32 --duration 30 --output run.json
+    python benchmarks/load_test.py --server gunicorn --workers 4 --baseline run.json
+
+With --baseline the run is compared with an earlier report and the script
+exits with status 1 when an endpoint's p95 or the overall throughput got
+worse by more than --tolerance.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# name -> (directory, URL variable the other services read)
+SERVICES = {
+    'treatment': ('treatment-service', 'TREATMENT_SERVICE_URL'),
+    'appointment': ('appointment-service', 'APPOINTMENT_SERVICE_URL'),
+    'payment': ('payment-service', 'PAYMENT_SERVICE_URL'),
+    'user': ('user-service', 'USER_SERVICE_URL'),
+}
+TREATMENTS = [
+    ('Facial Glow', 250000, 60), ('Acne Treatment', 300000, 60), ('Chemical Peel', 450000, 45),
+    ('Microdermabrasion', 400000, 45), ('Laser Rejuvenation', 900000, 90), ('Hydrafacial', 550000, 60),
+    ('Brightening Infusion', 350000, 30), ('Botox Consultation', 150000, 30), ('Hair Spa', 200000, 60),
+    ('Body Scrub', 275000, 90), ('Eyebrow Threading', 75000, 30), ('Scar Reduction', 650000, 60),
+]
+PAYMENT_METHODS = ['cash', 'transfer', 'credit_card', 'e-wallet']
+PASSWORD = 'loadtest-password'
+DEFAULT_MIX = 'register=2,login=8,treatments=10,book=15,list=30,pay=12,confirm=8,dashboard=15'
+BULK_CHUNK = 5000
+
+
+class SlotAllocator:
+    # Hands out non-overlapping appointment times so bookings never hit a
+    # slot conflict. Slots are as long as the longest treatment.
+
+    def __init__(self, start, slot_minutes, opening_hour=9, closing_hour=21):
+        self.start = start
+        self.slot = timedelta(minutes=slot_minutes)
+        self.opening = timedelta(hours=opening_hour)
+        self.per_day = (closing_hour - opening_hour) * 60 // slot_minutes
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def next(self):
+        with self._lock:
+            index = self._next
+            self._next += 1
+        day, slot = divmod(index, self.per_day)
+        when = self.start + timedelta(days=day) + self.opening + slot * self.slot
+        return when.strftime('%Y-%m-%d %H:%M')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve(service_dir, port):
+    # Child process entry point for --server werkzeug.
+    path = os.path.join(ROOT, service_dir)
+    os.chdir(path)
+    sys.path.insert(0, path)
+    from werkzeug.serving import make_server
+    from common.serving import warm_up
+    from app import create_app
+
+    app = create_app()
+    warm_up(app)
+    make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+
+
+def start_services(workdir, server, workers, processes):
+    ports = {name: free_port() for name in SERVICES}
+    urls = {name: f'http://127.0.0.1:{port}' for name, port in ports.items()}
+    env = dict(os.environ, LOG_LEVEL=os.environ.get('LOG_LEVEL', 'WARNING'), PYTHONUNBUFFERED='1')
+    for name, (_, variable) in SERVICES.items():
+        env[variable] = urls[name]
+
+    for name, (service_dir, _) in SERVICES.items():
+        service_env = dict(env, DATABASE_URL=f'sqlite:///{os.path.join(workdir, name)}.db', PORT=str(ports[name]))
+        if server == 'gunicorn':
+            service_env['GUNICORN_WORKERS'] = str(workers)
+            service_env['PROMETHEUS_MULTIPROC_DIR'] = os.path.join(workdir, f'{name}-metrics')
+            command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'common', 'gunicorn_conf.py'),
+                       'wsgi:app']
+        else:
+            command = [sys.executable, os.path.abspath(__file__), '--serve', service_dir, '--port', str(ports[name])]
+        log_file = open(os.path.join(workdir, f'{name}.log'), 'w')
+        processes[name] = (subprocess.Popen(command, cwd=os.path.join(ROOT, service_dir), env=service_env,
+                                            stdout=log_file, stderr=subprocess.STDOUT), log_file)
+
+    for name, url in urls.items():
+        wait_ready(name, url, processes[name][0], workdir)
+    return urls
+
+
+def wait_ready(name, url, process, workdir, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            if requests.get(f'{url}/health', timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    with open(os.path.join(workdir, f'{name}.log')) as log_file:
+        tail = ''.join(log_file.readlines()[-20:])
+    raise RuntimeError(f'{name} did not become healthy at {url}\n{tail}')
+
+
+def stop_services(processes):
+    for process, _ in processes.values():
+        process.terminate()
+    for process, log_file in processes.values():
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        log_file.close()
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def seed(urls, workdir, slots, args):
+    started = time.perf_counter()
+    http = requests.Session()
+    rng = random.Random(args.seed)
+
+    treatments = {}
+    for name, price, duration in TREATMENTS:
+        response = http.post(f"{urls['treatment']}/treatments",
+                             json={'name': name, 'price': price, 'duration': duration})
+        response.raise_for_status()
+        treatments[response.json()['treatment_id']] = price
+
+    # One real registration yields a hash in the service's configured
+    # format; every seeded patient reuses it instead of paying for
+    # --users password hashes.
+    http.post(f"{urls['user']}/register",
+              json={'name': 'Load Test', 'email': 'loadtest-template@glowcare.test', 'password': PASSWORD}
+              ).raise_for_status()
+    with sqlite3.connect(os.path.join(workdir, 'user.db'), timeout=30) as conn:
+        password_hash = conn.execute(
+            'SELECT password_hash FROM "user" WHERE email = ?', ('loadtest-template@glowcare.test',)
+        ).fetchone()[0]
+        now = datetime.utcnow().isoformat(sep=' ')
+        conn.executemany(
+            'INSERT INTO "user" (name, email, password_hash, role, created_at) VALUES (?, ?, ?, ?, ?)',
+            [(f'Patient {i}', f'loadtest-{i}@glowcare.test', password_hash, 'pasien', now)
+             for i in range(args.users)]
+        )
+        user_ids = [row[0] for row in conn.execute(
+            "SELECT id FROM \"user\" WHERE email LIKE 'loadtest-%' AND email != 'loadtest-template@glowcare.test' "
+            'ORDER BY id'
+        )]
+
+    requested = [{'user_id': user_id, 'treatment_id': rng.choice(list(treatments)),
+                  'appointment_date': slots.next()}
+                 for user_id in user_ids for _ in range(args.appointments_per_user)]
+    appointments = []
+    for batch in chunks(requested, BULK_CHUNK):
+        response = http.post(f"{urls['appointment']}/appointments/bulk", json={'appointments': batch})
+        response.raise_for_status()
+        appointments.extend(dict(item, id=result['id'])
+                            for item, result in zip(batch, response.json()['results']) if 'id' in result)
+
+    paid = rng.sample(appointments, int(len(appointments) * args.paid_ratio))
+    payments = []
+    for batch in chunks(paid, BULK_CHUNK):
+        response = http.post(f"{urls['payment']}/payments/bulk", json={'payments': [
+            {'user_id': item['user_id'], 'appointment_id': item['id'], 'amount': treatments[item['treatment_id']],
+             'payment_method': rng.choice(PAYMENT_METHODS)} for item in batch
+        ]})
+        response.raise_for_status()
+        payments.extend(dict(item, payment_id=result['id'])
+                        for item, result in zip(batch, response.json()['results']) if 'id' in result)
+
+    confirmed = rng.sample(payments, int(len(payments) * args.confirmed_ratio))
+    for batch in chunks([payment['payment_id'] for payment in confirmed], BULK_CHUNK):
+        http.post(f"{urls['payment']}/payments/bulk/confirm", json={'ids': batch}).raise_for_status()
+
+    # What each patient still has left to pay or confirm.
+    accounts = {user_id: {'email': f'loadtest-{i}@glowcare.test', 'unpaid': [], 'pending': []}
+                for i, user_id in enumerate(user_ids)}
+    paid_ids = {item['id'] for item in paid}
+    confirmed_ids = {payment['payment_id'] for payment in confirmed}
+    for item in appointments:
+        if item['id'] not in paid_ids:
+            accounts[item['user_id']]['unpaid'].append(item['id'])
+    for payment in payments:
+        if payment['payment_id'] not in confirmed_ids:
+            accounts[payment['user_id']]['pending'].append(payment['payment_id'])
+
+    summary = {
+        'treatments': len(treatments),
+        'users': len(user_ids),
+        'appointments': len(appointments),
+        'payments': len(payments),
+        'confirmed_payments': len(confirmed),
+        'seconds': round(time.perf_counter() - started, 2),
+    }
+    return treatments, list(accounts.values()), summary
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in VirtualUser.OPERATIONS:
+            raise argparse.ArgumentTypeError(
+                f'unknown operation {name.strip()!r}, expected one of {", ".join(VirtualUser.OPERATIONS)}'
+            )
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class VirtualUser:
+    OPERATIONS = ('register', 'login', 'treatments', 'book', 'list', 'pay', 'confirm', 'dashboard')
+
+    def __init__(self, urls, account, catalog, slots, recording, rng):
+        self.urls = urls
+        self.account = account
+        self.catalog = catalog
+        self.slots = slots
+        self.recording = recording
+        self.rng = rng
+        self.http = requests.Session()
+        self.token = None
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    def call(self, endpoint, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.http.request(method, url, timeout=30, **kwargs)
+            status = str(response.status_code)
+        except requests.RequestException:
+            response, status = None, 'exception'
+        if self.recording.is_set():
+            self.latencies[endpoint].append((time.perf_counter() - started) * 1000)
+            self.statuses[endpoint][status] += 1
+        return response
+
+    def auth(self):
+        return {'Authorization': f'Bearer {self.token}'}
+
+    def login(self):
+        response = self.call('POST /login', 'POST', f"{self.urls['user']}/login",
+                             json={'email': self.account['email'], 'password': PASSWORD})
+        if response is not None and response.status_code == 200:
+            self.token = response.json()['access_token']
+        return response
+
+    def register(self):
+        email = f'new-{uuid.uuid4().hex}@glowcare.test'
+        self.call('POST /register', 'POST', f"{self.urls['user']}/register",
+                  json={'name': 'New Patient', 'email': email, 'password': PASSWORD})
+
+    def treatments(self):
+        self.call('GET /treatments', 'GET', f"{self.urls['treatment']}/treatments")
+
+    def book(self):
+        response = self.call('POST /book-appointment', 'POST', f"{self.urls['user']}/book-appointment",
+                             headers=self.auth(),
+                             json={'treatment_id': self.rng.choice(list(self.catalog)),
+                                   'appointment_date': self.slots.next()})
+        if response is not None and response.status_code == 201:
+            appointment = response.json()['appointment']
+            self.account['unpaid'].append(appointment['id'])
+
+    def list(self):
+        self.call('GET /appointments', 'GET', f"{self.urls['user']}/appointments", headers=self.auth())
+
+    def dashboard(self):
+        self.call('GET /dashboard', 'GET', f"{self.urls['user']}/dashboard", headers=self.auth())
+
+    def pay(self):
+        if not self.account['unpaid']:
+            return self.book()
+        appointment_id = self.account['unpaid'].pop()
+        response = self.call('POST /make-payment', 'POST', f"{self.urls['user']}/make-payment",
+                             headers=dict(self.auth(), **{'Idempotency-Key': uuid.uuid4().hex}),
+                             json={'appointment_id': appointment_id,
+                                   'amount': self.rng.choice(list(self.catalog.values())),
+                                   'payment_method': self.rng.choice(PAYMENT_METHODS)})
+        if response is not None and response.status_code == 201:
+            self.account['pending'].append(response.json()['payment']['id'])
+
+    def confirm(self):
+        if not self.account['pending']:
+            return self.pay()
+        payment_id = self.account['pending'].pop()
+        self.call('POST /payments/<id>/confirm', 'POST', f"{self.urls['payment']}/payments/{payment_id}/confirm")
+
+    def run(self, mix, stop):
+        # Password hashing is rate limited, so the first login may be
+        # turned away with 503 while every virtual user starts at once.
+        while self.token is None and not stop.is_set():
+            response = self.login()
+            if self.token is None:
+                retry_after = response.headers.get('Retry-After') if response is not None else None
+                stop.wait(float(retry_after or 0.5))
+
+        operations = list(mix)
+        weights = [mix[operation] for operation in operations]
+        while not stop.is_set():
+            operation = self.rng.choices(operations, weights)[0]
+            getattr(self, operation)()
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    index = max(0, math.ceil(q / 100 * len(values)) - 1)
+    return round(values[min(index, len(values) - 1)], 3)
+
+
+def summarize(latencies, statuses, seconds):
+    latencies = sorted(latencies)
+    total = sum(statuses.values())
+    errors = sum(count for status, count in statuses.items() if status == 'exception' or int(status) >= 400)
+    return {
+        'requests': total,
+        'errors': errors,
+        'error_rate': round(errors / total, 4) if total else 0,
+        'throughput_rps': round(total / seconds, 2),
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': round(latencies[-1], 3) if latencies else None,
+        'status_codes': dict(sorted(statuses.items())),
+    }
+
+
+def drive(urls, accounts, treatments, slots, args):
+    recording = threading.Event()
+    stop = threading.Event()
+    users = [VirtualUser(urls, accounts[i], treatments, slots, recording, random.Random(args.seed + i))
+             for i in range(args.concurrency)]
+    threads = [threading.Thread(target=user.run, args=(args.mix, stop), daemon=True) for user in users]
+    for thread in threads:
+        thread.start()
+
+    time.sleep(args.warmup)
+    recording.set()
+    started = time.perf_counter()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    # Requests still in flight when the clock stopped are counted, so
+    # measure the window up to the last join.
+    elapsed = time.perf_counter() - started
+
+    latencies = defaultdict(list)
+    statuses = defaultdict(Counter)
+    for user in users:
+        for endpoint, values in user.latencies.items():
+            latencies[endpoint].extend(values)
+            statuses[endpoint].update(user.statuses[endpoint])
+
+    endpoints = {endpoint: summarize(latencies[endpoint], statuses[endpoint], elapsed)
+                 for endpoint in sorted(latencies)}
+    overall = summarize([value for values in latencies.values() for value in values],
+                        sum(statuses.values(), Counter()), elapsed)
+    return round(elapsed, 2), overall, endpoints
+
+
+def compare(report, baseline, tolerance):
+    regressions = []
+    before, after = baseline['overall']['throughput_rps'], report['overall']['throughput_rps']
+    if after < before * (1 - tolerance):
+        regressions.append(f'overall throughput {before} -> {after} req/s')
+    for endpoint, result in report['endpoints'].items():
+        previous = baseline['endpoints'].get(endpoint)
+        if not previous or not previous['p95_ms'] or result['p95_ms'] is None:
+            continue
+        if result['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f'{endpoint} p95 {previous["p95_ms"]} -> {result["p95_ms"]} ms')
+    return regressions
+
+
+def print_table(report, out):
+    print(f'{"endpoint":<30}{"requests":>10}{"errors":>8}{"req/s":>9}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}',
+          file=out)
+    rows = list(report['endpoints'].items()) + [('overall', report['overall'])]
+    for endpoint, result in rows:
+        print(f'{endpoint:<30}{result["requests"]:>10}{result["errors"]:>8}{result["throughput_rps"]:>9}'
+              f'{result["p50_ms"]:>10}{result["p95_ms"]:>10}{result["p99_ms"]:>10}', file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--serve', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--server', choices=['werkzeug', 'gunicorn'], default='werkzeug')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers per service')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--appointments-per-user', type=int, default=5)
+    parser.add_argument('--paid-ratio', type=float, default=0.6)
+    parser.add_argument('--confirmed-ratio', type=float, default=0.7)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--baseline', help='earlier JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--keep', action='store_true', help='keep the databases and service logs')
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args.serve, args.port)
+    if isinstance(args.mix, str):
+        args.mix = parse_mix(args.mix)
+    if args.users < args.concurrency:
+        parser.error('--users must be at least --concurrency, every virtual user needs its own patient')
+
+    workdir = tempfile.mkdtemp(prefix='glowcare-load-')
+    slots = SlotAllocator(datetime(2030, 1, 1), max(duration for _, _, duration in TREATMENTS))
+    processes = {}
+    try:
+        urls = start_services(workdir, args.server, args.workers, processes)
+        treatments, accounts, seeded = seed(urls, workdir, slots, args)
+        print(f'seeded {json.dumps(seeded)}', file=sys.stderr)
+        elapsed, overall, endpoints = drive(urls, accounts, treatments, slots, args)
+    finally:
+        stop_services(processes)
+        if args.keep:
+            print(f'databases and logs kept in {workdir}', file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'started_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'config': {
+            'server': args.server,
+            'workers': args.workers if args.server == 'gunicorn' else 1,
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'warmup': args.warmup,
+            'mix': args.mix,
+        },
+        'seeded': seeded,
+        'elapsed_seconds': elapsed,
+        'overall': overall,
+        'endpoints': endpoints,
+    }
+
+    print_table(report, sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump(report, out, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
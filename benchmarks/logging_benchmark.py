@@ -0,0 +1,92 @@
+"""Time spent in the request thread per log line: synchronous print versus
+the queued structured logger in common/log.py.
+
+stdout is replaced by a sink that takes SINK_DELAY_MS per write, standing in
+for a slow pipe or a log collector applying backpressure. THREADS request
+threads each log LINES lines; the figure that matters is how long the
+callers are held up, not how fast the sink drains.
+
+    python benchmarks/logging_benchmark.py --threads 8 --lines 500 --sink-delay-ms 0.2
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class SlowSink:
+    def __init__(self, delay):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.lines = 0
+
+    def write(self, text):
+        # A pipe accepts one writer at a time.
+        with self.lock:
+            time.sleep(self.delay)
+            self.lines += text.count('\n')
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def run_threads(threads, lines, log_line):
+    def worker(index):
+        for line in range(lines):
+            log_line(index, line)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--lines', type=int, default=500)
+    parser.add_argument('--sink-delay-ms', type=float, default=0.2)
+    args = parser.parse_args()
+    total = args.threads * args.lines
+    payload = {'user_id': 42, 'appointment_id': 1234, 'amount': 150000, 'payment_method': 'transfer'}
+
+    real_stdout = sys.stdout
+    results = {}
+
+    sys.stdout = SlowSink(args.sink_delay_ms / 1000)
+    elapsed = run_threads(args.threads, args.lines,
+                          lambda index, line: print(f"Received payment data: {payload}"))
+    sys.stdout = real_stdout
+    results['print'] = {'caller_us_per_line': round(elapsed / total * 1e6, 1)}
+
+    sink = SlowSink(args.sink_delay_ms / 1000)
+    sys.stdout = sink
+    from common.log import configure_logging, get_logger, logging_stats
+    configure_logging('benchmark')
+    log = get_logger('benchmark')
+    elapsed = run_threads(args.threads, args.lines,
+                          lambda index, line: log.info('Payment created', payment_id=line, user_id=index))
+    stats = logging_stats()
+    while logging_stats()['queued']:
+        time.sleep(0.01)
+    sys.stdout = real_stdout
+    results['queued_logger'] = {
+        'caller_us_per_line': round(elapsed / total * 1e6, 1),
+        'dropped': stats['dropped'],
+        'written': sink.lines,
+    }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Revenue report timings: aggregating the payment table on every request
+versus reading the payment_daily_stat rollup.
+
+Fills a throwaway payment-service database with ROWS payments spread over
+DAYS days, builds the rollup with the same rebuild the migration runs, then
+times GET /payments/stats against the equivalent GROUP BY over payments.
+
+    python benchmarks/payment_stats_benchmark.py --rows 1000000 --days 365
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'payment-service'))
+
+from app import create_app, db
+from model import rebuild_daily_stats
+
+FULL_SCAN = {
+    'day': "SELECT date(created_at), COUNT(*), SUM(amount) FROM payment GROUP BY date(created_at)",
+    'day,payment_method,status': (
+        "SELECT date(created_at), payment_method, status, COUNT(*), SUM(amount) FROM payment "
+        "GROUP BY date(created_at), payment_method, status"
+    ),
+}
+
+
+def seed(path, rows, days):
+    start = datetime(2025, 1, 1)
+    step = days * 24 * 3600 / rows
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        'INSERT INTO payment (user_id, appointment_id, amount, payment_method, payment_reference, '
+        'status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        ((random.randint(1, 10000), i + 1, random.choice([150000, 250000, 400000]),
+          random.choice(['transfer', 'cash', 'credit_card']), f'PAY-{i}',
+          random.choice(['pending', 'completed', 'completed', 'failed']),
+          (start + timedelta(seconds=step * i)).isoformat(' '))
+         for i in range(rows))
+    )
+    conn.commit()
+    conn.close()
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(min(timings), 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'payments.db')
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+        seed(path, args.rows, args.days)
+        with app.app_context():
+            started = time.perf_counter()
+            with db.engine.begin() as conn:
+                stat_rows = rebuild_daily_stats(conn)
+            rebuild_ms = round((time.perf_counter() - started) * 1000)
+            db.engine.dispose()
+
+        client = app.test_client()
+        raw = sqlite3.connect(path)
+        results = {'payments': args.rows, 'rollup_rows': stat_rows, 'rebuild_ms': rebuild_ms, 'reports': {}}
+        for group_by, sql in FULL_SCAN.items():
+            results['reports'][group_by] = {
+                'full_scan_ms': best_of(lambda: raw.execute(sql).fetchall(), args.repeat),
+                'rollup_endpoint_ms': best_of(
+                    lambda: client.get(f'/payments/stats?group_by={group_by}').get_json(), args.repeat
+                ),
+            }
+        raw.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
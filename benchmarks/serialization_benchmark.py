@@ -0,0 +1,113 @@
+"""Payment list serialization: ORM objects with per-field isoformat() and
+the stdlib encoder versus column projection with the pluggable JSON provider.
+
+Fills a throwaway payment-service database with ROWS payments, then times
+each way of turning them into a JSON response body, inside a request context
+so the providers build real Flask responses.
+
+    python benchmarks/serialization_benchmark.py --rows 100000
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'payment-service'))
+
+from flask.json.provider import DefaultJSONProvider
+
+from app import create_app, db
+from common.serialization import PROVIDERS, orjson
+from model import Payment, payment_serializer
+
+
+def seed(path, rows):
+    start = datetime(2025, 1, 1)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        'INSERT INTO payment (user_id, appointment_id, amount, payment_method, payment_reference, '
+        'status, created_at, paid_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        ((random.randint(1, 10000), i + 1, random.choice([150000, 250000, 400000]),
+          random.choice(['transfer', 'cash', 'credit_card']), f'PAY-{i}',
+          random.choice(['pending', 'completed']),
+          (start + timedelta(seconds=30 * i)).isoformat(' '),
+          (start + timedelta(seconds=30 * i + 600)).isoformat(' ') if i % 2 else None)
+         for i in range(rows))
+    )
+    conn.commit()
+    conn.close()
+
+
+def legacy_dict(payment):
+    # The dict every payment endpoint used to build by hand.
+    return {
+        'id': payment.id,
+        'user_id': payment.user_id,
+        'appointment_id': payment.appointment_id,
+        'amount': payment.amount,
+        'payment_method': payment.payment_method,
+        'payment_reference': payment.payment_reference,
+        'status': payment.status,
+        'created_at': payment.created_at.isoformat(),
+        'paid_at': payment.paid_at.isoformat() if payment.paid_at else None
+    }
+
+
+def best_of(fn, repeat):
+    # size is the body length in bytes, or the row count for fetch-only cases.
+    timings = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        started = time.perf_counter()
+        size = len(fn())
+        timings.append((time.perf_counter() - started) * 1000)
+    return {'ms': round(min(timings), 1), 'size': size}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'payments.db')
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+        seed(path, args.rows)
+        fields = payment_serializer.fields
+        subset = payment_serializer.parse_fields('id,amount,status,created_at')
+
+        providers = {'json': PROVIDERS['json'](app)}
+        if orjson is not None:
+            providers['orjson'] = PROVIDERS['orjson'](app)
+        legacy = DefaultJSONProvider(app)
+
+        results = {'rows': args.rows, 'cases': {}}
+        with app.test_request_context('/payments'):
+            query = Payment.query.order_by(Payment.created_at.desc(), Payment.id.desc())
+            cases = {
+                'orm_isoformat_stdlib': lambda: legacy.response([legacy_dict(p) for p in query.all()]).get_data(),
+                'orm_only': lambda: query.all(),
+                'projection_only': lambda: payment_serializer.project(query, fields).all(),
+            }
+            for name, provider in providers.items():
+                cases[f'projection_{name}'] = lambda provider=provider: provider.response(
+                    payment_serializer.dump_many(payment_serializer.project(query, fields).all(), fields)
+                ).get_data()
+                cases[f'projection_{name}_4_fields'] = lambda provider=provider: provider.response(
+                    payment_serializer.dump_many(payment_serializer.project(query, subset).all(), subset)
+                ).get_data()
+            for name, fn in cases.items():
+                results['cases'][name] = best_of(fn, args.repeat)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Read/write throughput on a shared SQLite file with SQLAlchemy's default
+engine settings versus the tuned setup in common/database.py.
+
+Writer threads insert payments and update their status in short
+transactions, the same shape as create_payment/confirm_payment. Reader
+threads run the indexed per-user listing. Each configuration runs for
+DURATION seconds on a fresh file.
+
+    python benchmarks/sqlite_concurrency_benchmark.py --writers 8 --readers 8 --duration 10
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common.database import apply_pragmas, engine_options
+
+SCHEMA = [
+    'CREATE TABLE payment (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, appointment_id INTEGER NOT NULL, '
+    'amount INTEGER NOT NULL, status VARCHAR(20) NOT NULL, created_at DATETIME, paid_at DATETIME)',
+    'CREATE INDEX ix_payment_user_created ON payment (user_id, created_at, id)',
+]
+USERS = 500
+
+
+def build_engine(path, tuned):
+    uri = f'sqlite:///{path}'
+    if not tuned:
+        return create_engine(uri)
+    return apply_pragmas(create_engine(uri, **engine_options(uri)))
+
+
+def run(path, tuned, writers, readers, duration):
+    engine = build_engine(path, tuned)
+    with engine.begin() as conn:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+
+    counts = {'writes': 0, 'reads': 0, 'locked_errors': 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def bump(key):
+        with lock:
+            counts[key] += 1
+
+    def writer():
+        while not stop.is_set():
+            try:
+                with engine.begin() as conn:
+                    payment_id = conn.execute(
+                        text('INSERT INTO payment (user_id, appointment_id, amount, status, created_at) '
+                             'VALUES (:user_id, :appointment_id, 150000, :status, :created_at)'),
+                        {'user_id': random.randint(1, USERS), 'appointment_id': random.randint(1, 10 ** 9),
+                         'status': 'pending', 'created_at': datetime.utcnow()}
+                    ).lastrowid
+                with engine.begin() as conn:
+                    conn.execute(text("UPDATE payment SET status = 'completed', paid_at = :now WHERE id = :id"),
+                                 {'now': datetime.utcnow(), 'id': payment_id})
+                bump('writes')
+            except OperationalError:
+                bump('locked_errors')
+
+    def reader():
+        while not stop.is_set():
+            try:
+                with engine.connect() as conn:
+                    conn.execute(
+                        text('SELECT * FROM payment WHERE user_id = :user_id ORDER BY created_at DESC, id DESC LIMIT 50'),
+                        {'user_id': random.randint(1, USERS)}
+                    ).fetchall()
+                bump('reads')
+            except OperationalError:
+                bump('locked_errors')
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    return {
+        'config': 'tuned' if tuned else 'default',
+        'writes_per_second': round(counts['writes'] / duration),
+        'reads_per_second': round(counts['reads'] / duration),
+        'locked_errors': counts['locked_errors'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+
+    results = []
+    for tuned in (False, True):
+        with tempfile.TemporaryDirectory() as tmp:
+            results.append(run(os.path.join(tmp, 'payments.db'), tuned, args.writers, args.readers, args.duration))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
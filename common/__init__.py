@@ -0,0 +1,4 @@
+# Helpers shared by the GlowCare services.
+#
+# Each service puts the repository root on sys.path before importing from
+# here; the Docker images copy this package to /common for the same reason.
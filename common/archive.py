@@ -0,0 +1,75 @@
+import os
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Table, delete, insert, literal, select, union_all
+from sqlalchemy.orm import aliased
+
+from common.log import get_logger
+
+# Hot/cold archival.
+#
+# Finished rows older than ARCHIVE_AFTER_DAYS are moved from the hot table
+# into <table>_archive, which has the same columns plus archived_at, so the
+# hot table (and every list query and duplicate check on it) only covers
+# live data. archive_rows() moves ARCHIVE_BATCH_SIZE rows per transaction:
+# each batch is copied and deleted atomically, writers are only held up for
+# one short batch at a time, and an interrupted run loses nothing.
+#
+# Archived tables use AUTOINCREMENT (sqlite_autoincrement on the model and
+# a rebuild migration for older databases), so an id is never handed out
+# again once its row has moved, and hot and archive ids stay disjoint.
+#
+# Reads that need history pass ?include_archived=1 and query with_archive(),
+# the model mapped over hot UNION ALL archive.
+
+ARCHIVE_AFTER_DAYS = float(os.environ.get('ARCHIVE_AFTER_DAYS', '90'))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '500'))
+
+log = get_logger('archive')
+
+
+def archive_table(table, *indexes):
+    columns = [Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable)
+               for column in table.columns]
+    return Table(f'{table.name}_archive', table.metadata, *columns,
+                 Column('archived_at', DateTime, nullable=False), *indexes)
+
+
+def wants_archived(args):
+    return args.get('include_archived', '').lower() in ('1', 'true', 'yes')
+
+
+def all_rows(table, archive):
+    # hot UNION ALL archive with the hot table's columns.
+    names = table.columns.keys()
+    return union_all(select(table), select(*(archive.c[name] for name in names))).subquery(f'{table.name}_all')
+
+
+def with_archive(model, archive):
+    return aliased(model, all_rows(model.__table__, archive))
+
+
+def archive_rows(engine, table, archive, condition, batch_size=ARCHIVE_BATCH_SIZE):
+    # Returns the number of rows moved.
+    names = table.columns.keys()
+    moved = 0
+    while True:
+        with engine.begin() as conn:
+            # No ORDER BY: any batch_size matching rows will do, and it lets
+            # the index on the condition stop after the first batch_size.
+            ids = conn.execute(
+                select(table.c.id).where(condition).limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            # The condition is checked again under the write lock, in case a
+            # row changed after the ids were picked.
+            batch = (table.c.id.in_(ids), condition)
+            conn.execute(insert(archive).from_select(
+                names + ['archived_at'],
+                select(*table.c, literal(datetime.utcnow(), DateTime)).where(*batch)
+            ))
+            count = conn.execute(delete(table).where(*batch)).rowcount
+        moved += count
+        log.info('Archived batch', table=table.name, rows=count, total=moved)
+    return moved
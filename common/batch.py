@@ -0,0 +1,186 @@
+import json
+import os
+
+from flask import jsonify, request
+from werkzeug.exceptions import HTTPException
+
+from common.log import REQUEST_ID_HEADER, current_request_id, get_logger
+
+# POST /batch: several API calls in one HTTP round trip.
+#
+#     {"requests": [{"id": "pay", "method": "POST", "path": "/payments/7/confirm"},
+#                   {"method": "GET", "path": "/payments?user_id=3", "headers": {...}}],
+#      "atomic": false}
+#
+# Sub-requests are dispatched in-process against the app's URL map, in
+# order, each in its own request and application context, so they go
+# through the same hooks, decorators and error handling as a real request
+# without the HTTP overhead. The response lists one {id, status, body}
+# result per sub-request, in request order.
+#
+# With "atomic": true every sub-request shares one database transaction.
+# The views' own commits become savepoints, and the transaction is only
+# committed if every sub-request succeeded (status < 400). Otherwise it is
+# rolled back and the sub-requests that had succeeded are reported as 424.
+
+MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', '50'))
+METHODS = frozenset(['GET', 'POST', 'PUT', 'PATCH', 'DELETE'])
+WRITE_METHODS = frozenset(['POST', 'PUT', 'PATCH', 'DELETE'])
+ROLLED_BACK_STATUS = 424
+
+log = get_logger('batch')
+
+
+def parse_batch(data):
+    # Returns (items, atomic); raises ValueError with a client-facing message.
+    items = data.get('requests') if isinstance(data, dict) else data
+    atomic = bool(data.get('atomic', False)) if isinstance(data, dict) else False
+    if not isinstance(items, list) or not items:
+        raise ValueError('Provide a non-empty list of requests')
+    if len(items) > MAX_REQUESTS:
+        raise ValueError(f'At most {MAX_REQUESTS} requests per batch')
+
+    parsed = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError(f'Request {index} must be an object')
+        method = str(item.get('method', 'GET')).upper()
+        path = item.get('path')
+        if method not in METHODS:
+            raise ValueError(f'Request {index} has an unsupported method: {method}')
+        if not isinstance(path, str) or not path.startswith('/'):
+            raise ValueError(f'Request {index} needs a path starting with /')
+        if path.split('?', 1)[0].rstrip('/') == '/batch':
+            raise ValueError(f'Request {index} cannot be a nested batch')
+        headers = item.get('headers') or {}
+        if not isinstance(headers, dict):
+            raise ValueError(f'Request {index} headers must be an object')
+        parsed.append({
+            'id': item.get('id', index),
+            'method': method,
+            'path': path,
+            'body': item.get('body'),
+            'headers': {str(key): str(value) for key, value in headers.items()},
+        })
+    return parsed, atomic
+
+
+def sub_request_headers(item):
+    # The batch response is encoded as a whole, never its parts.
+    headers = {key: value for key, value in item['headers'].items() if key.lower() != 'accept-encoding'}
+    request_id = current_request_id()
+    if request_id:
+        headers[REQUEST_ID_HEADER] = request_id
+    return headers
+
+
+def result_for(item, response):
+    data = response.get_data(as_text=True)
+    if response.is_json:
+        body = json.loads(data) if data else None
+    else:
+        body = data
+    return {'id': item['id'], 'status': response.status_code, 'body': body}
+
+
+def dispatch_local(app, item, prepare=None, resolve_view=None):
+    # prepare() runs inside the new application context before the view;
+    # resolve_view(view) may swap the view function that gets called.
+    with app.app_context():
+        if prepare is not None:
+            prepare()
+        body = {'json': item['body']} if item['body'] is not None else {}
+        with app.test_request_context(item['path'], method=item['method'],
+                                      headers=sub_request_headers(item), **body):
+            try:
+                rv = app.preprocess_request()
+                if rv is None:
+                    if request.routing_exception is not None:
+                        raise request.routing_exception
+                    view = app.view_functions[request.url_rule.endpoint]
+                    if resolve_view is not None:
+                        view = resolve_view(view)
+                    rv = view(**request.view_args)
+            except HTTPException as e:
+                rv = app.handle_user_exception(e)
+            except Exception:
+                log.exception('Batch sub-request failed', method=item['method'], path=item['path'])
+                rv = jsonify({'message': 'Internal server error'}), 500
+            return result_for(item, app.finalize_request(rv))
+
+
+class SharedTransaction:
+    # One connection and outer transaction for a whole atomic batch. The
+    # session joins it with savepoints, so commit() inside views only
+    # releases a savepoint and finish() decides the outcome.
+
+    def __init__(self, db):
+        from flask_sqlalchemy.query import Query
+        from sqlalchemy.orm import Session
+
+        self.connection = db.engine.connect()
+        self.transaction = self.connection.begin()
+        if self.connection.dialect.name == 'sqlite':
+            # pysqlite doesn't emit BEGIN itself; take the write lock up
+            # front so the savepoints nest inside a real transaction.
+            self.connection.exec_driver_sql('BEGIN IMMEDIATE')
+        # A plain Session, since Flask-SQLAlchemy's would route queries to
+        # the engine instead of this connection, but with its Query class so
+        # views keep first_or_404() and friends.
+        self.session = Session(bind=self.connection, join_transaction_mode='create_savepoint', query_cls=Query)
+
+    def finish(self, commit):
+        self.session.close()
+        try:
+            if commit:
+                self.transaction.commit()
+            else:
+                self.transaction.rollback()
+        finally:
+            self.connection.close()
+
+
+def mark_rolled_back(results):
+    for result in results:
+        if result['status'] < 400:
+            result['status'] = ROLLED_BACK_STATUS
+            result['body'] = {'message': 'Rolled back because another request in the batch failed'}
+
+
+def run_local_batch(app, db, items, atomic, prepare=None, resolve_view=None):
+    # Returns (results, rolled_back).
+    if not atomic:
+        return [dispatch_local(app, item, prepare, resolve_view) for item in items], False
+
+    shared = SharedTransaction(db)
+
+    def join_transaction():
+        db.session.registry.set(shared.session)
+        if prepare is not None:
+            prepare()
+
+    try:
+        results = [dispatch_local(app, item, join_transaction, resolve_view) for item in items]
+    except Exception:
+        shared.finish(False)
+        raise
+    committed = all(result['status'] < 400 for result in results)
+    shared.finish(committed)
+    if not committed:
+        mark_rolled_back(results)
+    return results, not committed
+
+
+def init_batch(app, db):
+    # Registers POST /batch for a service without authentication.
+    def batch():
+        try:
+            items, atomic = parse_batch(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+
+        results, rolled_back = run_local_batch(app, db, items, atomic)
+        log.info('Batch handled', requests=len(items), atomic=atomic, rolled_back=rolled_back, sample=True)
+        return jsonify({'results': results, 'atomic': atomic, 'rolled_back': rolled_back}), 200
+
+    app.add_url_rule('/batch', 'batch', batch, methods=['POST'])
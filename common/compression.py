@@ -0,0 +1,115 @@
+import os
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Response compression negotiated through Accept-Encoding.
+#
+# Brotli is preferred when the brotli package is installed and the client
+# accepts it, gzip otherwise. Buffered bodies below COMPRESSION_MIN_SIZE
+# are sent as-is, since the framing would cost more than it saves. Streamed
+# bodies (NDJSON listings, the gateway's relayed streams) are compressed
+# on the fly and flushed every STREAM_FLUSH_SIZE bytes of input, so the
+# client keeps receiving rows while the server is still producing them.
+#
+# ETags of compressed responses are sent weak: the bytes differ from the
+# identity encoding but the content is the same, and If-None-Match uses
+# weak comparison, so revalidation works for either encoding.
+
+MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '4'))
+STREAM_FLUSH_SIZE = 16 * 1024
+COMPRESSIBLE = frozenset([
+    'application/json', 'application/x-ndjson', 'application/javascript',
+    'text/html', 'text/css', 'text/javascript', 'text/plain',
+])
+
+
+class GzipEncoder:
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+# In order of preference when the client weighs them equally.
+ENCODERS = {'br': BrotliEncoder, 'gzip': GzipEncoder} if brotli is not None else {'gzip': GzipEncoder}
+
+
+def compress_stream(chunks, encoder):
+    pending = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            out = encoder.compress(chunk)
+            pending += len(chunk)
+            if pending >= STREAM_FLUSH_SIZE:
+                out += encoder.flush()
+                pending = 0
+            if out:
+                yield out
+        yield encoder.finish()
+    finally:
+        # Closing the wrapped iterable tears down stream_with_context.
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def compress_response(response):
+    if (request.method == 'HEAD' or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or response.mimetype not in COMPRESSIBLE or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.cache_control.no_transform:
+        return response
+    encoding = request.accept_encodings.best_match(list(ENCODERS))
+    if encoding is None:
+        return response
+
+    encoder = ENCODERS[encoding]()
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoder)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_SIZE:
+            return response
+        response.set_data(encoder.compress(data) + encoder.finish())
+    response.headers['Content-Encoding'] = encoding
+
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_compression(app):
+    app.after_request(compress_response)
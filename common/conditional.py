@@ -0,0 +1,39 @@
+import hashlib
+
+from flask import current_app, request
+from sqlalchemy import func
+from werkzeug.http import is_resource_modified
+
+# Conditional GET for collection endpoints.
+#
+# A list's validator is the row count plus the newest updated_at over the
+# same filters: an insert or update moves the maximum and a delete changes
+# the count. Both come from one aggregate over an (filter, updated_at)
+# index, so a client whose copy is current gets a 304 without a single row
+# being read or serialized. The ETag also covers the query string (fields,
+# paging, filters) and the stream flag, since those change the body.
+#
+# Last-Modified is the newest updated_at. It cannot see deletes, which is
+# why clients should revalidate with the ETag: when If-None-Match is sent,
+# If-Modified-Since is ignored.
+
+
+class CollectionVersion:
+    def __init__(self, query, updated_column, *variant):
+        count, newest = query.order_by(None).with_entities(func.count(), func.max(updated_column)).one()
+        raw = repr((count, newest, request.query_string, variant)).encode()
+        self.etag = hashlib.sha256(raw).hexdigest()[:32]
+        self.last_modified = newest
+
+    def apply(self, response):
+        response.set_etag(self.etag)
+        if self.last_modified is not None:
+            response.last_modified = self.last_modified
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    def not_modified(self):
+        # A ready 304 when the client's copy is current, otherwise None.
+        if is_resource_modified(request.environ, etag=self.etag, last_modified=self.last_modified):
+            return None
+        return self.apply(current_app.response_class(status=304))
@@ -0,0 +1,79 @@
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Database setup shared by the services.
+#
+# DATABASE_URL overrides the service's default URI. For file-backed SQLite
+# every new connection is switched to WAL (readers no longer block behind a
+# writer), waits up to SQLITE_BUSY_TIMEOUT_MS for a lock instead of failing
+# with "database is locked", and gets synchronous=NORMAL plus mmap and page
+# cache sizes that suit a small service database.
+
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    # negative values are KiB rather than pages
+    'cache_size': -int(os.environ.get('SQLITE_CACHE_SIZE_KB', '20000')),
+    'temp_store': 'MEMORY',
+}
+
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '10'))
+MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '10'))
+POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', '10'))
+POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '3600'))
+
+
+def is_file_sqlite(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def database_config(default_uri):
+    return {
+        'SQLALCHEMY_DATABASE_URI': os.environ.get('DATABASE_URL', default_uri),
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+    }
+
+
+def engine_options(uri):
+    if make_url(uri).get_backend_name() == 'sqlite' and not is_file_sqlite(uri):
+        # Flask-SQLAlchemy pins in-memory SQLite to a StaticPool itself.
+        return {}
+    options = {
+        'pool_size': POOL_SIZE,
+        'max_overflow': MAX_OVERFLOW,
+        'pool_timeout': POOL_TIMEOUT,
+        'pool_recycle': POOL_RECYCLE,
+    }
+    if is_file_sqlite(uri):
+        options['connect_args'] = {
+            'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+            'check_same_thread': False,
+        }
+    return options
+
+
+def apply_pragmas(engine, pragmas=None):
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+    return engine
+
+
+def init_database(app, db):
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(uri))
+    db.init_app(app)
+    if is_file_sqlite(uri):
+        with app.app_context():
+            apply_pragmas(db.engine)
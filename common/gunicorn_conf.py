@@ -0,0 +1,50 @@
+# Production gunicorn settings shared by all four services:
+#
+#     gunicorn -c /common/gunicorn_conf.py wsgi:app
+#
+# Preforked gthread workers, sized from the environment. SIGTERM lets
+# in-flight requests finish for up to GUNICORN_GRACEFUL_TIMEOUT seconds.
+# Workers share Prometheus metrics through PROMETHEUS_MULTIPROC_DIR, which
+# is emptied when the server starts.
+import multiprocessing
+import os
+import shutil
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.serving import shut_down, warm_up
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', f"/tmp/glowcare-metrics-{os.environ.get('PORT', '5000')}")
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+worker_class = 'gthread'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '20'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', '0'))
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    warm_up(worker.wsgi)
+
+
+def worker_exit(server, worker):
+    if getattr(worker, 'wsgi', None) is not None:
+        shut_down(worker.wsgi)
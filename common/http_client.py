@@ -0,0 +1,174 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from common.log import REQUEST_ID_HEADER, current_request_id, get_logger
+from common.metrics import observe_upstream
+
+# Pooled keep-alive client for calls between the GlowCare services.
+#
+# One requests.Session per upstream per process: connections are reused
+# across requests, every call gets a connect/read timeout, and idempotent
+# verbs are retried with exponential backoff on connection errors and
+# 502/503/504. Read timeouts are not retried: a slow upstream should cost
+# one timeout, not several, and callers get a plain requests Timeout.
+# Defaults come from the environment and can be overridden per upstream,
+# e.g. APPOINTMENT_SERVICE_POOL_SIZE=50 or PAYMENT_SERVICE_READ_TIMEOUT=10.
+#
+# fan_out() runs several upstream calls at once on a shared thread pool
+# for endpoints that aggregate more than one service. The current request
+# id is sent along as X-Request-ID, including from fan_out() threads, and
+# every call's latency is recorded in the upstream metrics.
+
+log = get_logger('http_client')
+
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+RETRY_STATUSES = (502, 503, 504)
+
+
+def _setting(name, key, default, cast=float):
+    value = os.environ.get(f'{name}_{key}', os.environ.get(f'UPSTREAM_{key}', default))
+    return cast(value)
+
+
+class ServiceClient:
+    def __init__(self, name, base_url, pool_size=None, connect_timeout=None, read_timeout=None,
+                 retries=None, backoff=None):
+        env_name = name.upper().replace('-', '_')
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size or _setting(env_name, 'POOL_SIZE', 20, int)
+        self.timeout = (
+            connect_timeout or _setting(env_name, 'CONNECT_TIMEOUT', 2.0),
+            read_timeout or _setting(env_name, 'READ_TIMEOUT', 5.0),
+        )
+        self.retries = retries if retries is not None else _setting(env_name, 'RETRIES', 2, int)
+        self.backoff = backoff if backoff is not None else _setting(env_name, 'BACKOFF', 0.1)
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _build_session(self):
+        retry = Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=False,
+            status=self.retries,
+            backoff_factor=self.backoff,
+            allowed_methods=IDEMPOTENT_METHODS,
+            status_forcelist=RETRY_STATUSES,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry,
+                              pool_block=False)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        # Service-to-service traffic stays on the local network, where
+        # compressing it would only cost CPU at both ends.
+        session.headers['Accept-Encoding'] = 'identity'
+        return session
+
+    @property
+    def session(self):
+        # Sessions are rebuilt after fork so preforked workers never share
+        # sockets inherited from the parent.
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._session = self._build_session()
+                    self._pid = pid
+        return self._session
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        request_id = current_request_id()
+        if request_id:
+            kwargs['headers'] = {REQUEST_ID_HEADER: request_id, **(kwargs.get('headers') or {})}
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, f'{self.base_url}{path}', **kwargs)
+        except requests.RequestException as e:
+            observe_upstream(self.name, method, time.perf_counter() - started, error=e.__class__.__name__)
+            raise
+        observe_upstream(self.name, method, time.perf_counter() - started, status=response.status_code)
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request('PUT', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+            self._pid = None
+
+
+FAN_OUT_WORKERS = int(os.environ.get('FAN_OUT_WORKERS', '16'))
+
+_fan_out_executor = None
+_fan_out_pid = None
+_fan_out_lock = threading.Lock()
+
+
+def _executor():
+    global _fan_out_executor, _fan_out_pid
+    pid = os.getpid()
+    if _fan_out_pid != pid:
+        with _fan_out_lock:
+            if _fan_out_pid != pid:
+                _fan_out_executor = ThreadPoolExecutor(max_workers=FAN_OUT_WORKERS,
+                                                       thread_name_prefix='fan-out')
+                _fan_out_pid = pid
+    return _fan_out_executor
+
+
+def fan_out(calls, deadline):
+    # Runs {key: zero-argument callable} concurrently and waits at most
+    # `deadline` seconds overall. Returns (results, errors): a call that
+    # raised or did not finish in time shows up in errors instead of
+    # failing the whole batch.
+    futures = {key: _executor().submit(contextvars.copy_context().run, call) for key, call in calls.items()}
+    wait(futures.values(), timeout=deadline)
+    results, errors = {}, {}
+    for key, future in futures.items():
+        if not future.done():
+            future.cancel()
+            errors[key] = 'timeout'
+            continue
+        try:
+            results[key] = future.result()
+        except requests.Timeout:
+            errors[key] = 'timeout'
+        except requests.HTTPError as e:
+            errors[key] = f'upstream returned {e.response.status_code}'
+        except requests.ConnectionError:
+            errors[key] = 'unavailable'
+        except Exception as e:
+            log.exception('Fan-out call failed', call=key)
+            errors[key] = 'failed'
+    return results, errors
+
+
+def shutdown_fan_out():
+    global _fan_out_executor, _fan_out_pid
+    if _fan_out_executor is not None:
+        _fan_out_executor.shutdown(wait=False, cancel_futures=True)
+        _fan_out_executor = None
+        _fan_out_pid = None
@@ -0,0 +1,198 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Structured, non-blocking logging shared by the services.
+#
+# Request threads only put records on a bounded in-memory queue. A listener
+# thread per worker process formats them as one JSON object per line and
+# writes them to stdout. If the queue is full the record is dropped and
+# counted rather than blocking the request.
+#
+# Every record carries the service name and the current request id. The id
+# comes from the incoming X-Request-ID header, or a new one is generated.
+# ServiceClient forwards it, so one id follows a request across services.
+#
+# High-volume success lines are logged with sample=True and kept with
+# probability LOG_SAMPLE_RATE. Warnings and errors are never sampled.
+#
+#     LOG_LEVEL=INFO  LOG_FORMAT=json|text  LOG_SAMPLE_RATE=1.0  LOG_QUEUE_SIZE=10000
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json').lower()
+SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '1.0'))
+QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+REQUEST_ID_HEADER = 'X-Request-ID'
+ROOT_LOGGER = 'glowcare'
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+_service = {'name': None}
+_listener = {'pid': None, 'listener': None, 'handler': None}
+_lock = threading.Lock()
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+def set_request_id(request_id):
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname.lower(),
+            'service': record.service,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.request_id:
+            entry['request_id'] = record.request_id
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = ' '.join(f'{key}={value}' for key, value in (getattr(record, 'fields', None) or {}).items())
+        line = f"{datetime.fromtimestamp(record.created).strftime('%H:%M:%S')} {record.levelname:<7} " \
+               f"[{record.service}] {record.getMessage()}"
+        if record.request_id:
+            line += f' request_id={record.request_id}'
+        if fields:
+            line += f' {fields}'
+        if record.exc_text:
+            line += f'\n{record.exc_text}'
+        return line
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Runs in the request thread: capture context and render the
+        # traceback, leave JSON formatting to the listener thread.
+        record.service = _service['name']
+        record.request_id = _request_id.get()
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class StructuredLogger:
+    # log.info('Payment created', payment_id=1, sample=True)
+
+    def __init__(self, name):
+        self._logger = logging.getLogger(f'{ROOT_LOGGER}.{name}')
+
+    def _log(self, level, message, fields, sample=False, exc_info=False):
+        if not self._logger.isEnabledFor(level):
+            return
+        if sample and SAMPLE_RATE < 1 and random.random() >= SAMPLE_RATE:
+            return
+        self._logger.log(level, message, exc_info=exc_info, extra={'fields': fields})
+
+    def debug(self, message, sample=False, **fields):
+        self._log(logging.DEBUG, message, fields, sample)
+
+    def info(self, message, sample=False, **fields):
+        self._log(logging.INFO, message, fields, sample)
+
+    def warning(self, message, **fields):
+        self._log(logging.WARNING, message, fields)
+
+    def error(self, message, **fields):
+        self._log(logging.ERROR, message, fields)
+
+    def exception(self, message, **fields):
+        self._log(logging.ERROR, message, fields, exc_info=True)
+
+
+def get_logger(name):
+    return StructuredLogger(name)
+
+
+def configure_logging(service):
+    # Safe to call more than once; the listener is (re)started once per
+    # process, so forked gunicorn workers each get their own thread.
+    _service['name'] = service
+    pid = os.getpid()
+    with _lock:
+        if _listener['pid'] == pid:
+            return _listener['handler']
+
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(TextFormatter() if LOG_FORMAT == 'text' else JsonFormatter())
+        handler = NonBlockingQueueHandler(queue.Queue(QUEUE_SIZE))
+        listener = QueueListener(handler.queue, stream, respect_handler_level=False)
+
+        root = logging.getLogger(ROOT_LOGGER)
+        for old in list(root.handlers):
+            root.removeHandler(old)
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL)
+        root.propagate = False
+
+        listener.start()
+        atexit.register(listener.stop)
+        _listener.update(pid=pid, listener=listener, handler=handler)
+        return handler
+
+
+def logging_stats():
+    handler = _listener['handler']
+    if handler is None:
+        return {'queued': 0, 'dropped': 0}
+    return {'queued': handler.queue.qsize(), 'dropped': handler.dropped}
+
+
+def init_logging(app, service):
+    # Request id correlation for a Flask app.
+    from flask import g, request
+
+    configure_logging(service)
+
+    @app.before_request
+    def bind_request_id():
+        g.request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        g.request_id_token = set_request_id(g.request_id)
+
+    @app.after_request
+    def add_request_id_header(response):
+        if 'request_id' in g:
+            response.headers[REQUEST_ID_HEADER] = g.request_id
+        return response
+
+    @app.teardown_request
+    def unbind_request_id(exc):
+        token = g.pop('request_id_token', None)
+        if token is not None:
+            reset_request_id(token)
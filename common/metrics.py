@@ -0,0 +1,132 @@
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+# Prometheus metrics shared by the services, served at GET /metrics.
+#
+# - HTTP: request count and latency per route template and status, plus
+#   requests in flight.
+# - SQL: query count and duration per route and statement type, from
+#   SQLAlchemy engine events.
+# - Upstreams: latency and errors of ServiceClient calls per upstream.
+#
+# Under gunicorn every worker keeps its own counters. gunicorn_conf.py sets
+# PROMETHEUS_MULTIPROC_DIR, so workers write them to shared files and
+# /metrics reports the sum over all workers, whichever worker answers it.
+
+SQL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SQL_OPERATIONS = frozenset(['SELECT', 'INSERT', 'UPDATE', 'DELETE', 'BEGIN', 'PRAGMA', 'WITH'])
+
+HTTP_REQUESTS = Counter(
+    'glowcare_http_requests_total', 'HTTP requests handled',
+    ['service', 'method', 'route', 'status']
+)
+HTTP_LATENCY = Histogram(
+    'glowcare_http_request_duration_seconds', 'Time to produce the HTTP response',
+    ['service', 'method', 'route', 'status']
+)
+HTTP_IN_FLIGHT = Gauge(
+    'glowcare_http_requests_in_flight', 'HTTP requests being handled',
+    ['service'], multiprocess_mode='livesum'
+)
+SQL_QUERIES = Counter(
+    'glowcare_db_queries_total', 'SQL statements executed',
+    ['service', 'route', 'operation']
+)
+SQL_LATENCY = Histogram(
+    'glowcare_db_query_duration_seconds', 'SQL statement execution time',
+    ['service', 'route', 'operation'], buckets=SQL_BUCKETS
+)
+UPSTREAM_LATENCY = Histogram(
+    'glowcare_upstream_request_duration_seconds', 'Latency of calls to other GlowCare services',
+    ['service', 'upstream', 'method', 'status']
+)
+UPSTREAM_ERRORS = Counter(
+    'glowcare_upstream_errors_total', 'Calls to other GlowCare services that raised',
+    ['service', 'upstream', 'method', 'error']
+)
+
+_service = {'name': 'unknown'}
+
+
+def current_route():
+    # Route templates keep label cardinality bounded; work outside a request
+    # (warm-up, outbox dispatcher) is reported as 'background'.
+    try:
+        rule = request.url_rule
+    except RuntimeError:
+        return 'background'
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def observe_upstream(upstream, method, seconds, status=None, error=None):
+    if error is not None:
+        UPSTREAM_ERRORS.labels(_service['name'], upstream, method, error).inc()
+        status = 'error'
+    UPSTREAM_LATENCY.labels(_service['name'], upstream, method, str(status)).observe(seconds)
+
+
+def instrument_engine(engine):
+    # Imported here so the gateway, which has no database, can use this
+    # module without SQLAlchemy installed.
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def record_query(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_started'].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+        if operation not in SQL_OPERATIONS:
+            operation = 'OTHER'
+        labels = (_service['name'], current_route(), operation)
+        SQL_QUERIES.labels(*labels).inc()
+        SQL_LATENCY.labels(*labels).observe(time.perf_counter() - started)
+
+    @event.listens_for(engine, 'handle_error')
+    def discard_query_timer(context):
+        timers = context.connection.info.get('query_started') if context.connection is not None else None
+        if timers:
+            timers.pop()
+
+
+def metrics_view():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_metrics(app, service, db=None):
+    _service['name'] = service
+    if db is not None:
+        with app.app_context():
+            instrument_engine(db.engine)
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+        HTTP_IN_FLIGHT.labels(service).inc()
+
+    @app.after_request
+    def record_request(response):
+        started = g.get('metrics_started')
+        if started is not None:
+            labels = (service, request.method, current_route(), str(response.status_code))
+            HTTP_REQUESTS.labels(*labels).inc()
+            HTTP_LATENCY.labels(*labels).observe(time.perf_counter() - started)
+        return response
+
+    @app.teardown_request
+    def finish_request(exc):
+        if g.pop('metrics_started', None) is not None:
+            HTTP_IN_FLIGHT.labels(service).dec()
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
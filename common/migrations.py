@@ -0,0 +1,174 @@
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import MetaData, Table, inspect, select, text
+from sqlalchemy.exc import OperationalError
+
+from common.log import get_logger
+
+# Versioned schema migrations for the per-service SQLite databases.
+#
+# Each service lists its migrations in model.py as (version, description,
+# steps) tuples. A step is either a SQL string or a callable taking the
+# connection. Version 0 is the schema the services shipped with before this
+# table existed, so a database with tables but no schema_version row is
+# treated as version 0 and brought forward. A brand new database is created
+# straight from the models and stamped with the latest version.
+#
+# Every gunicorn worker runs this at startup against the same file, so
+# each step runs under SQLite's write lock (BEGIN IMMEDIATE, taken before
+# the version is read): the first worker migrates and the others wait,
+# then find the version already stamped. pysqlite issues no BEGIN before
+# DDL or a SELECT by itself, so without it two workers could both read the
+# old version and apply the same migration. Steps should still be
+# idempotent (IF NOT EXISTS, checkfirst). A failed migration is raised to
+# the caller: a service must not start on a half-upgraded schema.
+
+SCHEMA_VERSION_TABLE = 'schema_version'
+# How long a worker waits for another one to finish migrating.
+LOCK_TIMEOUT = float(os.environ.get('MIGRATION_LOCK_TIMEOUT', '300'))
+
+log = get_logger('migrations')
+
+
+def create_index(table_name, name, *columns, unique=False):
+    # Spelled out per migration rather than read from the model, so an old
+    # migration builds the index as it was then, not as the model is now.
+    def step(conn):
+        conn.execute(text(
+            f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} "
+            f"ON {table_name} ({', '.join(columns)})"
+        ))
+    return step
+
+
+def create_table(table):
+    def step(conn):
+        table.create(conn, checkfirst=True)
+    return step
+
+
+def add_column(table_name, column_name, ddl):
+    def step(conn):
+        columns = {column['name'] for column in inspect(conn).get_columns(table_name)}
+        if column_name not in columns:
+            conn.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {ddl}'))
+    return step
+
+
+def _rebuild(conn, table_name, change):
+    # SQLite cannot alter a column or a primary key in place, so the table
+    # is reflected from the database (not the model), copied through a
+    # temporary table that change() adjusts, and renamed back. This runs in
+    # the migration's transaction; a copy left behind by an older,
+    # non-transactional run is dropped first.
+    conn.execute(text(f'DROP TABLE IF EXISTS {table_name}_rebuild'))
+    old = Table(table_name, MetaData(), autoload_with=conn)
+    new = old.to_metadata(MetaData(), name=f'{table_name}_rebuild')
+    new.indexes.clear()
+    change(new)
+    new.create(conn)
+    conn.execute(new.insert().from_select(old.columns.keys(), select(old)))
+    conn.execute(text(f'DROP TABLE {table_name}'))
+    conn.execute(text(f'ALTER TABLE {new.name} RENAME TO {table_name}'))
+    for index in old.indexes:
+        index.create(conn)
+
+
+def alter_column_type(table_name, column_name, type_):
+    # E.g. widening a VARCHAR. Skipped when the column already has the type.
+    def step(conn):
+        column = next(column for column in inspect(conn).get_columns(table_name) if column['name'] == column_name)
+        if column['type'].compile(dialect=conn.dialect) != type_.compile(dialect=conn.dialect):
+            def change(table):
+                table.c[column_name].type = type_
+            _rebuild(conn, table_name, change)
+    return step
+
+
+def autoincrement_ids(table_name, *id_tables):
+    # Rebuilds table_name with INTEGER PRIMARY KEY AUTOINCREMENT, so ids keep
+    # increasing after the newest rows are deleted, and starts the sequence
+    # above every id in id_tables (e.g. rows already moved to an archive).
+    def step(conn):
+        sql = conn.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': table_name}
+        ).scalar()
+        if 'AUTOINCREMENT' not in sql.upper():
+            def change(table):
+                table.dialect_options['sqlite']['autoincrement'] = True
+            _rebuild(conn, table_name, change)
+
+        floor = max((conn.execute(text(f'SELECT MAX(id) FROM {name}')).scalar() or 0
+                     for name in (table_name,) + id_tables))
+        conn.execute(text('DELETE FROM sqlite_sequence WHERE name = :name'), {'name': table_name})
+        conn.execute(text('INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)'),
+                     {'name': table_name, 'seq': floor})
+    return step
+
+
+@contextmanager
+def _locked(engine):
+    with engine.begin() as conn:
+        if conn.dialect.name == 'sqlite':
+            deadline = time.monotonic() + LOCK_TIMEOUT
+            while True:
+                try:
+                    conn.exec_driver_sql('BEGIN IMMEDIATE')
+                    break
+                except OperationalError as e:
+                    # Each attempt already waits out the busy timeout.
+                    if 'locked' not in str(e) or time.monotonic() > deadline:
+                        raise
+                    log.info('Waiting for another process to finish migrating')
+        yield conn
+
+
+def _stamp(conn, version, description):
+    conn.execute(
+        text(f'INSERT INTO {SCHEMA_VERSION_TABLE} (version, description, applied_at) '
+             'VALUES (:version, :description, :applied_at)'),
+        {'version': version, 'description': description, 'applied_at': datetime.utcnow()}
+    )
+
+
+def current_version(conn):
+    conn.execute(text(
+        f'CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} ('
+        'version INTEGER NOT NULL, description VARCHAR(200), applied_at DATETIME)'
+    ))
+    return conn.execute(text(f'SELECT MAX(version) FROM {SCHEMA_VERSION_TABLE}')).scalar()
+
+
+def run_migrations(engine, metadata, migrations):
+    migrations = sorted(migrations, key=lambda migration: migration[0])
+    latest = migrations[-1][0] if migrations else 0
+
+    with _locked(engine) as conn:
+        version = current_version(conn)
+        if version is None:
+            existing = set(inspect(conn).get_table_names()) & set(metadata.tables)
+            if not existing:
+                metadata.create_all(conn)
+                _stamp(conn, latest, 'initial schema')
+                return latest
+            version = 0
+
+    for migration_version, description, steps in migrations:
+        if migration_version <= version:
+            continue
+        with _locked(engine) as conn:
+            if (current_version(conn) or 0) >= migration_version:
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(text(step))
+            _stamp(conn, migration_version, description)
+        log.info('Applied migration', version=migration_version, description=description)
+        version = migration_version
+
+    return version
@@ -0,0 +1,106 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
+from flask import Response, current_app, stream_with_context
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+STREAM_BATCH_SIZE = 1000
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def encode_cursor(sort_value, row_id):
+    # Opaque keyset cursor: the sort column of the last row plus its id.
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+
+def parse_limit(raw, default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    if raw is None or raw == '':
+        return default
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return min(limit, maximum)
+
+
+def parse_date_range(args, start_key='from', end_key='to'):
+    # Accepts YYYY-MM-DD or a full ISO timestamp. A bare end date covers
+    # the whole day, so the returned end bound is exclusive.
+    def parse(key):
+        raw = args.get(key)
+        if not raw:
+            return None, False
+        try:
+            return datetime.fromisoformat(raw), len(raw) == 10
+        except ValueError:
+            raise ValueError(f'Invalid {key} date. Use YYYY-MM-DD or an ISO timestamp')
+
+    start, _ = parse(start_key)
+    end, date_only = parse(end_key)
+    if end is not None and date_only:
+        end += timedelta(days=1)
+    return start, end
+
+
+def is_paginated(args):
+    return 'limit' in args or 'cursor' in args
+
+
+def wants_stream(request):
+    if request.args.get('stream', '').lower() in ('1', 'true', 'ndjson'):
+        return True
+    return request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+
+def keyset_after(query, sort_column, id_column, cursor, descending=False):
+    # (sort, id) > (cursor_sort, cursor_id), spelled out so it works on
+    # SQLite builds without row-value comparisons.
+    sort_value, row_id = decode_cursor(cursor)
+    if descending:
+        return query.filter(
+            (sort_column < sort_value) |
+            ((sort_column == sort_value) & (id_column < row_id))
+        )
+    return query.filter(
+        (sort_column > sort_value) |
+        ((sort_column == sort_value) & (id_column > row_id))
+    )
+
+
+def fetch_page(query, limit, sort_attr):
+    # One extra row tells us whether another page exists.
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_attr), last.id)
+    return rows, next_cursor
+
+
+def ndjson_response(query, serialize, batch_size=STREAM_BATCH_SIZE):
+    # yield_per keeps only one batch of rows alive at a time, so memory
+    # stays flat regardless of table size.
+    dumps = current_app.json.dumps
+
+    def generate():
+        for row in query.yield_per(batch_size):
+            yield dumps(serialize(row), separators=(',', ':')) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
@@ -0,0 +1,118 @@
+import os
+from datetime import date
+from operator import attrgetter
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Response serialization shared by the services.
+#
+# ModelSerializer turns a model (or a projected row) into a response dict
+# and parses the ?fields=id,status,... query parameter. List endpoints use
+# project() to SELECT only the columns they return, which yields plain
+# rows instead of ORM objects, and dump_many() zips those rows straight
+# into dicts.
+#
+# Dates and datetimes are left as-is and rendered as ISO 8601 by the JSON
+# provider, so the per-field isoformat() calls happen inside the encoder.
+# init_json() installs the provider named by JSON_PROVIDER: "orjson" (the
+# default when it is installed) or "json" (the standard library).
+
+
+class ModelSerializer:
+    def __init__(self, model, fields=None):
+        self.model = model
+        self.fields = tuple(fields or model.__table__.columns.keys())
+        self.columns = {name: getattr(model, name) for name in self.fields}
+
+    def parse_fields(self, raw):
+        # None or an empty value selects every field; raises ValueError
+        # with a client-facing message for unknown names.
+        if not raw or not raw.strip():
+            return self.fields
+        fields = tuple(dict.fromkeys(part.strip() for part in raw.split(',') if part.strip()))
+        unknown = [name for name in fields if name not in self.columns]
+        if unknown:
+            raise ValueError(f"Unknown field: {', '.join(unknown)}. Available fields: {', '.join(self.fields)}")
+        return fields or self.fields
+
+    def project(self, query, fields, extra=(), entity=None):
+        # Extra columns (keyset sort keys, ids for cursors) are selected
+        # after the requested ones, so zip() in dump_row drops them again.
+        # entity is an alias of the model to select from instead, such as
+        # the hot + archive union.
+        names = fields + tuple(name for name in extra if name not in fields)
+        if entity is None:
+            return query.with_entities(*(self.columns[name] for name in names))
+        return query.with_entities(*(getattr(entity, name) for name in names))
+
+    def dump(self, obj, fields=None):
+        # Works on ORM objects and projected rows alike.
+        fields = fields or self.fields
+        if len(fields) == 1:
+            return {fields[0]: getattr(obj, fields[0])}
+        return dict(zip(fields, attrgetter(*fields)(obj)))
+
+    @staticmethod
+    def dump_row(row, fields):
+        return dict(zip(fields, row))
+
+    @staticmethod
+    def dump_many(rows, fields):
+        # rows must come from project() with the same fields.
+        return [dict(zip(fields, row)) for row in rows]
+
+
+def iso_default(obj):
+    if isinstance(obj, date):
+        return obj.isoformat()
+    return DefaultJSONProvider.default(obj)
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    default = staticmethod(iso_default)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    # orjson encodes datetimes, dates and UUIDs natively; anything else
+    # goes through Flask's default (Decimal, dataclasses, __html__).
+
+    def options(self, pretty=False):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=DefaultJSONProvider.default,
+                            option=self.options(bool(kwargs.get('indent')))).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        body = orjson.dumps(obj, default=DefaultJSONProvider.default, option=self.options(pretty))
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+
+PROVIDERS = {
+    'json': StdlibJSONProvider,
+    'orjson': OrjsonProvider,
+}
+
+
+def init_json(app):
+    name = os.environ.get('JSON_PROVIDER', 'orjson' if orjson is not None else 'json').lower()
+    if name not in PROVIDERS:
+        raise ValueError(f"JSON_PROVIDER must be one of: {', '.join(PROVIDERS)}")
+    if name == 'orjson' and orjson is None:
+        raise RuntimeError('JSON_PROVIDER=orjson but orjson is not installed')
+    app.json = PROVIDERS[name](app)
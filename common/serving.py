@@ -0,0 +1,53 @@
+import os
+
+from common.log import get_logger
+
+# Lifecycle hooks for the production entry point. Each service's
+# create_app() registers what it needs; common/gunicorn_conf.py calls
+# warm_up() once per worker before it accepts traffic and shut_down()
+# when the worker exits.
+
+WARMUP_KEY = 'glowcare.warmup'
+SHUTDOWN_KEY = 'glowcare.shutdown'
+
+log = get_logger('serving')
+
+
+def on_warmup(app, fn):
+    app.extensions.setdefault(WARMUP_KEY, []).append(fn)
+    return fn
+
+
+def on_shutdown(app, fn):
+    app.extensions.setdefault(SHUTDOWN_KEY, []).append(fn)
+    return fn
+
+
+def warm_up_database(db):
+    # Opens the worker's first pooled connection so the first request
+    # doesn't pay for it.
+    from sqlalchemy import text
+
+    def warm_up():
+        with db.engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+    return warm_up
+
+
+def warm_up(app):
+    with app.app_context():
+        for fn in app.extensions.get(WARMUP_KEY, []):
+            fn()
+
+
+def shut_down(app):
+    with app.app_context():
+        for fn in reversed(app.extensions.get(SHUTDOWN_KEY, [])):
+            try:
+                fn()
+            except Exception:
+                log.exception('Shutdown hook failed', hook=getattr(fn, '__name__', repr(fn)))
+
+
+def env_url(name, default):
+    return os.environ.get(name, default).rstrip('/')
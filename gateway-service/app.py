@@ -0,0 +1,193 @@
+from flask import Blueprint, Flask, Response, request, jsonify, send_from_directory, stream_with_context
+from flask_cors import CORS
+import os
+import re
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.compression import init_compression
+from common.http_client import ServiceClient, fan_out, shutdown_fan_out
+from common.log import get_logger, init_logging
+from common.metrics import init_metrics
+from common.serialization import init_json
+from common.serving import env_url, on_shutdown
+from singleflight import SingleFlight
+
+log = get_logger('gateway')
+
+# Single origin for the frontend: /<service>/<path> is forwarded to that
+# service over ServiceClient's pooled keep-alive connections, and the
+# frontend pages themselves are served from FRONTEND_DIR.
+UPSTREAMS = {
+    'user': ServiceClient('user-service', env_url('USER_SERVICE_URL', 'http://localhost:5001')),
+    'appointment': ServiceClient('appointment-service', env_url('APPOINTMENT_SERVICE_URL', 'http://localhost:5002')),
+    'treatment': ServiceClient('treatment-service', env_url('TREATMENT_SERVICE_URL', 'http://localhost:5003')),
+    'payment': ServiceClient('payment-service', env_url('PAYMENT_SERVICE_URL', 'http://localhost:5004')),
+}
+
+# Hot reads whose identical concurrent GETs are collapsed into one upstream
+# call. The key includes the credentials, so a response is only ever shared
+# between requests that would have been answered the same way.
+COALESCED_ROUTES = {
+    'treatment': [re.compile(r'^/treatments$'), re.compile(r'^/treatments/\d+$')],
+    'appointment': [re.compile(r'^/appointments/\d+$'), re.compile(r'^/availability$')],
+}
+COALESCING = os.environ.get('GATEWAY_COALESCING', '1').lower() not in ('0', 'false', 'no')
+COALESCE_KEY_HEADERS = ('Authorization', 'Cookie', 'If-None-Match', 'If-Modified-Since', 'Accept')
+
+HEALTH_TIMEOUT = float(os.environ.get('GATEWAY_HEALTH_TIMEOUT', '2'))
+FRONTEND_DIR = os.environ.get('FRONTEND_DIR', os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+FRONTEND_FILES = re.compile(r'^[\w-]+\.(html|css|js)$')
+STREAM_CHUNK = 64 * 1024
+
+# Not forwarded in either direction; requests and werkzeug set their own.
+HOP_BY_HOP = frozenset([
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailer',
+    'transfer-encoding', 'upgrade', 'host', 'content-length', 'content-encoding', 'accept-encoding',
+])
+# The gateway answers CORS itself, upstream CORS headers would duplicate it.
+DROPPED_RESPONSE_HEADERS = HOP_BY_HOP | {'x-request-id'}
+
+singleflight = SingleFlight()
+
+bp = Blueprint('gateway', __name__)
+
+def create_app(config=None):
+    app = Flask(__name__)
+    CORS(app, origins=["*"], max_age=600)
+    init_logging(app, 'gateway-service')
+    init_json(app)
+    init_compression(app)
+    if config:
+        app.config.update(config)
+
+    init_metrics(app, 'gateway-service')
+
+    app.register_blueprint(bp)
+    for client in UPSTREAMS.values():
+        on_shutdown(app, client.close)
+    on_shutdown(app, shutdown_fan_out)
+    return app
+
+def forwarded_headers():
+    headers = {key: value for key, value in request.headers.items()
+               if key.lower() not in HOP_BY_HOP and not key.lower().startswith('access-control-')}
+    headers['X-Forwarded-For'] = ', '.join(filter(None, [request.headers.get('X-Forwarded-For'), request.remote_addr]))
+    headers['X-Forwarded-Proto'] = request.scheme
+    return headers
+
+def response_headers(upstream):
+    return [(key, value) for key, value in upstream.headers.items()
+            if key.lower() not in DROPPED_RESPONSE_HEADERS and not key.lower().startswith('access-control-')]
+
+def is_coalesced(service, path):
+    return COALESCING and request.method == 'GET' and any(
+        pattern.match(path) for pattern in COALESCED_ROUTES.get(service, [])
+    )
+
+def fetch_buffered(client, target, headers):
+    upstream = client.get(target, headers=headers)
+    return upstream.status_code, response_headers(upstream), upstream.content
+
+def upstream_error(service, error):
+    if isinstance(error, requests.Timeout):
+        return jsonify({'message': f'{service} service timed out'}), 504
+    return jsonify({'message': f'{service} service is unavailable'}), 502
+
+@bp.route('/<service>', defaults={'path': ''}, methods=['GET', 'POST', 'PUT', 'DELETE', 'PATCH'])
+@bp.route('/<service>/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE', 'PATCH'])
+def proxy(service, path):
+    client = UPSTREAMS.get(service)
+    if client is None:
+        if FRONTEND_FILES.match(service) and not path:
+            return send_from_directory(FRONTEND_DIR, service)
+        return jsonify({'message': f'Unknown service: {service}'}), 404
+
+    path = f'/{path}'
+    query = request.query_string.decode()
+    target = f'{path}?{query}' if query else path
+    headers = forwarded_headers()
+
+    try:
+        if is_coalesced(service, path):
+            key = (service, target) + tuple(request.headers.get(name) for name in COALESCE_KEY_HEADERS)
+            (status, upstream_headers, body), shared = singleflight.do(
+                key, lambda: fetch_buffered(client, target, headers)
+            )
+            if shared:
+                log.debug('Coalesced upstream read', service=service, path=path)
+            return Response(body, status=status, headers=upstream_headers)
+
+        upstream = client.request(request.method, target, headers=headers, data=request.get_data(), stream=True)
+    except requests.RequestException as e:
+        log.warning('Upstream request failed', service=service, path=path, error=e.__class__.__name__)
+        return upstream_error(service, e)
+
+    # Small responses are passed on whole; chunked ones (bulk exports,
+    # ?stream=1 listings) are streamed through without buffering.
+    if 'Content-Length' in upstream.headers:
+        body = upstream.content
+        upstream.close()
+        return Response(body, status=upstream.status_code, headers=response_headers(upstream))
+
+    def relay():
+        try:
+            yield from upstream.iter_content(chunk_size=STREAM_CHUNK)
+        finally:
+            upstream.close()
+
+    return Response(stream_with_context(relay()), status=upstream.status_code, headers=response_headers(upstream))
+
+@bp.route('/', methods=['GET'])
+def home():
+    if os.path.exists(os.path.join(FRONTEND_DIR, 'index.html')):
+        return send_from_directory(FRONTEND_DIR, 'index.html')
+    return jsonify({
+        'message': 'GlowCare API Gateway',
+        'version': '1.0.0',
+        'status': 'running',
+        'endpoints': {
+            'health': 'GET /health (all services)',
+            'metrics': 'GET /metrics (Prometheus)',
+            'services': 'ANY /user/..., /appointment/..., /treatment/..., /payment/...'
+        }
+    }), 200
+
+def check_health(client):
+    started = time.perf_counter()
+    response = client.get('/health', timeout=(client.timeout[0], HEALTH_TIMEOUT))
+    return response.status_code, round((time.perf_counter() - started) * 1000, 1)
+
+@bp.route('/health', methods=['GET'])
+def health_check():
+    results, errors = fan_out(
+        {name: (lambda client=client: check_health(client)) for name, client in UPSTREAMS.items()},
+        HEALTH_TIMEOUT + 1
+    )
+
+    services = {}
+    for name in UPSTREAMS:
+        if name in results:
+            status_code, latency_ms = results[name]
+            services[name] = {
+                'status': 'healthy' if status_code == 200 else 'unhealthy',
+                'status_code': status_code,
+                'latency_ms': latency_ms
+            }
+        else:
+            services[name] = {'status': 'unavailable', 'error': errors[name]}
+
+    healthy = all(service['status'] == 'healthy' for service in services.values())
+    return jsonify({
+        'status': 'healthy' if healthy else 'degraded',
+        'service': 'gateway-service',
+        'services': services,
+        'coalescing': singleflight.stats()
+    }), 200 if healthy else 503
+
+if __name__ == '__main__':
+    create_app().run(debug=True, port=5000, host='0.0.0.0')
@@ -0,0 +1,57 @@
+import threading
+
+# Request coalescing ("singleflight").
+#
+# Concurrent calls with the same key share one execution: the first caller
+# runs the function, callers arriving while it is in flight wait for it and
+# get the same result (or exception). Nothing is cached: once the call
+# finishes the next caller with that key runs it again. Keys are per
+# process, so each gunicorn worker coalesces its own requests.
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key, fn):
+        # Returns (result, shared); shared is True when another caller's
+        # execution was reused.
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        with self._lock:
+            return {'executed': self.executed, 'shared': self.shared, 'in_flight': len(self._calls)}
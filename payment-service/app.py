@@ -1,38 +1,129 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, request, jsonify
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from functools import partial
+import click
 import uuid
 import os
-from model import db, Payment
+import sys
 
-app = Flask(__name__)
-CORS(app)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.archive import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, wants_archived, with_archive
+from common.batch import init_batch
+from common.compression import init_compression
+from common.conditional import CollectionVersion
+from common.database import database_config, init_database
+from common.http_client import ServiceClient
+from common.log import get_logger, init_logging
+from common.metrics import init_metrics
+from common.migrations import run_migrations
+from common.pagination import (
+    fetch_page, is_paginated, keyset_after, ndjson_response, parse_date_range, parse_limit,
+    wants_stream
+)
+from common.serialization import init_json
+from common.serving import env_url, on_shutdown, on_warmup, warm_up, warm_up_database
+from model import (
+    db, Payment, MIGRATIONS, archive_payments, payment_archive, payment_serializer, rebuild_daily_stats
+)
+from idempotency import idempotent, purge_expired_keys
+from outbox import OutboxDispatcher, backlog, record_status_change
+from stats import StatDeltas, day_bounds, parse_group_by, query_stats
+
+log = get_logger('payment')
 
 db_path = os.path.join(os.path.dirname(__file__), 'payments.db')
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-db.init_app(app)
+APPOINTMENT_SERVICE_URL = env_url('APPOINTMENT_SERVICE_URL', 'http://localhost:5002')
+
+appointment_client = ServiceClient('appointment-service', APPOINTMENT_SERVICE_URL)
+outbox_dispatcher = OutboxDispatcher(appointment_client)
+
+bp = Blueprint('payment', __name__, cli_group=None)
+
+def create_app(config=None):
+    app = Flask(__name__)
+    CORS(app)
+    init_logging(app, 'payment-service')
+    init_json(app)
+    init_compression(app)
+    
+    app.config.update(database_config(f'sqlite:///{db_path}'))
+    if config:
+        app.config.update(config)
+    
+    init_database(app, db)
+    init_metrics(app, 'payment-service', db)
+    
+    with app.app_context():
+        schema_version = run_migrations(db.engine, db.metadata, MIGRATIONS)
+        log.info('Payment database ready', schema_version=schema_version)
+    
+    app.register_blueprint(bp)
+    init_batch(app, db)
+    on_warmup(app, warm_up_database(db))
+    on_warmup(app, outbox_dispatcher.start)
+    on_shutdown(app, appointment_client.close)
+    on_shutdown(app, outbox_dispatcher.stop)
+    return app
 
-APPOINTMENT_SERVICE_URL = 'http://localhost:5002'
+MAX_BULK_PAYMENTS = 5000
+PAYMENT_STATUSES = ('pending', 'completed', 'failed')
 
-with app.app_context():
+def new_payment_reference():
+    return f"PAY-{datetime.now().strftime('%Y%m%d%H%M%S')}-{str(uuid.uuid4())[:8].upper()}"
+
+def validate_bulk_payment(item):
+    if not isinstance(item, dict):
+        raise ValueError('Each payment must be an object')
+    for field in ['user_id', 'appointment_id', 'amount', 'payment_method']:
+        if field not in item:
+            raise ValueError(f'Missing required field: {field}')
     try:
-        db.create_all()
-        print("✅ Payment database tables created successfully")
-    except Exception as e:
-        print(f"❌ Error creating database tables: {e}")
+        return {
+            'user_id': int(item['user_id']),
+            'appointment_id': int(item['appointment_id']),
+            'amount': int(item['amount']),
+            'payment_method': str(item['payment_method']).strip(),
+            'payment_reference': new_payment_reference(),
+            'status': 'pending',
+            'created_at': datetime.utcnow()
+        }
+    except (TypeError, ValueError):
+        raise ValueError('user_id, appointment_id, and amount must be integers')
 
-@app.route('/health', methods=['GET'])
+def bulk_items(data, key):
+    items = data.get(key) if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        raise ValueError(f'Provide a non-empty list of {key}')
+    if len(items) > MAX_BULK_PAYMENTS:
+        raise ValueError(f'At most {MAX_BULK_PAYMENTS} {key} per request')
+    return items
+
+def bulk_response(results, total, action, status=200):
+    succeeded = sum(1 for result in results if 'error' not in result)
+    return jsonify({
+        'success': succeeded == total,
+        'message': f'{action} {succeeded} of {total} payments',
+        'succeeded': succeeded,
+        'failed': total - succeeded,
+        'results': results
+    }), status if succeeded else 400
+
+@bp.route('/health', methods=['GET'])
 def health_check():
     return jsonify({
         'status': 'healthy', 
         'service': 'payment-service',
-        'database': 'connected'
+        'database': 'connected',
+        'outbox_pending': backlog()
     }), 200
 
-@app.route('/', methods=['GET'])
+@bp.route('/', methods=['GET'])
 def home():
     return jsonify({
         'message': 'GlowCare Payment Service',
@@ -40,51 +131,66 @@ def home():
         'status': 'running',
         'endpoints': {
             'health': '/health',
-            'payments': '/payments (GET/POST)',
-            'payment': '/payments/<id> (GET)',
+            'metrics': '/metrics (Prometheus)',
+            'batch': '/batch (POST, several requests in one call)',
+            'idempotency': 'POST endpoints accept an Idempotency-Key header; retries replay the first response',
+            'payments': '/payments (GET/POST, GET filters: status, payment_method, from, to; paging: limit, cursor; stream=1; fields=id,status,...; include_archived=1; ETag/Last-Modified)',
+            'payment': '/payments/<id> (GET, ?include_archived=1)',
             'status': '/payments/<id>/status (PUT)',
             'confirm': '/payments/<id>/confirm (POST)',
-            'by_appointment': '/payments/appointment/<id> (GET)'
+            'by_appointment': '/payments/appointment/<id> (GET, ?include_archived=1)',
+            'bulk_create': '/payments/bulk (POST)',
+            'bulk_confirm': '/payments/bulk/confirm (POST)',
+            'bulk_status': '/payments/bulk/status (PUT)',
+            'stats': '/payments/stats (GET, from, to, group_by: day,payment_method,status; filters: status, payment_method)'
         }
     }), 200
 
-@app.route('/payments', methods=['POST'])
+def existing_payment_conflict(appointment_id, table=None):
+    table = Payment.__table__ if table is None else table
+    existing_payment = db.session.execute(
+        select(table.c.id, table.c.payment_reference).where(table.c.appointment_id == appointment_id)
+    ).first()
+    if existing_payment is None:
+        return None
+    log.info('Payment rejected', reason='duplicate', appointment_id=appointment_id)
+    return jsonify({
+        'message': f'Payment already exists for appointment {appointment_id}',
+        'existing_payment_id': existing_payment.id,
+        'payment_reference': existing_payment.payment_reference
+    }), 409
+
+@bp.route('/payments', methods=['POST'])
+@idempotent
 def create_payment():
     try:
         data = request.get_json()
-        print(f"=== CREATE PAYMENT ===")
-        print(f"Received payment data: {data}")
         
         if not data:
-            print("❌ No data provided")
+            log.info('Payment rejected', reason='no data')
             return jsonify({'message': 'No data provided'}), 400
             
         required_fields = ['user_id', 'appointment_id', 'amount', 'payment_method']
         for field in required_fields:
             if field not in data:
-                print(f"❌ Missing field: {field}")
+                log.info('Payment rejected', reason='missing field', field=field)
                 return jsonify({'message': f'Missing required field: {field}'}), 400
         
         try:
             user_id = int(data['user_id'])
             appointment_id = int(data['appointment_id'])
             amount = int(data['amount'])
-        except ValueError as e:
-            print(f"❌ Invalid data type: {e}")
+        except ValueError:
+            log.info('Payment rejected', reason='invalid data types')
             return jsonify({'message': 'Invalid data types. user_id, appointment_id, and amount must be integers'}), 400
         
-        existing_payment = Payment.query.filter_by(appointment_id=appointment_id).first()
-        if existing_payment:
-            print(f"❌ Payment already exists for appointment {appointment_id}")
-            return jsonify({
-                'message': f'Payment already exists for appointment {appointment_id}',
-                'existing_payment_id': existing_payment.id,
-                'payment_reference': existing_payment.payment_reference
-            }), 409
-        
-        payment_reference = f"PAY-{datetime.now().strftime('%Y%m%d%H%M%S')}-{str(uuid.uuid4())[:8].upper()}"
+        # Archived payments are outside the unique index below, so they are
+        # checked first, with a lookup on the archive's own unique index.
+        conflict = existing_payment_conflict(appointment_id, payment_archive)
+        if conflict is not None:
+            return conflict
         
-        print(f"Creating payment with reference: {payment_reference}")
+        payment_reference = new_payment_reference()
         
         payment = Payment(
             user_id=user_id,
@@ -92,94 +198,162 @@ def create_payment():
             amount=amount,
             payment_method=data['payment_method'].strip(),
             payment_reference=payment_reference,
-            status='pending'
+            status='pending',
+            created_at=datetime.utcnow()
         )
         
         db.session.add(payment)
-        db.session.commit()
+        deltas = StatDeltas()
+        deltas.add(payment.created_at, payment.payment_method, payment.status, payment.amount)
+        # The unique index on appointment_id rejects a second payment, even
+        # from a concurrent request, so there is no separate check first.
+        try:
+            deltas.flush(db.session)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            conflict = existing_payment_conflict(appointment_id)
+            if conflict is None:
+                raise
+            return conflict
         
-        print(f"✅ Payment created successfully: ID={payment.id}, Reference={payment.payment_reference}")
+        log.info('Payment created', payment_id=payment.id, payment_reference=payment.payment_reference, sample=True)
         
         return jsonify({
             'success': True,
             'message': f'Payment created successfully! Reference: {payment.payment_reference}',
-            'payment': {
-                'id': payment.id,
-                'payment_reference': payment.payment_reference,
-                'user_id': payment.user_id,
-                'appointment_id': payment.appointment_id,
-                'amount': payment.amount,
-                'payment_method': payment.payment_method,
-                'status': payment.status,
-                'created_at': payment.created_at.isoformat()
-            }
+            'payment': payment_serializer.dump(payment)
         }), 201
         
     except Exception as e:
-        print(f"❌ Error creating payment: {str(e)}")
+        log.exception('Error creating payment')
         db.session.rollback()
         return jsonify({
             'success': False,
             'message': f'Failed to create payment: {str(e)}'
         }), 500
 
-@app.route('/payments', methods=['GET'])
+def payment_source():
+    # ?include_archived=1 reads history from the archive table as well.
+    if wants_archived(request.args):
+        return with_archive(Payment, payment_archive)
+    return Payment
+
+@bp.route('/payments', methods=['GET'])
 def get_payments():
     try:
         user_id = request.args.get('user_id')
-        print(f"=== GET PAYMENTS ===")
-        print(f"Requested user_id: {user_id}")
-        
-        if user_id:
-            payments = Payment.query.filter_by(user_id=int(user_id)).order_by(Payment.created_at.desc()).all()
-            print(f"Found {len(payments)} payments for user {user_id}")
-        else:
-            payments = Payment.query.order_by(Payment.created_at.desc()).all()
-            print(f"Found {len(payments)} total payments")
-        
-        result = []
-        for payment in payments:
-            result.append({
-                'id': payment.id,
-                'user_id': payment.user_id,
-                'appointment_id': payment.appointment_id,
-                'amount': payment.amount,
-                'payment_method': payment.payment_method,
-                'payment_reference': payment.payment_reference,
-                'status': payment.status,
-                'created_at': payment.created_at.isoformat(),
-                'paid_at': payment.paid_at.isoformat() if payment.paid_at else None
-            })
-        
-        print(f"Returning {len(result)} payments")
-        return jsonify(result)
+        status = request.args.get('status')
+        payment_method = request.args.get('payment_method')
+        log.debug('Fetching payments', user_id=user_id, status=status, payment_method=payment_method)
+        
+        try:
+            fields = payment_serializer.parse_fields(request.args.get('fields'))
+            created_from, created_to = parse_date_range(request.args)
+            source = payment_source()
+            query = db.session.query(source)
+            if user_id:
+                query = query.filter_by(user_id=int(user_id))
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
+        if status:
+            query = query.filter_by(status=status)
+        if payment_method:
+            query = query.filter_by(payment_method=payment_method)
+        if created_from:
+            query = query.filter(source.created_at >= created_from)
+        if created_to:
+            query = query.filter(source.created_at < created_to)
+        query = query.order_by(source.created_at.desc(), source.id.desc())
+        
+        stream = wants_stream(request)
+        version = CollectionVersion(query, source.updated_at, stream)
+        not_modified = version.not_modified()
+        if not_modified is not None:
+            return not_modified
+        
+        query = payment_serializer.project(query, fields, extra=('created_at', 'id'), entity=source)
+        
+        if stream:
+            return version.apply(ndjson_response(query, partial(payment_serializer.dump_row, fields=fields)))
+        
+        if not is_paginated(request.args):
+            result = payment_serializer.dump_many(query.all(), fields)
+            log.info('Fetched payments', count=len(result), sample=True)
+            return version.apply(jsonify(result))
+        
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            cursor = request.args.get('cursor')
+            if cursor:
+                query = keyset_after(query, source.created_at, source.id, cursor, descending=True)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
+        payments, next_cursor = fetch_page(query, limit, 'created_at')
+        
+        log.info('Fetched payment page', count=len(payments), sample=True)
+        return version.apply(jsonify({
+            'payments': payment_serializer.dump_many(payments, fields),
+            'next_cursor': next_cursor
+        }))
         
     except Exception as e:
-        print(f"❌ Error fetching payments: {str(e)}")
+        log.exception('Error fetching payments')
         return jsonify({'message': f'Failed to fetch payments: {str(e)}'}), 500
 
-@app.route('/payments/<int:payment_id>', methods=['GET'])
-def get_payment(payment_id):
+@bp.route('/payments/stats', methods=['GET'])
+def get_payment_stats():
     try:
-        payment = Payment.query.get_or_404(payment_id)
+        try:
+            start, end = parse_date_range(request.args)
+            group_by = parse_group_by(request.args.get('group_by'))
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
+        start_day, end_day = day_bounds(start, end)
+        stats = query_stats(
+            db.session, start_day, end_day, group_by,
+            status=request.args.get('status'),
+            payment_method=request.args.get('payment_method')
+        )
         
         return jsonify({
-            'id': payment.id,
-            'user_id': payment.user_id,
-            'appointment_id': payment.appointment_id,
-            'amount': payment.amount,
-            'payment_method': payment.payment_method,
-            'payment_reference': payment.payment_reference,
-            'status': payment.status,
-            'created_at': payment.created_at.isoformat(),
-            'paid_at': payment.paid_at.isoformat() if payment.paid_at else None
+            'from': start_day.isoformat() if start_day else None,
+            'to': (end_day - timedelta(days=1)).isoformat() if end_day else None,
+            'group_by': group_by,
+            'stats': stats,
+            'total': {
+                'count': sum(entry['count'] for entry in stats),
+                'amount': sum(entry['amount'] for entry in stats)
+            }
         })
         
     except Exception as e:
-        print(f"❌ Error fetching payment: {str(e)}")
+        log.exception('Error fetching payment stats')
+        return jsonify({'message': f'Failed to fetch payment stats: {str(e)}'}), 500
+
+@bp.route('/payments/<int:payment_id>', methods=['GET'])
+def get_payment(payment_id):
+    try:
+        fields = payment_serializer.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    try:
+        source = payment_source()
+        payment = payment_serializer.project(db.session.query(source), fields, entity=source).filter(
+            source.id == payment_id
+        ).first_or_404()
+        
+        return jsonify(payment_serializer.dump_row(payment, fields))
+        
+    except Exception as e:
+        log.warning('Error fetching payment', payment_id=payment_id, error=str(e))
         return jsonify({'message': 'Payment not found'}), 404
 
-@app.route('/payments/<int:payment_id>/status', methods=['PUT'])
+@bp.route('/payments/<int:payment_id>/status', methods=['PUT'])
 def update_payment_status(payment_id):
     try:
         payment = Payment.query.get_or_404(payment_id)
@@ -194,9 +368,15 @@ def update_payment_status(payment_id):
         if data['status'] == 'completed' and old_status != 'completed':
             payment.paid_at = datetime.utcnow()
         
+        deltas = StatDeltas()
+        deltas.move(payment.created_at, payment.payment_method, payment.amount, old_status, payment.status)
+        deltas.flush(db.session)
+        queued = record_status_change(db.session, payment.id, payment.appointment_id, old_status, payment.status)
         db.session.commit()
+        if queued:
+            outbox_dispatcher.notify()
         
-        print(f"✅ Payment {payment_id} status updated from {old_status} to {payment.status}")
+        log.info('Payment status updated', payment_id=payment_id, old_status=old_status, new_status=payment.status)
         
         return jsonify({
             'message': 'Payment status updated successfully',
@@ -206,11 +386,12 @@ def update_payment_status(payment_id):
         })
         
     except Exception as e:
-        print(f"❌ Error updating payment status: {str(e)}")
+        log.exception('Error updating payment status')
         db.session.rollback()
         return jsonify({'message': f'Failed to update payment status: {str(e)}'}), 500
 
-@app.route('/payments/<int:payment_id>/confirm', methods=['POST'])
+@bp.route('/payments/<int:payment_id>/confirm', methods=['POST'])
+@idempotent
 def confirm_payment(payment_id):
     try:
         payment = Payment.query.get_or_404(payment_id)
@@ -218,12 +399,17 @@ def confirm_payment(payment_id):
         if payment.status == 'completed':
             return jsonify({'message': 'Payment is already completed'}), 400
         
+        deltas = StatDeltas()
+        deltas.move(payment.created_at, payment.payment_method, payment.amount, payment.status, 'completed')
+        record_status_change(db.session, payment.id, payment.appointment_id, payment.status, 'completed')
         payment.status = 'completed'
         payment.paid_at = datetime.utcnow()
         
+        deltas.flush(db.session)
         db.session.commit()
+        outbox_dispatcher.notify()
         
-        print(f"✅ Payment {payment_id} confirmed successfully")
+        log.info('Payment confirmed', payment_id=payment_id)
         
         return jsonify({
             'message': 'Payment confirmed successfully',
@@ -232,35 +418,229 @@ def confirm_payment(payment_id):
         })
         
     except Exception as e:
-        print(f"❌ Error confirming payment: {str(e)}")
+        log.exception('Error confirming payment')
         db.session.rollback()
         return jsonify({'message': f'Failed to confirm payment: {str(e)}'}), 500
 
-@app.route('/payments/appointment/<int:appointment_id>', methods=['GET'])
+@bp.route('/payments/appointment/<int:appointment_id>', methods=['GET'])
 def get_payment_by_appointment(appointment_id):
     try:
-        payment = Payment.query.filter_by(appointment_id=appointment_id).first()
+        fields = payment_serializer.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    try:
+        source = payment_source()
+        payment = payment_serializer.project(db.session.query(source), fields, entity=source).filter(
+            source.appointment_id == appointment_id
+        ).first()
         
         if not payment:
             return jsonify({'message': 'No payment found for this appointment'}), 404
         
-        return jsonify({
-            'id': payment.id,
-            'user_id': payment.user_id,
-            'appointment_id': payment.appointment_id,
-            'amount': payment.amount,
-            'payment_method': payment.payment_method,
-            'payment_reference': payment.payment_reference,
-            'status': payment.status,
-            'created_at': payment.created_at.isoformat(),
-            'paid_at': payment.paid_at.isoformat() if payment.paid_at else None
-        })
+        return jsonify(payment_serializer.dump_row(payment, fields))
         
-    except Exception as e:
-        print(f"❌ Error fetching payment by appointment: {str(e)}")
+    except Exception:
+        log.exception('Error fetching payment by appointment')
         return jsonify({'message': 'Failed to fetch payment'}), 500
 
+@bp.route('/payments/bulk', methods=['POST'])
+@idempotent
+def create_payments_bulk():
+    try:
+        try:
+            items = bulk_items(request.get_json(), 'payments')
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
+        results = [{'index': index} for index in range(len(items))]
+        rows = {}
+        for index, item in enumerate(items):
+            try:
+                rows[index] = validate_bulk_payment(item)
+            except ValueError as e:
+                results[index]['error'] = str(e)
+        
+        # One IN query per table finds every appointment that already has a
+        # payment, live or archived.
+        appointment_ids = {row['appointment_id'] for row in rows.values()}
+        existing = {}
+        for table in (payment_archive, Payment.__table__) if appointment_ids else ():
+            existing.update(db.session.execute(
+                select(table.c.appointment_id, table.c.id).where(table.c.appointment_id.in_(appointment_ids))
+            ).all())
+        
+        seen = set()
+        for index, row in list(rows.items()):
+            appointment_id = row['appointment_id']
+            if appointment_id in existing:
+                results[index]['error'] = f'Payment already exists for appointment {appointment_id}'
+                results[index]['existing_payment_id'] = existing[appointment_id]
+            elif appointment_id in seen:
+                results[index]['error'] = f'Duplicate appointment {appointment_id} in request'
+            else:
+                seen.add(appointment_id)
+                continue
+            del rows[index]
+        
+        if rows:
+            try:
+                created = db.session.execute(
+                    insert(Payment).returning(Payment.id, Payment.payment_reference, sort_by_parameter_order=True),
+                    list(rows.values())
+                ).all()
+                deltas = StatDeltas()
+                for row in rows.values():
+                    deltas.add(row['created_at'], row['payment_method'], row['status'], row['amount'])
+                deltas.flush(db.session)
+                db.session.commit()
+            except IntegrityError:
+                # Another request paid one of these appointments after the
+                # check above and nothing from this batch was written. A
+                # retry reruns the check and reports those items one by one.
+                db.session.rollback()
+                response = jsonify({'message': 'Some appointments were paid concurrently, please retry'})
+                response.headers['Retry-After'] = '1'
+                return response, 503
+            for index, (payment_id, reference) in zip(rows, created):
+                results[index]['id'] = payment_id
+                results[index]['payment_reference'] = reference
+        
+        log.info('Bulk created payments', created=len(rows), rejected=len(items) - len(rows))
+        return bulk_response(results, len(items), 'Created', 201)
+        
+    except Exception as e:
+        log.exception('Error creating payments in bulk')
+        db.session.rollback()
+        return jsonify({'message': f'Failed to create payments: {str(e)}'}), 500
+
+def apply_bulk_status(changes, results, reject_completed=False):
+    # changes maps payment id -> new status. One IN query loads the current
+    # statuses, one executemany UPDATE writes every change.
+    current = {row.id: row for row in db.session.execute(
+        select(Payment.id, Payment.status, Payment.created_at, Payment.payment_method, Payment.amount,
+               Payment.appointment_id)
+        .where(Payment.id.in_(changes.keys()))
+    )}
+    now = datetime.utcnow()
+    
+    updates = []
+    deltas = StatDeltas()
+    queued = False
+    for payment_id, status in changes.items():
+        result = results[payment_id]
+        payment = current.get(payment_id)
+        if payment is None:
+            result['error'] = 'Payment not found'
+            continue
+        if reject_completed and payment.status == 'completed':
+            result['error'] = 'Payment is already completed'
+            continue
+        row = {'id': payment_id, 'status': status}
+        if status == 'completed' and payment.status != 'completed':
+            row['paid_at'] = now
+        updates.append(row)
+        deltas.move(payment.created_at, payment.payment_method, payment.amount, payment.status, status)
+        queued |= record_status_change(db.session, payment_id, payment.appointment_id, payment.status, status)
+        result['old_status'] = payment.status
+        result['new_status'] = status
+    
+    # Group rows by key set so each executemany has uniform parameters.
+    for keys in {tuple(sorted(row)) for row in updates}:
+        db.session.execute(update(Payment), [row for row in updates if tuple(sorted(row)) == keys])
+    deltas.flush(db.session)
+    db.session.commit()
+    if queued:
+        outbox_dispatcher.notify()
+    return len(updates)
+
+@bp.route('/payments/bulk/confirm', methods=['POST'])
+def confirm_payments_bulk():
+    try:
+        try:
+            raw_ids = bulk_items(request.get_json(), 'ids')
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        try:
+            ids = [int(payment_id) for payment_id in raw_ids]
+        except (TypeError, ValueError):
+            return jsonify({'message': 'ids must be integers'}), 400
+        
+        results = {payment_id: {'id': payment_id} for payment_id in ids}
+        confirmed = apply_bulk_status(dict.fromkeys(results, 'completed'), results, reject_completed=True)
+        
+        log.info('Bulk confirmed payments', confirmed=confirmed)
+        return bulk_response(list(results.values()), len(results), 'Confirmed')
+        
+    except Exception as e:
+        log.exception('Error confirming payments in bulk')
+        db.session.rollback()
+        return jsonify({'message': f'Failed to confirm payments: {str(e)}'}), 500
+
+@bp.route('/payments/bulk/status', methods=['PUT'])
+def update_payment_status_bulk():
+    try:
+        try:
+            items = bulk_items(request.get_json(), 'updates')
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
+        results = {}
+        changes = {}
+        for item in items:
+            try:
+                payment_id = int(item['id'])
+            except (TypeError, ValueError, KeyError):
+                return jsonify({'message': 'Each update needs an integer id'}), 400
+            results[payment_id] = {'id': payment_id}
+            status = item.get('status')
+            if status not in PAYMENT_STATUSES:
+                results[payment_id]['error'] = f"status must be one of {', '.join(PAYMENT_STATUSES)}"
+                changes.pop(payment_id, None)
+            else:
+                changes[payment_id] = status
+        
+        updated = apply_bulk_status(changes, results) if changes else 0
+        
+        log.info('Bulk updated payment statuses', updated=updated)
+        return bulk_response(list(results.values()), len(results), 'Updated')
+        
+    except Exception as e:
+        log.exception('Error updating payment statuses in bulk')
+        db.session.rollback()
+        return jsonify({'message': f'Failed to update payment statuses: {str(e)}'}), 500
+
+@bp.cli.command('rebuild-stats')
+@click.option('--from', 'start', help='First day to rebuild (YYYY-MM-DD)')
+@click.option('--to', 'end', help='Last day to rebuild, inclusive (YYYY-MM-DD)')
+def rebuild_stats_command(start, end):
+    """Recompute the daily revenue rollup from the payment table."""
+    try:
+        start_day = date.fromisoformat(start) if start else None
+        end_day = date.fromisoformat(end) + timedelta(days=1) if end else None
+    except ValueError:
+        raise click.BadParameter('Dates must be YYYY-MM-DD')
+    
+    with db.engine.begin() as conn:
+        rows = rebuild_daily_stats(conn, start_day, end_day)
+    click.echo(f"Rebuilt {rows} payment stat rows")
+
+@bp.cli.command('archive')
+@click.option('--days', type=float, default=ARCHIVE_AFTER_DAYS, show_default=True,
+              help='Archive settled payments older than this many days')
+@click.option('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, show_default=True)
+def archive_command(days, batch_size):
+    """Move completed and failed payments into the archive table."""
+    moved = archive_payments(db.engine, datetime.utcnow() - timedelta(days=days), batch_size)
+    click.echo(f"Archived {moved} payments")
+
+@bp.cli.command('purge-idempotency-keys')
+def purge_idempotency_keys_command():
+    """Delete expired idempotency keys."""
+    click.echo(f"Deleted {purge_expired_keys()} expired idempotency keys")
+
 if __name__ == '__main__':
-    print("🚀 Starting Payment Service...")
-    print(f"Database path: {db_path}")
+    log.info('Starting Payment Service', database=db_path)
+    app = create_app()
+    warm_up(app)
     app.run(debug=True, port=5004, host='0.0.0.0')
\ No newline at end of file
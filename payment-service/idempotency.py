@@ -0,0 +1,131 @@
+import hashlib
+import os
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, jsonify, request
+from sqlalchemy import delete, insert, update
+from sqlalchemy.exc import IntegrityError
+
+from common.log import get_logger
+from model import db, IdempotencyKey
+
+# Idempotency-Key support for POST endpoints.
+#
+# The first request with a key claims it by inserting a row with no
+# response yet, in its own short transaction, so a concurrent duplicate hits
+# the primary key instead of running the handler a second time. Once the
+# handler returns, its response is stored on the row. Later requests with
+# the same key and body get the stored response back. Requests whose key is
+# still being processed get a 409 with Retry-After.
+#
+# 5xx responses are not stored, so the client can retry them. A claim whose
+# request died halfway is taken over after IDEMPOTENCY_LOCK_TIMEOUT seconds.
+
+KEY_TTL = timedelta(hours=float(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', '24')))
+LOCK_TIMEOUT = timedelta(seconds=float(os.environ.get('IDEMPOTENCY_LOCK_TIMEOUT', '60')))
+MAX_KEY_LENGTH = 255
+HEADER = 'Idempotency-Key'
+
+log = get_logger('idempotency')
+
+
+def request_fingerprint():
+    digest = hashlib.sha256()
+    digest.update(f'{request.method} {request.path}\n'.encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def claim(key, fingerprint):
+    # Returns None when this request now owns the key, otherwise the
+    # existing row.
+    now = datetime.utcnow()
+    try:
+        db.session.execute(insert(IdempotencyKey).values(
+            key=key, request_hash=fingerprint, created_at=now, expires_at=now + KEY_TTL
+        ))
+        db.session.commit()
+        return None
+    except IntegrityError:
+        db.session.rollback()
+
+    existing = db.session.get(IdempotencyKey, key)
+    if existing is None:
+        return claim(key, fingerprint)
+
+    expired = existing.expires_at <= now
+    abandoned = existing.status_code is None and existing.created_at <= now - LOCK_TIMEOUT
+    if expired or abandoned:
+        # Take the key over only if nobody else did in the meantime.
+        taken = db.session.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.key == key, IdempotencyKey.created_at == existing.created_at)
+            .values(request_hash=fingerprint, status_code=None, response_body=None,
+                    created_at=now, expires_at=now + KEY_TTL)
+        ).rowcount
+        db.session.commit()
+        if taken:
+            return None
+        existing = db.session.get(IdempotencyKey, key, populate_existing=True)
+    return existing
+
+
+def replay(existing, fingerprint):
+    if existing.request_hash != fingerprint:
+        return jsonify({'message': f'{HEADER} was already used with a different request'}), 422
+    if existing.status_code is None:
+        response = jsonify({'message': f'A request with this {HEADER} is still being processed'})
+        response.headers['Retry-After'] = '1'
+        return response, 409
+    response = current_app.response_class(existing.response_body, status=existing.status_code,
+                                          mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'message': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'}), 400
+
+        fingerprint = request_fingerprint()
+        existing = claim(key, fingerprint)
+        if existing is not None:
+            log.info('Replaying idempotent response', idempotency_key=key)
+            return replay(existing, fingerprint)
+
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except Exception:
+            release(key)
+            raise
+
+        if response.status_code >= 500:
+            release(key)
+        else:
+            db.session.execute(
+                update(IdempotencyKey).where(IdempotencyKey.key == key)
+                .values(status_code=response.status_code, response_body=response.get_data(as_text=True))
+            )
+            db.session.commit()
+        return response
+    return wrapper
+
+
+def release(key):
+    db.session.rollback()
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key))
+    db.session.commit()
+
+
+def purge_expired_keys():
+    deleted = db.session.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.expires_at <= datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    return deleted
@@ -1,5 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from datetime import datetime, time
+from sqlalchemy import func, insert, inspect, select
+from common.archive import ARCHIVE_BATCH_SIZE, all_rows, archive_rows, archive_table
+from common.migrations import add_column, autoincrement_ids, create_index, create_table
+from common.serialization import ModelSerializer
 
 db = SQLAlchemy()
 
@@ -13,6 +17,171 @@ class Payment(db.Model):
     status = db.Column(db.String(20), nullable=False, default='pending')  # pending, completed, failed
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     paid_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        # payment history per user, newest first
+        db.Index('ix_payment_user_created', 'user_id', 'created_at', 'id'),
+        # one payment per appointment, enforced by the database rather than
+        # a check-then-insert; also serves /payments/appointment/<id>
+        db.Index('ix_payment_appointment', 'appointment_id', unique=True),
+        # unfiltered ledger in (created_at, id) order
+        db.Index('ix_payment_created', 'created_at', 'id'),
+        # ?status=pending dashboards
+        db.Index('ix_payment_status_created', 'status', 'created_at', 'id'),
+        # COUNT/MAX(updated_at) behind the list ETag and Last-Modified
+        db.Index('ix_payment_user_updated', 'user_id', 'updated_at'),
+        db.Index('ix_payment_updated', 'updated_at'),
+        # ids never go back to an archived or deleted row's id
+        {'sqlite_autoincrement': True},
+    )
     
     def __repr__(self):
-        return f'<Payment {self.payment_reference}>'
\ No newline at end of file
+        return f'<Payment {self.payment_reference}>'
+
+payment_serializer = ModelSerializer(Payment)
+
+# Settled and failed payments move here once their last change is older
+# than the archival cutoff; see common/archive.py.
+ARCHIVED_STATUSES = ('completed', 'failed')
+payment_archive = archive_table(
+    Payment.__table__,
+    db.Index('ix_payment_archive_user_created', 'user_id', 'created_at', 'id'),
+    db.Index('ix_payment_archive_appointment', 'appointment_id', unique=True),
+    db.Index('ix_payment_archive_created', 'created_at', 'id'),
+)
+
+def archive_payments(engine, cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    table = Payment.__table__
+    return archive_rows(engine, table, payment_archive, (
+        table.c.status.in_(ARCHIVED_STATUSES) & (table.c.updated_at < cutoff)
+    ), batch_size)
+
+class PaymentDailyStat(db.Model):
+    # Revenue rollup: one row per (created day, method, status), kept in step
+    # with the payment table by stats.StatDeltas in the same transaction.
+    __tablename__ = 'payment_daily_stat'
+    
+    day = db.Column(db.Date, primary_key=True)
+    payment_method = db.Column(db.String(50), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    payment_count = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(db.BigInteger, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<PaymentDailyStat {self.day} {self.payment_method} {self.status}>'
+
+class IdempotencyKey(db.Model):
+    # Stored responses for requests sent with an Idempotency-Key header.
+    # status_code is NULL while the first request is still running.
+    __tablename__ = 'idempotency_key'
+    
+    key = db.Column(db.String(255), primary_key=True)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer)
+    response_body = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<IdempotencyKey {self.key}>'
+
+class OutboxEvent(db.Model):
+    # Appointment status changes waiting to be delivered to
+    # appointment-service, written in the same transaction as the payment
+    # change. Delivered in id order by outbox.OutboxDispatcher.
+    __tablename__ = 'outbox_event'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    payment_id = db.Column(db.Integer, nullable=False)
+    appointment_id = db.Column(db.Integer, nullable=False)
+    payment_status = db.Column(db.String(20), nullable=False)
+    appointment_status = db.Column(db.String(20), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, delivered, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    delivered_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        # the dispatcher's "oldest pending events" scan
+        db.Index('ix_outbox_status_id', 'status', 'id'),
+    )
+    
+    def __repr__(self):
+        return f'<OutboxEvent {self.id} appointment={self.appointment_id}>'
+
+class OutboxLease(db.Model):
+    # Only the worker holding the lease dispatches, which keeps events for
+    # one appointment in order across gunicorn workers.
+    __tablename__ = 'outbox_lease'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    owner = db.Column(db.String(100), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+def rebuild_daily_stats(conn, start=None, end=None):
+    # Recomputes the rollup from the payment table for days in [start, end),
+    # or for everything when no bounds are given. Returns the rows written.
+    # Archived payments still count; the archive table is absent only while
+    # migrations older than it run.
+    stats = PaymentDailyStat.__table__
+    payments = Payment.__table__
+    if inspect(conn).has_table(payment_archive.name):
+        payments = all_rows(payments, payment_archive)
+    day = func.date(payments.c.created_at)
+    source = (
+        select(day, payments.c.payment_method, payments.c.status, func.count(), func.sum(payments.c.amount))
+        .group_by(day, payments.c.payment_method, payments.c.status)
+    )
+    delete = stats.delete()
+    if start:
+        source = source.where(payments.c.created_at >= datetime.combine(start, time.min))
+        delete = delete.where(stats.c.day >= start)
+    if end:
+        source = source.where(payments.c.created_at < datetime.combine(end, time.min))
+        delete = delete.where(stats.c.day < end)
+    
+    conn.execute(delete)
+    return conn.execute(insert(stats).from_select(
+        ['day', 'payment_method', 'status', 'payment_count', 'total_amount'], source
+    )).rowcount
+
+def check_duplicate_payments(conn):
+    duplicates = conn.execute(
+        select(Payment.appointment_id).group_by(Payment.appointment_id).having(func.count() > 1).limit(20)
+    ).scalars().all()
+    if duplicates:
+        raise RuntimeError(
+            f"Cannot make appointment_id unique, appointments with several payments: {duplicates}. "
+            "Resolve them and restart the service."
+        )
+
+MIGRATIONS = [
+    (1, 'Index payments by user, appointment, status and date', [
+        create_index('payment', 'ix_payment_user_created', 'user_id', 'created_at', 'id'),
+        create_index('payment', 'ix_payment_appointment', 'appointment_id'),
+        create_index('payment', 'ix_payment_created', 'created_at', 'id'),
+        create_index('payment', 'ix_payment_status_created', 'status', 'created_at', 'id'),
+    ]),
+    (2, 'Add daily revenue rollup', [create_table(PaymentDailyStat.__table__), rebuild_daily_stats]),
+    (3, 'Make appointment_id unique and add idempotency keys', [
+        check_duplicate_payments,
+        'DROP INDEX IF EXISTS ix_payment_appointment',
+        create_index('payment', 'ix_payment_appointment', 'appointment_id', unique=True),
+        create_table(IdempotencyKey.__table__),
+    ]),
+    (4, 'Add appointment status outbox', [
+        create_table(OutboxEvent.__table__),
+        create_table(OutboxLease.__table__),
+    ]),
+    (5, 'Add payment.updated_at for conditional GET', [
+        add_column('payment', 'updated_at', 'DATETIME'),
+        'UPDATE payment SET updated_at = COALESCE(paid_at, created_at) WHERE updated_at IS NULL',
+        create_index('payment', 'ix_payment_user_updated', 'user_id', 'updated_at'),
+        create_index('payment', 'ix_payment_updated', 'updated_at'),
+    ]),
+    (6, 'Add payment archive', [create_table(payment_archive)]),
+    (7, 'Never reuse payment ids', [autoincrement_ids('payment', 'payment_archive')]),
+]
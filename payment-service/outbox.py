@@ -0,0 +1,200 @@
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from common.log import get_logger
+from model import db, OutboxEvent, OutboxLease
+
+# Transactional outbox for payment -> appointment status changes.
+#
+# Payment writes call record_status_change() before committing, so the
+# event exists exactly when the payment change does. A dispatcher thread in
+# each worker then sends pending events in id order, in batches, to
+# appointment-service's PUT /appointments/bulk/status. Only the worker
+# holding the outbox lease sends, so events for one appointment arrive in
+# the order they were written.
+#
+# A batch that can't be delivered (connection error, timeout, 5xx) is
+# retried with exponential backoff, and later events wait behind it.
+# Per-item rejections (e.g. the appointment was deleted) are marked failed
+# with the reason and are not retried.
+
+# Appointment status implied by a payment reaching this status.
+APPOINTMENT_STATUS_FOR_PAYMENT = {'completed': 'paid'}
+
+ENABLED = os.environ.get('OUTBOX_DISPATCHER', '1').lower() not in ('0', 'false', 'no')
+BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '100'))
+POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', '1'))
+BASE_BACKOFF = float(os.environ.get('OUTBOX_BASE_BACKOFF', '1'))
+MAX_BACKOFF = float(os.environ.get('OUTBOX_MAX_BACKOFF', '60'))
+LEASE_TTL = timedelta(seconds=float(os.environ.get('OUTBOX_LEASE_TTL', '15')))
+RETENTION = timedelta(hours=float(os.environ.get('OUTBOX_RETENTION_HOURS', '72')))
+LEASE_NAME = 'appointment-status'
+
+log = get_logger('outbox')
+
+
+def record_status_change(session, payment_id, appointment_id, old_status, new_status):
+    appointment_status = APPOINTMENT_STATUS_FOR_PAYMENT.get(new_status)
+    if old_status == new_status or appointment_status is None:
+        return False
+    session.add(OutboxEvent(
+        payment_id=payment_id,
+        appointment_id=appointment_id,
+        payment_status=new_status,
+        appointment_status=appointment_status
+    ))
+    return True
+
+
+def backlog():
+    return db.session.execute(
+        select(func.count()).select_from(OutboxEvent).where(OutboxEvent.status == 'pending')
+    ).scalar()
+
+
+class OutboxDispatcher:
+    def __init__(self, client):
+        self.client = client
+        self.owner = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._last_prune = None
+
+    def notify(self):
+        self._wake.set()
+
+    def start(self):
+        # Runs as a warm-up hook, so it starts once per gunicorn worker.
+        if not ENABLED or (self._thread is not None and self._pid == os.getpid()):
+            return
+        app = current_app._get_current_object()
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._stop.clear()
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, args=(app,), name='outbox-dispatcher', daemon=True)
+        self._thread.start()
+        log.info('Outbox dispatcher started', owner=self.owner)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+        self._release_lease()
+
+    def _run(self, app):
+        while not self._stop.is_set():
+            sent = 0
+            with app.app_context():
+                try:
+                    sent = self.dispatch_once()
+                    self._prune()
+                except Exception:
+                    db.session.rollback()
+                    log.exception('Outbox dispatch error')
+                finally:
+                    db.session.remove()
+            # A full batch means there is probably more waiting.
+            if sent < BATCH_SIZE:
+                self._wake.wait(POLL_INTERVAL)
+                self._wake.clear()
+
+    def _acquire_lease(self):
+        now = datetime.utcnow()
+        taken = db.session.execute(
+            update(OutboxLease)
+            .where(OutboxLease.name == LEASE_NAME,
+                   (OutboxLease.owner == self.owner) | (OutboxLease.expires_at < now))
+            .values(owner=self.owner, expires_at=now + LEASE_TTL)
+        ).rowcount
+        if not taken:
+            try:
+                db.session.execute(insert(OutboxLease).values(
+                    name=LEASE_NAME, owner=self.owner, expires_at=now + LEASE_TTL
+                ))
+                taken = 1
+            except IntegrityError:
+                db.session.rollback()
+                return False
+        db.session.commit()
+        return bool(taken)
+
+    def _release_lease(self):
+        db.session.execute(
+            delete(OutboxLease).where(OutboxLease.name == LEASE_NAME, OutboxLease.owner == self.owner)
+        )
+        db.session.commit()
+
+    def dispatch_once(self):
+        if not self._acquire_lease():
+            return 0
+
+        events = db.session.execute(
+            select(OutboxEvent).where(OutboxEvent.status == 'pending').order_by(OutboxEvent.id).limit(BATCH_SIZE)
+        ).scalars().all()
+        now = datetime.utcnow()
+        if not events or events[0].next_attempt_at > now:
+            db.session.rollback()
+            return 0
+
+        updates = [{'id': event.appointment_id, 'status': event.appointment_status, 'event_id': event.id}
+                   for event in events]
+        try:
+            response = self.client.put('/appointments/bulk/status', json={'updates': updates})
+            if response.status_code not in (200, 400):
+                raise RuntimeError(f'appointment-service returned {response.status_code}')
+            results = response.json()['results']
+            if len(results) != len(events):
+                raise RuntimeError('appointment-service returned a result count that does not match the batch')
+        except Exception as e:
+            self._retry_later(events, str(e), now)
+            return 0
+
+        delivered = 0
+        for event, result in zip(events, results):
+            event.attempts += 1
+            if 'error' in result:
+                event.status = 'failed'
+                event.last_error = str(result['error'])[:500]
+                log.warning('Outbox event rejected', event_id=event.id, appointment_id=event.appointment_id,
+                            error=result['error'])
+            else:
+                event.status = 'delivered'
+                event.delivered_at = now
+                event.last_error = None
+                delivered += 1
+        db.session.commit()
+        log.info('Delivered appointment status events', delivered=delivered, batch=len(events))
+        return len(events)
+
+    def _retry_later(self, events, error, now):
+        attempts = events[0].attempts + 1
+        delay = min(BASE_BACKOFF * 2 ** (attempts - 1), MAX_BACKOFF)
+        for event in events:
+            event.attempts += 1
+            event.last_error = error[:500]
+            event.next_attempt_at = now + timedelta(seconds=delay)
+        db.session.commit()
+        log.warning('Outbox delivery failed', attempt=attempts, retry_in=round(delay, 1), error=error)
+
+    def _prune(self):
+        now = datetime.utcnow()
+        if self._last_prune is not None and now - self._last_prune < timedelta(minutes=10):
+            return
+        self._last_prune = now
+        db.session.execute(
+            delete(OutboxEvent).where(OutboxEvent.status == 'delivered', OutboxEvent.delivered_at < now - RETENTION)
+        )
+        db.session.commit()
+
@@ -0,0 +1,104 @@
+from datetime import timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from model import PaymentDailyStat
+
+# Incremental revenue rollups.
+#
+# Every write to a payment records what it adds to or moves between
+# (day, payment_method, status) buckets, and flush() folds those deltas
+# into payment_daily_stat with one upsert before the caller commits. Report
+# queries then read one row per bucket instead of scanning payments.
+# Payments are bucketed by the UTC day they were created, so a status
+# change only moves a payment between status buckets of the same day.
+
+GROUP_COLUMNS = {
+    'day': PaymentDailyStat.day,
+    'payment_method': PaymentDailyStat.payment_method,
+    'status': PaymentDailyStat.status,
+}
+
+
+class StatDeltas:
+    def __init__(self):
+        self._totals = {}
+
+    def add(self, created_at, payment_method, status, amount, sign=1):
+        key = (created_at.date(), payment_method, status)
+        count, total = self._totals.get(key, (0, 0))
+        self._totals[key] = (count + sign, total + sign * amount)
+
+    def move(self, created_at, payment_method, amount, old_status, new_status):
+        if old_status != new_status:
+            self.add(created_at, payment_method, old_status, amount, sign=-1)
+            self.add(created_at, payment_method, new_status, amount)
+
+    def flush(self, session):
+        rows = [
+            {'day': day, 'payment_method': method, 'status': status,
+             'payment_count': count, 'total_amount': total}
+            for (day, method, status), (count, total) in self._totals.items()
+            if count or total
+        ]
+        self._totals = {}
+        if not rows:
+            return
+        
+        dialect = session.get_bind().dialect.name
+        statement = (postgresql_insert if dialect == 'postgresql' else sqlite_insert)(PaymentDailyStat)
+        statement = statement.on_conflict_do_update(
+            index_elements=['day', 'payment_method', 'status'],
+            set_={
+                'payment_count': PaymentDailyStat.payment_count + statement.excluded.payment_count,
+                'total_amount': PaymentDailyStat.total_amount + statement.excluded.total_amount,
+            }
+        )
+        session.execute(statement, rows)
+
+
+def parse_group_by(raw):
+    group_by = [name.strip() for name in (raw or 'day').split(',') if name.strip()]
+    unknown = [name for name in group_by if name not in GROUP_COLUMNS]
+    if unknown:
+        raise ValueError(f"Invalid group_by: {', '.join(unknown)}. Use {', '.join(GROUP_COLUMNS)}")
+    return list(dict.fromkeys(group_by))
+
+
+def day_bounds(start, end):
+    # The rollup is per day: a start bound counts from its own day and an
+    # exclusive end bound with a time of day still includes that day.
+    start_day = start.date() if start else None
+    end_day = None
+    if end:
+        end_day = end.date() if end.time() == end.time().min else end.date() + timedelta(days=1)
+    return start_day, end_day
+
+
+def query_stats(session, start_day, end_day, group_by, status=None, payment_method=None):
+    columns = [GROUP_COLUMNS[name] for name in group_by]
+    payment_count = func.sum(PaymentDailyStat.payment_count)
+    total_amount = func.sum(PaymentDailyStat.total_amount)
+    query = select(*columns, payment_count, total_amount).having(payment_count != 0)
+    if columns:
+        query = query.group_by(*columns).order_by(*columns)
+    if start_day:
+        query = query.where(PaymentDailyStat.day >= start_day)
+    if end_day:
+        query = query.where(PaymentDailyStat.day < end_day)
+    if status:
+        query = query.where(PaymentDailyStat.status == status)
+    if payment_method:
+        query = query.where(PaymentDailyStat.payment_method == payment_method)
+    
+    stats = []
+    for row in session.execute(query):
+        entry = dict(zip(group_by, row[:len(group_by)]))
+        if 'day' in entry:
+            entry['day'] = entry['day'].isoformat()
+        entry['count'] = int(row[-2])
+        entry['amount'] = int(row[-1])
+        stats.append(entry)
+    return stats
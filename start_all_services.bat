@@ -13,17 +13,18 @@ start cmd /k "cd treatment-service && python app.py"
 echo Starting Payment Service on port 5004...
 start cmd /k "cd payment-service && python app.py"
 
+echo Starting API Gateway on port 5000...
+start cmd /k "cd gateway-service && python app.py"
+
 echo Waiting for services to start...
 timeout /t 5
 
-echo Starting Frontend HTTP Server on port 8000...
-start cmd /k "python -m http.server 8000"
-
 echo.   
 echo =========================================
 echo All GlowCare Services Started!
 echo =========================================
-echo Frontend: http://localhost:8000
+echo Frontend: http://localhost:5000 (served by the API Gateway)
+echo API Gateway: http://localhost:5000
 echo User Service: http://localhost:5001
 echo Appointment Service: http://localhost:5002  
 echo Treatment Service: http://localhost:5003
@@ -248,6 +248,23 @@ curl -s -X GET "%PAYMENT_SERVICE%/payments/999"
 echo.
 echo ---
 
+REM ===========================================
+REM BATCH TESTS
+REM ===========================================
+echo 📦 Testing Batch Requests...
+echo.
+
+echo 12. Atomic Batches
+echo Testing: Confirm and Read Payment in One Atomic Batch (all should be 200)
+curl -s -X POST "%PAYMENT_SERVICE%/batch" -H "Content-Type: application/json" -d "{\"atomic\":true,\"requests\":[{\"method\":\"POST\",\"path\":\"/payments/1/confirm\"},{\"method\":\"GET\",\"path\":\"/payments/1\"}]}"
+echo.
+echo ---
+
+echo Testing: Update and Read Appointment in One Atomic Batch (all should be 200)
+curl -s -X POST "%APPOINTMENT_SERVICE%/batch" -H "Content-Type: application/json" -d "{\"atomic\":true,\"requests\":[{\"method\":\"PUT\",\"path\":\"/appointments/1\",\"body\":{\"status\":\"confirmed\"}},{\"method\":\"GET\",\"path\":\"/appointments/1\"}]}"
+echo.
+echo ---
+
 REM ===========================================
 REM SUMMARY
 REM ===========================================
@@ -259,6 +276,7 @@ echo ✅ Treatment Service: CRUD Operations
 echo ✅ Appointment Service: Booking, Status Management
 echo ✅ Payment Service: Payment Processing, Status Updates
 echo ✅ Error Handling: Invalid inputs and edge cases
+echo ✅ Batch: Atomic batches with reads and writes
 echo.
 echo 🎉 All microservices tests completed!
 echo Check the responses above for any errors or unexpected behavior.
@@ -1,19 +1,34 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, current_app, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from model import db, Treatment
+import hashlib
+import os
+import sys
+import threading
+import time
 
-app = Flask(__name__)
-CORS(app)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///treatments.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-db.init_app(app)
+from common.batch import init_batch
+from common.compression import init_compression
+from common.http_client import ServiceClient
+from common.database import database_config, init_database
+from common.log import get_logger, init_logging
+from common.metrics import init_metrics
+from common.migrations import run_migrations
+from common.serialization import init_json
+from common.serving import env_url, on_shutdown, on_warmup, warm_up_database
+from model import db, Treatment, MIGRATIONS, treatment_serializer
 
-APPOINTMENT_SERVICE_URL = 'http://localhost:5002'
+log = get_logger('treatment')
 
-with app.app_context():
-    db.create_all()
+APPOINTMENT_SERVICE_URL = env_url('APPOINTMENT_SERVICE_URL', 'http://localhost:5002')
+
+appointment_client = ServiceClient('appointment-service', APPOINTMENT_SERVICE_URL)
+
+bp = Blueprint('treatment', __name__)
+
+def seed_default_treatments():
     if not Treatment.query.first():
         default_treatments = [
             Treatment(name='Facial Treatment', description='Deep cleansing and moisturizing facial', price=150000, duration=60),
@@ -25,65 +40,171 @@ with app.app_context():
         for treatment in default_treatments:
             db.session.add(treatment)
         db.session.commit()
-        print("Default treatments added to database")
+        log.info('Default treatments added to database')
+
+def create_app(config=None):
+    app = Flask(__name__)
+    CORS(app)
+    init_logging(app, 'treatment-service')
+    init_json(app)
+    init_compression(app)
+    app.config.update(database_config('sqlite:///treatments.db'))
+    if config:
+        app.config.update(config)
+    
+    init_database(app, db)
+    init_metrics(app, 'treatment-service', db)
+    
+    with app.app_context():
+        run_migrations(db.engine, db.metadata, MIGRATIONS)
+        seed_default_treatments()
+    
+    app.register_blueprint(bp)
+    init_batch(app, db)
+    on_warmup(app, warm_up_database(db))
+    on_warmup(app, lambda: catalog_cache.get(load_catalog))
+    on_shutdown(app, appointment_client.close)
+    return app
+
+MAX_BATCH_IDS = 500
+
+class CatalogCache:
+    # Serialized GET /treatments body plus its ETag. Writes in this process
+    # invalidate it immediately; the TTL bounds staleness when other worker
+    # processes change the catalog.
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._version = 0
+        self._entry = None  # (body, etag, loaded_at)
+
+    def peek(self):
+        entry = self._entry
+        if entry and time.monotonic() - entry[2] < self.ttl:
+            return entry
+        return None
+
+    def get(self, loader):
+        entry = self.peek()
+        if entry:
+            return entry
+        with self._lock:
+            version = self._version
+        body = loader()
+        entry = (body, hashlib.sha256(body).hexdigest()[:32], time.monotonic())
+        with self._lock:
+            # Don't publish a body loaded before a concurrent invalidation.
+            if version == self._version:
+                self._entry = entry
+        return entry
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+            self._entry = None
+
+catalog_cache = CatalogCache(ttl=float(os.environ.get('TREATMENT_CACHE_TTL', '30')))
 
-@app.route('/health', methods=['GET'])
+def load_catalog():
+    fields = treatment_serializer.fields
+    rows = treatment_serializer.project(Treatment.query, fields).all()
+    return current_app.json.dumps(treatment_serializer.dump_many(rows, fields)).encode()
+
+def catalog_response(body, etag):
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def parse_ids(raw):
+    ids = {int(part) for part in raw.split(',') if part.strip()}
+    if len(ids) > MAX_BATCH_IDS:
+        raise ValueError(f'At most {MAX_BATCH_IDS} ids per request')
+    return ids
+
+def parse_capacity(raw):
+    # How many of this treatment can run at once; None falls back to the
+    # appointment service's TREATMENT_CAPACITY.
+    if raw is None:
+        return None
+    capacity = int(raw)
+    if capacity < 1:
+        raise ValueError('capacity must be positive')
+    return capacity
+
+@bp.route('/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy', 'service': 'treatment-service'}), 200
 
-@app.route('/', methods=['GET'])
+@bp.route('/', methods=['GET'])
 def home():
     return jsonify({
         'message': 'GlowCare Treatment Service',
         'version': '1.0.0',
         'endpoints': {
             'health': '/health',
-            'treatments': '/treatments (GET/POST)',
+            'metrics': '/metrics (Prometheus)',
+            'batch': '/batch (POST, several requests in one call)',
+            'treatments': '/treatments (GET/POST, GET ?ids=1,2,3 for a batch lookup, ?fields=id,name,...)',
             'treatment': '/treatments/<id> (GET/PUT/DELETE)',
             'book': '/treatments/<id>/book (POST)'
         }
     }), 200
 
-@app.route('/treatments', methods=['GET'])
+@bp.route('/treatments', methods=['GET'])
 def get_treatments():
     try:
-        treatments = Treatment.query.all()
-        result = []
-        for treatment in treatments:
-            result.append({
-                'id': treatment.id,
-                'name': treatment.name,
-                'description': treatment.description,
-                'price': treatment.price,
-                'duration': treatment.duration,
-                'created_at': treatment.created_at.isoformat()
-            })
-        return jsonify(result)
-    except Exception as e:
-        print(f"Error fetching treatments: {str(e)}")
+        ids = request.args.get('ids')
+        raw_fields = request.args.get('fields')
+        try:
+            fields = treatment_serializer.parse_fields(raw_fields)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
+        if ids is not None:
+            try:
+                ids = parse_ids(ids)
+            except ValueError as e:
+                return jsonify({'message': f'Invalid ids: {str(e)}'}), 400
+            if not ids:
+                return jsonify([])
+            query = treatment_serializer.project(Treatment.query, fields).filter(Treatment.id.in_(ids))
+            return jsonify(treatment_serializer.dump_many(query.all(), fields))
+        
+        # Only the full catalog is cached; a projection is read directly.
+        if raw_fields:
+            rows = treatment_serializer.project(Treatment.query, fields).all()
+            return jsonify(treatment_serializer.dump_many(rows, fields))
+        
+        # Served from memory while cached, so a matching If-None-Match
+        # becomes a 304 without a database round trip.
+        body, etag, _ = catalog_cache.get(load_catalog)
+        return catalog_response(body, etag).make_conditional(request)
+    except Exception:
+        log.exception('Error fetching treatments')
         return jsonify({'message': 'Failed to fetch treatments'}), 500
 
-@app.route('/treatments/<int:treatment_id>', methods=['GET'])
+@bp.route('/treatments/<int:treatment_id>', methods=['GET'])
 def get_treatment(treatment_id):
     try:
-        treatment = Treatment.query.get_or_404(treatment_id)
-        return jsonify({
-            'id': treatment.id,
-            'name': treatment.name,
-            'description': treatment.description,
-            'price': treatment.price,
-            'duration': treatment.duration,
-            'created_at': treatment.created_at.isoformat()
-        })
+        fields = treatment_serializer.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    try:
+        treatment = treatment_serializer.project(Treatment.query, fields).filter(
+            Treatment.id == treatment_id
+        ).first_or_404()
+        return jsonify(treatment_serializer.dump_row(treatment, fields))
     except Exception as e:
-        print(f"Error fetching treatment: {str(e)}")
+        log.warning('Error fetching treatment', treatment_id=treatment_id, error=str(e))
         return jsonify({'message': 'Treatment not found'}), 404
 
-@app.route('/treatments', methods=['POST'])
+@bp.route('/treatments', methods=['POST'])
 def create_treatment():
     try:
         data = request.get_json()
-        print(f"Received treatment data: {data}")
         
         if not data:
             return jsonify({'message': 'No data provided'}), 400
@@ -93,15 +214,22 @@ def create_treatment():
             if field not in data:
                 return jsonify({'message': f'Missing required field: {field}'}), 400
         
+        try:
+            capacity = parse_capacity(data.get('capacity'))
+        except (TypeError, ValueError) as e:
+            return jsonify({'message': f'Invalid capacity: {str(e)}'}), 400
+        
         treatment = Treatment(
             name=data['name'],
             description=data.get('description', ''),
             price=int(data['price']),
-            duration=int(data['duration'])
+            duration=int(data['duration']),
+            capacity=capacity
         )
         
         db.session.add(treatment)
         db.session.commit()
+        catalog_cache.invalidate()
         
         return jsonify({
             'message': 'Treatment created successfully',
@@ -109,11 +237,11 @@ def create_treatment():
         }), 201
         
     except Exception as e:
-        print(f"Error creating treatment: {str(e)}")
+        log.exception('Error creating treatment')
         db.session.rollback()
         return jsonify({'message': f'Failed to create treatment: {str(e)}'}), 500
 
-@app.route('/treatments/<int:treatment_id>', methods=['PUT'])
+@bp.route('/treatments/<int:treatment_id>', methods=['PUT'])
 def update_treatment(treatment_id):
     try:
         treatment = Treatment.query.get_or_404(treatment_id)
@@ -127,30 +255,37 @@ def update_treatment(treatment_id):
             treatment.price = int(data['price'])
         if 'duration' in data:
             treatment.duration = int(data['duration'])
+        if 'capacity' in data:
+            try:
+                treatment.capacity = parse_capacity(data['capacity'])
+            except (TypeError, ValueError) as e:
+                return jsonify({'message': f'Invalid capacity: {str(e)}'}), 400
         
         db.session.commit()
+        catalog_cache.invalidate()
         return jsonify({'message': 'Treatment updated successfully'})
         
     except Exception as e:
-        print(f"Error updating treatment: {str(e)}")
+        log.exception('Error updating treatment')
         db.session.rollback()
         return jsonify({'message': f'Failed to update treatment: {str(e)}'}), 500
 
-@app.route('/treatments/<int:treatment_id>', methods=['DELETE'])
+@bp.route('/treatments/<int:treatment_id>', methods=['DELETE'])
 def delete_treatment(treatment_id):
     try:
         treatment = Treatment.query.get_or_404(treatment_id)
         db.session.delete(treatment)
         db.session.commit()
+        catalog_cache.invalidate()
         
         return jsonify({'message': 'Treatment deleted successfully'})
         
     except Exception as e:
-        print(f"Error deleting treatment: {str(e)}")
+        log.exception('Error deleting treatment')
         db.session.rollback()
         return jsonify({'message': f'Failed to delete treatment: {str(e)}'}), 500
 
-@app.route('/treatments/<int:treatment_id>/book', methods=['POST'])
+@bp.route('/treatments/<int:treatment_id>/book', methods=['POST'])
 def book_treatment(treatment_id):
     treatment = Treatment.query.get_or_404(treatment_id)
     data = request.get_json()
@@ -161,16 +296,16 @@ def book_treatment(treatment_id):
         'appointment_date': data['appointment_date']
     }
     
-    response = requests.post(f'{APPOINTMENT_SERVICE_URL}/appointments', json=appointment_data)
+    response = appointment_client.post('/appointments', json=appointment_data)
     
     if response.status_code == 201:
         return jsonify({
             'message': f'Appointment booked for {treatment.name}',
-            'appointment_id': response.json()['appointment_id'],
+            'appointment_id': response.json()['appointment']['id'],
             'treatment_price': treatment.price
         }), 201
     else:
         return jsonify({'message': 'Failed to book appointment'}), 400
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5003)
\ No newline at end of file
+    create_app().run(debug=True, port=5003)
\ No newline at end of file
@@ -1,5 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from common.migrations import add_column
+from common.serialization import ModelSerializer
 
 db = SQLAlchemy()
 
@@ -9,7 +11,15 @@ class Treatment(db.Model):
     description = db.Column(db.Text)
     price = db.Column(db.Integer, nullable=False)  # Price in Rupiah
     duration = db.Column(db.Integer, nullable=False)  # Duration in minutes
+    capacity = db.Column(db.Integer)  # Bookings that can run at once; NULL uses the default
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def __repr__(self):
-        return f'<Treatment {self.name}>'
\ No newline at end of file
+        return f'<Treatment {self.name}>'
+
+treatment_serializer = ModelSerializer(Treatment)
+
+# (version, description, steps) tuples applied by common.migrations.run_migrations
+MIGRATIONS = [
+    (1, 'Add treatment capacity', [add_column('treatment', 'capacity', 'INTEGER')]),
+]
@@ -1,27 +1,177 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, current_app, g, request, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity
-import requests
-from model import db, User
+from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt, get_jwt_identity
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime
+from functools import partial
+from urllib.parse import parse_qsl, urlencode
 from flask_cors import CORS
 
-app = Flask(__name__)
-CORS(app, origins=["*"])
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///users.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['JWT_SECRET_KEY'] = 'your-secret-key'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-db.init_app(app)
-jwt = JWTManager(app)
+from common.batch import WRITE_METHODS, parse_batch, run_local_batch
+from common.compression import init_compression
+from common.http_client import ServiceClient, fan_out, shutdown_fan_out
+from common.database import database_config, init_database
+from common.log import get_logger, init_logging
+from common.metrics import init_metrics
+from common.migrations import run_migrations
+from common.pagination import wants_stream
+from common.serialization import init_json
+from common.serving import env_url, on_shutdown, on_warmup, warm_up_database
+from model import db, User, MIGRATIONS
+from passwords import PasswordHashPoolBusy, hash_pool, hash_password, needs_rehash, verify_password
 
-APPOINTMENT_SERVICE_URL = 'http://localhost:5002'
-PAYMENT_SERVICE_URL = 'http://localhost:5004'
+jwt = JWTManager()
+log = get_logger('user')
 
-with app.app_context():
-    db.create_all()
+APPOINTMENT_SERVICE_URL = env_url('APPOINTMENT_SERVICE_URL', 'http://localhost:5002')
+PAYMENT_SERVICE_URL = env_url('PAYMENT_SERVICE_URL', 'http://localhost:5004')
+TREATMENT_SERVICE_URL = env_url('TREATMENT_SERVICE_URL', 'http://localhost:5003')
 
-@app.route('/', methods=['GET'])
+appointment_client = ServiceClient('appointment-service', APPOINTMENT_SERVICE_URL)
+payment_client = ServiceClient('payment-service', PAYMENT_SERVICE_URL)
+treatment_client = ServiceClient('treatment-service', TREATMENT_SERVICE_URL)
+
+BULK_READ_TIMEOUT = float(os.environ.get('BULK_READ_TIMEOUT', '60'))
+# Upper bound for the whole dashboard fan-out; an upstream slower than this
+# is left out of the response instead of holding it up.
+DASHBOARD_TIMEOUT = float(os.environ.get('DASHBOARD_TIMEOUT', '3'))
+BATCH_TIMEOUT = float(os.environ.get('BATCH_TIMEOUT', '30'))
+# POST /batch sub-requests whose path starts with one of these prefixes
+# (same as the gateway's) go to that service; the rest run here.
+BATCH_UPSTREAMS = {
+    'appointment': appointment_client,
+    'payment': payment_client,
+    'treatment': treatment_client,
+}
+# The sub-requests POST /batch forwards to those services, as (service,
+# method, path pattern, roles or None for anyone, patient scope). They
+# mirror the proxy routes below, and the scope keeps a patient to their
+# own records the same way those routes do:
+#   query - ?user_id= is set to the patient
+#   body  - the body's user_id is set to the patient (and an
+#           Idempotency-Key is scoped to them, as in /make-payment)
+#   items - user_id is set on every item of a bulk body
+#   owner - the record is looked up first and must be the patient's
+BATCH_ROUTES = [
+    ('appointment', 'GET', r'/appointments', None, 'query'),
+    ('appointment', 'GET', r'/appointments/\d+', None, 'owner'),
+    ('appointment', 'POST', r'/appointments', ('pasien',), 'body'),
+    ('appointment', 'POST', r'/appointments/bulk', ('admin', 'pasien'), 'items'),
+    ('appointment', 'PUT', r'/appointments/\d+', ('admin', 'pasien'), 'owner'),
+    ('appointment', 'DELETE', r'/appointments/\d+', ('admin', 'pasien'), 'owner'),
+    ('appointment', 'POST', r'/appointments/\d+/cancel', ('admin', 'pasien'), 'owner'),
+    ('appointment', 'PUT', r'/appointments/bulk/status', ('admin',), None),
+    ('payment', 'GET', r'/payments', None, 'query'),
+    ('payment', 'GET', r'/payments/\d+', None, 'owner'),
+    ('payment', 'POST', r'/payments', ('pasien',), 'body'),
+    ('payment', 'PUT', r'/payments/\d+/status', ('admin',), None),
+    ('payment', 'POST', r'/payments/\d+/confirm', ('admin',), None),
+    ('treatment', 'GET', r'/treatments(/\d+)?', None, None),
+]
+
+bp = Blueprint('user', __name__)
+
+def create_app(config=None):
+    app = Flask(__name__)
+    CORS(app, origins=["*"])
+    init_logging(app, 'user-service')
+    init_json(app)
+    init_compression(app)
+    app.config.update(database_config('sqlite:///users.db'))
+    app.config['JWT_SECRET_KEY'] = 'your-secret-key'
+    if config:
+        app.config.update(config)
+    
+    init_database(app, db)
+    init_metrics(app, 'user-service', db)
+    jwt.init_app(app)
+    
+    with app.app_context():
+        run_migrations(db.engine, db.metadata, MIGRATIONS)
+    
+    app.register_blueprint(bp)
+    on_warmup(app, warm_up_database(db))
+    on_warmup(app, hash_pool.warm_up)
+    on_shutdown(app, hash_pool.shutdown)
+    on_shutdown(app, appointment_client.close)
+    on_shutdown(app, payment_client.close)
+    on_shutdown(app, treatment_client.close)
+    on_shutdown(app, shutdown_fan_out)
+    return app
+
+class UserCache:
+    # Small TTL + LRU cache of user rows as plain dicts, for the lookups
+    # that still need more than the token claims carry.
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[1] > self.ttl:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[0]
+
+    def put(self, user_id, user):
+        with self._lock:
+            self._entries[user_id] = (user, time.monotonic())
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+user_cache = UserCache(
+    ttl=float(os.environ.get('USER_CACHE_TTL', '60')),
+    max_size=int(os.environ.get('USER_CACHE_SIZE', '1024'))
+)
+
+def load_user(user_id):
+    user = user_cache.get(user_id)
+    if user is None:
+        row = User.query.get(user_id)
+        if row is None:
+            return None
+        user = {'id': row.id, 'name': row.name, 'email': row.email, 'role': row.role}
+        user_cache.put(user_id, user)
+    return user
+
+def hash_pool_busy():
+    response = jsonify({'message': 'Server is busy, please try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def current_user_id():
+    return int(get_jwt_identity())
+
+def current_user():
+    # Tokens carry role and name as claims, so authorization needs no
+    # database lookup. Tokens issued before the claims existed fall back
+    # to the cache.
+    claims = get_jwt()
+    user_id = current_user_id()
+    if 'role' in claims:
+        return {'id': user_id, 'name': claims.get('name'), 'role': claims['role']}
+    return load_user(user_id)
+
+@bp.route('/', methods=['GET'])
 def home():
     return jsonify({
         'message': 'GlowCare User Service API',
@@ -29,48 +179,52 @@ def home():
         'status': 'running',
         'endpoints': {
             'health': 'GET /health',
+            'metrics': 'GET /metrics (Prometheus)',
             'register': 'POST /register',
             'login': 'POST /login',
             'profile': 'GET/PUT /profile (auth required)',
             'appointments': 'GET /appoin#tments (auth required)',
             'book_appointment': 'POST /book-appointment (auth required)',
-            'make_payment': 'POST /make-payment (auth required)'
+            'bulk_appointments': 'POST /appointments/bulk (auth required)',
+            'make_payment': 'POST /make-payment (auth required)',
+            'dashboard': 'GET /dashboard (auth required)',
+            'batch': 'POST /batch (auth required, several requests in one call)'
         }
     }), 200
 
-@app.route('/register', methods=['POST'])
+@bp.route('/register', methods=['POST'])
 def register():
     try:
         data = request.get_json()
-        print(f"Received registration data: {data}")
 
         if not data or not data.get('email') or not data.get('password') or not data.get('name'):
             return jsonify({'message': 'Missing required fields'}), 400
 
         if User.query.filter_by(email=data['email']).first():
-            print(f"Email {data['email']} already exists.")
+            log.info('Registration rejected', reason='email exists')
             return jsonify({'message': 'Email already exists'}), 400
 
         selected_role = data.get('role', 'pasien')
-        print(f"Role to be saved: {selected_role}")
 
         user = User(
             name=data['name'],
             email=data['email'],
-            password_hash=generate_password_hash(data['password']),
+            password_hash=hash_password(data['password']),
             role=selected_role
         )
 
         db.session.add(user)
         db.session.commit()
-        print(f"User {user.email} with role {user.role} registered successfully.")
+        log.info('User registered', user_id=user.id, role=user.role, sample=True)
 
         return jsonify({'message': 'User registered successfully'}), 201
-    except Exception as e:
-        print(f"Registration error: {str(e)}")
+    except PasswordHashPoolBusy:
+        return hash_pool_busy()
+    except Exception:
+        log.exception('Registration error')
         return jsonify({'message': 'Registration failed'}), 500
 
-@app.route('/login', methods=['POST'])
+@bp.route('/login', methods=['POST'])
 def login():
     try:
         data = request.get_json()
@@ -80,8 +234,14 @@ def login():
             
         user = User.query.filter_by(email=data['email']).first()
         
-        if user and check_password_hash(user.password_hash, data['password']):
-            access_token = create_access_token(identity=user.id)
+        if user and verify_password(user.password_hash, data['password']):
+            if needs_rehash(user.password_hash):
+                user.password_hash = hash_password(data['password'])
+                db.session.commit()
+            access_token = create_access_token(
+                identity=str(user.id),
+                additional_claims={'role': user.role, 'name': user.name}
+            )
             return jsonify({
                 'access_token': access_token,
                 'user_id': user.id,
@@ -90,35 +250,31 @@ def login():
             }), 200
         
         return jsonify({'message': 'Invalid credentials'}), 401
-    except Exception as e:
-        print(f"Login error: {str(e)}")
+    except PasswordHashPoolBusy:
+        return hash_pool_busy()
+    except Exception:
+        log.exception('Login error')
         return jsonify({'message': 'Login failed'}), 500
 
-@app.route('/profile', methods=['GET'])
+@bp.route('/profile', methods=['GET'])
 @jwt_required()
 def get_profile():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = load_user(current_user_id())
         
         if not user:
             return jsonify({'message': 'User not found'}), 404
         
-        return jsonify({
-            'id': user.id,
-            'name': user.name,
-            'email': user.email,
-            'role': user.role
-        })
-    except Exception as e:
-        print(f"Profile fetch error: {str(e)}")
+        return jsonify(user)
+    except Exception:
+        log.exception('Profile fetch error')
         return jsonify({'message': 'Failed to fetch profile'}), 500
 
-@app.route('/profile', methods=['PUT'])
+@bp.route('/profile', methods=['PUT'])
 @jwt_required()
 def update_profile():
     try:
-        user_id = get_jwt_identity()
+        user_id = current_user_id()
         user = User.query.get(user_id)
         
         if not user:
@@ -130,105 +286,370 @@ def update_profile():
         user.email = data.get('email', user.email)
         
         if 'password' in data and data['password']:
-            user.password_hash = generate_password_hash(data['password'])
+            user.password_hash = hash_password(data['password'])
         
         db.session.commit()
+        user_cache.invalidate(user_id)
         return jsonify({'message': 'Profile updated successfully'})
-    except Exception as e:
-        print(f"Profile update error: {str(e)}")
+    except PasswordHashPoolBusy:
+        return hash_pool_busy()
+    except Exception:
+        log.exception('Profile update error')
         return jsonify({'message': 'Failed to update profile'}), 500
 
-@app.route('/health', methods=['GET'])
+@bp.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy', 'service': 'user-service'}), 200
+    return jsonify({'status': 'healthy', 'service': 'user-service', 'password_hashing': hash_pool.stats()}), 200
 
-@app.route('/book-appointment', methods=['POST'])
+@bp.route('/book-appointment', methods=['POST'])
 @jwt_required()
 def book_appointment():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_user()
+        user_id = user['id']
         
-        if user.role != 'pasien':
+        if user['role'] != 'pasien':
             return jsonify({'message': 'Only patients can book appointments'}), 403
         
         data = request.get_json()
         data['user_id'] = user_id
         
-        response = requests.post(f'{APPOINTMENT_SERVICE_URL}/appointments', json=data)
+        response = appointment_client.post('/appointments', json=data)
         return jsonify(response.json()), response.status_code
-    except Exception as e:
-        print(f"Book appointment error: {str(e)}")
+    except Exception:
+        log.exception('Book appointment error')
         return jsonify({'message': 'Failed to book appointment'}), 500
 
-@app.route('/make-payment', methods=['POST'])
+@bp.route('/appointments/bulk', methods=['POST'])
+@jwt_required()
+def book_appointments_bulk():
+    try:
+        user = current_user()
+        
+        if user['role'] not in ['admin', 'pasien']:
+            return jsonify({'message': 'Unauthorized'}), 403
+        
+        data = request.get_json()
+        items = data.get('appointments') if isinstance(data, dict) else data
+        
+        # Patients can only bulk-book for themselves; admins import for anyone.
+        if user['role'] == 'pasien' and isinstance(items, list):
+            for item in items:
+                if isinstance(item, dict):
+                    item['user_id'] = user['id']
+        
+        response = appointment_client.post(
+            '/appointments/bulk',
+            json=data,
+            timeout=(appointment_client.timeout[0], BULK_READ_TIMEOUT)
+        )
+        return jsonify(response.json()), response.status_code
+    except Exception:
+        log.exception('Bulk appointment error')
+        return jsonify({'message': 'Failed to book appointments'}), 500
+
+@bp.route('/make-payment', methods=['POST'])
 @jwt_required()
 def make_payment():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_user()
+        user_id = user['id']
         
-        if user.role != 'pasien':
+        if user['role'] != 'pasien':
             return jsonify({'message': 'Only patients can make payments'}), 403
         
         data = request.get_json()
         data['user_id'] = user_id
         
-        response = requests.post(f'{PAYMENT_SERVICE_URL}/payments', json=data)
+        # Scope the client's key to the user so two users can't collide.
+        headers = {}
+        if request.headers.get('Idempotency-Key'):
+            headers['Idempotency-Key'] = f"user-{user_id}:{request.headers['Idempotency-Key']}"
+        
+        response = payment_client.post('/payments', json=data, headers=headers)
         return jsonify(response.json()), response.status_code
-    except Exception as e:
-        print(f"Make payment error: {str(e)}")
+    except Exception:
+        log.exception('Make payment error')
         return jsonify({'message': 'Failed to make payment'}), 500
 
-@app.route('/appointments', methods=['GET'])
+@bp.route('/appointments', methods=['GET'])
 @jwt_required()
 def view_appointments():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_user()
+        user_id = user['id']
         
-        print(f"Fetching appointments for user {user_id} with role {user.role}")
+        params = {key: request.args[key] for key in ('limit', 'cursor') if key in request.args}
+        if user['role'] == 'pasien':
+            params['user_id'] = user_id
         
-        if user.role == 'pasien':
-            url = f'{APPOINTMENT_SERVICE_URL}/appointments?user_id={user_id}'
-        else:
-            url = f'{APPOINTMENT_SERVICE_URL}/appointments'
+        log.debug('Fetching appointments', user_id=user_id, role=user['role'], params=params)
         
-        print(f"Making request to: {url}")
-        response = requests.get(url)
+        if wants_stream(request):
+            params['stream'] = '1'
+            response = appointment_client.get('/appointments', params=params, stream=True)
+            return Response(
+                stream_with_context(response.iter_content(chunk_size=64 * 1024)),
+                status=response.status_code,
+                content_type=response.headers.get('Content-Type')
+            )
+        
+        response = appointment_client.get('/appointments', params=params)
         
         if response.status_code == 200:
             appointments = response.json()
-            print(f"Retrieved {len(appointments)} appointments")
+            page = appointments['appointments'] if isinstance(appointments, dict) else appointments
+            log.info('Fetched appointments', user_id=user_id, count=len(page), sample=True)
             return jsonify(appointments), 200
         else:
-            print(f"Error from appointment service: {response.status_code}")
+            log.warning('Appointment service error', status=response.status_code)
             return jsonify({'message': 'Failed to fetch appointments'}), response.status_code
         
-    except Exception as e:
-        print(f"View appointments error: {str(e)}")
+    except Exception:
+        log.exception('View appointments error')
         return jsonify({'message': 'Failed to fetch appointments'}), 500
 
-@app.route('/appointments/<int:appointment_id>', methods=['PUT', 'DELETE'])
+@bp.route('/appointments/<int:appointment_id>', methods=['PUT', 'DELETE'])
 @jwt_required()
 def manage_appointment(appointment_id):
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_user()
+        user_id = user['id']
         
-        if user.role not in ['admin', 'pasien']:
+        if user['role'] not in ['admin', 'pasien']:
             return jsonify({'message': 'Unauthorized'}), 403
         
         if request.method == 'PUT':
             data = request.get_json()
-            response = requests.put(f'{APPOINTMENT_SERVICE_URL}/appointments/{appointment_id}', json=data)
+            response = appointment_client.put(f'/appointments/{appointment_id}', json=data)
         elif request.method == 'DELETE':
-            response = requests.delete(f'{APPOINTMENT_SERVICE_URL}/appointments/{appointment_id}')
+            response = appointment_client.delete(f'/appointments/{appointment_id}')
         
         return jsonify(response.json()), response.status_code
-    except Exception as e:
-        print(f"Manage appointment error: {str(e)}")
+    except Exception:
+        log.exception('Manage appointment error')
         return jsonify({'message': 'Failed to manage appointment'}), 500
 
+def fetch_json(client, path, params=None):
+    response = client.get(path, params=params, timeout=(client.timeout[0], DASHBOARD_TIMEOUT))
+    response.raise_for_status()
+    return response.json()
+
+def build_dashboard(user, appointments, treatments, payments):
+    treatments_by_id = {treatment['id']: treatment for treatment in treatments}
+    payments_by_appointment = {}
+    for payment in payments:
+        payments_by_appointment.setdefault(payment['appointment_id'], payment)
+    
+    now = datetime.now().isoformat()
+    joined = []
+    for appointment in appointments:
+        treatment = treatments_by_id.get(appointment['treatment_id'])
+        joined.append(dict(
+            appointment,
+            treatment=treatment and {key: treatment[key] for key in ('id', 'name', 'price', 'duration')},
+            payment=payments_by_appointment.get(appointment['id'])
+        ))
+    
+    return {
+        'user': user,
+        'appointments': joined,
+        'payments': payments,
+        'summary': {
+            'appointments': len(appointments),
+            'upcoming': sum(1 for appointment in appointments
+                            if appointment['appointment_date'] >= now and appointment['status'] != 'cancelled'),
+            'appointments_by_status': dict(Counter(appointment['status'] for appointment in appointments)),
+            'total_paid': sum(payment['amount'] for payment in payments if payment['status'] == 'completed'),
+            'pending_payments': sum(1 for payment in payments if payment['status'] == 'pending')
+        }
+    }
+
+@bp.route('/dashboard', methods=['GET'])
+@jwt_required()
+def dashboard():
+    try:
+        user_id = current_user_id()
+        user = load_user(user_id)
+        
+        if not user:
+            return jsonify({'message': 'User not found'}), 404
+        
+        # The treatment catalog is small and served from treatment-service's
+        # cache, so it is fetched alongside the other two instead of waiting
+        # for the appointment ids.
+        results, errors = fan_out({
+            'appointments': lambda: fetch_json(appointment_client, '/appointments', {'user_id': user_id}),
+            'treatments': lambda: fetch_json(treatment_client, '/treatments'),
+            'payments': lambda: fetch_json(payment_client, '/payments', {'user_id': user_id}),
+        }, DASHBOARD_TIMEOUT)
+        
+        if len(errors) == 3:
+            log.error('Dashboard upstreams unavailable', user_id=user_id, errors=errors)
+            return jsonify({'message': 'Failed to load dashboard', 'errors': errors}), 502
+        if errors:
+            log.warning('Dashboard is partial', user_id=user_id, errors=errors)
+        
+        body = build_dashboard(
+            user,
+            results.get('appointments', []),
+            results.get('treatments', []),
+            results.get('payments', [])
+        )
+        body['partial'] = bool(errors)
+        body['errors'] = errors
+        return jsonify(body), 200
+    except Exception:
+        log.exception('Dashboard error')
+        return jsonify({'message': 'Failed to load dashboard'}), 500
+
+def batch_target(path):
+    prefix, _, rest = path[1:].partition('/')
+    if prefix in BATCH_UPSTREAMS:
+        return prefix, f'/{rest}'
+    return 'user', path
+
+def batch_error(item, status, message):
+    return {'id': item['id'], 'status': status, 'body': {'message': message}}
+
+def scope_to_patient(user, service, item, scope):
+    # Rewrites item in place; returns an error result when it is refused.
+    path, _, query = item['path'].partition('?')
+    if scope == 'query':
+        params = [(key, value) for key, value in parse_qsl(query, keep_blank_values=True) if key != 'user_id']
+        item['path'] = f"{path}?{urlencode(params + [('user_id', user['id'])])}"
+    elif scope == 'body':
+        if isinstance(item['body'], dict):
+            item['body']['user_id'] = user['id']
+        for key, value in item['headers'].items():
+            if key.lower() == 'idempotency-key':
+                item['headers'][key] = f"user-{user['id']}:{value}"
+    elif scope == 'items':
+        body = item['body']
+        for entry in (body.get('appointments') if isinstance(body, dict) else body) or []:
+            if isinstance(entry, dict):
+                entry['user_id'] = user['id']
+    elif scope == 'owner':
+        record = re.match(r'/\w+/\d+', path).group()
+        try:
+            response = BATCH_UPSTREAMS[service].get(record, params={'fields': 'user_id'})
+        except Exception:
+            log.exception('Batch ownership check failed', service=service, path=record)
+            return batch_error(item, 502, f'{service} service: unavailable')
+        if response.status_code == 200 and response.json().get('user_id') != user['id']:
+            return batch_error(item, 403, 'Unauthorized')
+    return None
+
+def authorize_sub_request(user, service, item):
+    # None when item may be forwarded (after scoping it), else its result.
+    path = item['path'].partition('?')[0].rstrip('/')
+    for rule_service, method, pattern, roles, scope in BATCH_ROUTES:
+        if rule_service == service and method == item['method'] and re.fullmatch(pattern, path):
+            break
+    else:
+        return batch_error(item, 403, 'This request is not allowed in a batch')
+    if roles is not None and user['role'] not in roles:
+        return batch_error(item, 403, 'Unauthorized')
+    if user['role'] == 'pasien' and scope is not None:
+        return scope_to_patient(user, service, item, scope)
+    return None
+
+def reuse_verified_jwt():
+    # Sub-requests run in fresh application contexts; hand them the token
+    # /batch already verified instead of decoding it again for each one.
+    state = {name: g.get(name) for name in g if name.startswith('_jwt_extended_')}
+    def prepare():
+        for name, value in state.items():
+            setattr(g, name, value)
+    return prepare
+
+def skip_jwt_check(view):
+    # User-service views are only ever wrapped by jwt_required.
+    return getattr(view, '__wrapped__', view)
+
+def send_batch(client, items, atomic):
+    response = client.post('/batch', json={'requests': items, 'atomic': atomic},
+                           timeout=(client.timeout[0], BATCH_TIMEOUT))
+    response.raise_for_status()
+    body = response.json()
+    return body['results'], body['rolled_back']
+
+@bp.route('/batch', methods=['POST'])
+@jwt_required()
+def batch():
+    try:
+        try:
+            items, atomic = parse_batch(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
+        # Sub-requests for this service go through its own views and their
+        # checks; forwarded ones are checked here, as the proxy routes would.
+        user = current_user()
+        responses = [None] * len(items)
+        groups = {}
+        for index, item in enumerate(items):
+            service, path = batch_target(item['path'])
+            item = dict(item, path=path)
+            if service != 'user':
+                responses[index] = authorize_sub_request(user, service, item)
+                if responses[index] is not None:
+                    continue
+            groups.setdefault(service, []).append((index, item))
+        
+        refused = [response for response in responses if response is not None]
+        if atomic and refused:
+            return jsonify({'message': f"Request {refused[0]['id']} was refused: {refused[0]['body']['message']}",
+                            'results': refused}), refused[0]['status']
+        
+        written = {service for service, group in groups.items()
+                   if any(item['method'] in WRITE_METHODS for _, item in group)}
+        # Atomicity covers one service's own database. /book-appointment and
+        # /make-payment write elsewhere, so address those services directly.
+        if atomic and len(written) > 1:
+            return jsonify({'message': 'An atomic batch can only write to one service'}), 400
+        
+        # One call per service, all services at once; each service runs
+        # its own sub-requests in order. An atomic group for this service
+        # runs here instead, with no deadline: a timed-out worker thread
+        # could still commit after the batch had reported it failed.
+        app = current_app._get_current_object()
+        prepare = reuse_verified_jwt()
+        calls = {}
+        local = None
+        for service, group in groups.items():
+            group_items = [item for _, item in group]
+            group_atomic = atomic and service in written
+            if service == 'user':
+                local = partial(run_local_batch, app, db, group_items, group_atomic, prepare, skip_jwt_check)
+                if not group_atomic:
+                    calls[service] = local
+                    local = None
+            else:
+                calls[service] = partial(send_batch, BATCH_UPSTREAMS[service], group_items, group_atomic)
+        inline = {'user': local()} if local is not None else {}
+        results, errors = fan_out(calls, BATCH_TIMEOUT + 1)
+        results.update(inline)
+        
+        rolled_back = False
+        for service, group in groups.items():
+            if service in results:
+                group_results, group_rolled_back = results[service]
+                rolled_back |= group_rolled_back
+                for (index, item), result in zip(group, group_results):
+                    responses[index] = dict(result, id=item['id'])
+            else:
+                status = 504 if errors[service] == 'timeout' else 502
+                for index, item in group:
+                    responses[index] = {'id': item['id'], 'status': status,
+                                        'body': {'message': f'{service} service: {errors[service]}'}}
+        
+        log.info('Batch handled', requests=len(items), services=sorted(groups), atomic=atomic,
+                 rolled_back=rolled_back, sample=True)
+        return jsonify({'results': responses, 'atomic': atomic, 'rolled_back': rolled_back}), 200
+    except Exception:
+        log.exception('Batch error')
+        return jsonify({'message': 'Failed to process batch'}), 500
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5001, host='0.0.0.0')
\ No newline at end of file
+    create_app().run(debug=True, port=5001, host='0.0.0.0')
\ No newline at end of file
@@ -1,5 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from common.migrations import alter_column_type
 
 db = SQLAlchemy()
 
@@ -7,9 +8,14 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)  # scrypt hashes run to ~162 characters
     role = db.Column(db.String(20), nullable=False, default='pasien')  # pasien, dokter, admin
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def __repr__(self):
-        return f'<User {self.email}>'
\ No newline at end of file
+        return f'<User {self.email}>'
+
+# (version, description, steps) tuples applied by common.migrations.run_migrations
+MIGRATIONS = [
+    (1, 'Widen user.password_hash for scrypt hashes', [alter_column_type('user', 'password_hash', db.String(255))]),
+]
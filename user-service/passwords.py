@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from prometheus_client import Counter, Gauge, Histogram
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Password hashing runs in a separate process pool so a login burst cannot
+# hold every request thread (and the GIL) while cheap endpoints wait.
+# At most HASH_POOL_MAX_PENDING hashes may be queued or running. A caller
+# waits up to HASH_POOL_SUBMIT_WAIT seconds for a place; after that it
+# gets PasswordHashPoolBusy and the route answers 503.
+#
+# The defaults queue 16 hashes per worker, a few seconds of work at the
+# default cost (about 0.25 s per hash on one core). That absorbs a burst
+# of logins like the bundled load test's, where every virtual user logs
+# in at once, and only sheds load once the wait would get longer.
+#
+# PASSWORD_HASH_METHOD must be written the way werkzeug stores it, with
+# every parameter spelled out (pbkdf2:sha256:600000, scrypt:32768:8:1),
+# otherwise every login would look like it needs a rehash. The default is
+# what generate_password_hash() produces with no method on the pinned
+# Werkzeug 2.3, so existing hashes are kept as they are.
+#
+# The pool's queue, rejections and latency are also exported on /metrics,
+# summed over gunicorn workers like the HTTP metrics.
+
+HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+SALT_LENGTH = int(os.environ.get('PASSWORD_SALT_LENGTH', '16'))
+POOL_WORKERS = int(os.environ.get('HASH_POOL_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+MAX_PENDING = int(os.environ.get('HASH_POOL_MAX_PENDING', POOL_WORKERS * 16))
+SUBMIT_WAIT = float(os.environ.get('HASH_POOL_SUBMIT_WAIT', '1'))
+
+HASH_IN_FLIGHT = Gauge(
+    'glowcare_password_hash_in_flight', 'Password hashes queued or running',
+    multiprocess_mode='livesum'
+)
+HASH_QUEUE_DEPTH = Gauge(
+    'glowcare_password_hash_queue_depth', 'Password hashes waiting for a pool worker',
+    multiprocess_mode='livesum'
+)
+HASH_REJECTED = Counter(
+    'glowcare_password_hash_rejected_total', 'Password hashes refused because the pool was full'
+)
+HASH_LATENCY = Histogram(
+    'glowcare_password_hash_duration_seconds', 'Time from submitting a password hash to its result',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+
+class PasswordHashPoolBusy(Exception):
+    pass
+
+
+class HashPool:
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._latencies = deque(maxlen=1000)
+
+    def _get_executor(self):
+        # One pool per process: preforked workers must not share the
+        # parent's executor.
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    self._pid = pid
+        return self._executor
+
+    def run(self, fn, *args, **kwargs):
+        if not self._slots.acquire(timeout=SUBMIT_WAIT):
+            with self._lock:
+                self._rejected += 1
+            HASH_REJECTED.inc()
+            raise PasswordHashPoolBusy()
+        started = time.perf_counter()
+        with self._lock:
+            self._pending += 1
+            self._export_pending()
+        try:
+            return self._get_executor().submit(fn, *args, **kwargs).result()
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._pending -= 1
+                self._completed += 1
+                self._latencies.append(elapsed)
+                self._export_pending()
+            HASH_LATENCY.observe(elapsed)
+            self._slots.release()
+
+    def _export_pending(self):
+        # Called with self._lock held.
+        HASH_IN_FLIGHT.set(self._pending)
+        HASH_QUEUE_DEPTH.set(max(0, self._pending - self.workers))
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            pending = self._pending
+            completed = self._completed
+            rejected = self._rejected
+
+        def percentile(fraction):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000, 2)
+
+        return {
+            'workers': self.workers,
+            'max_pending': self.max_pending,
+            'queue_depth': max(0, pending - self.workers),
+            'in_flight': pending,
+            'completed': completed,
+            'rejected': rejected,
+            'latency_p50_ms': percentile(0.5),
+            'latency_p95_ms': percentile(0.95),
+        }
+
+    def warm_up(self):
+        # Start the worker processes before the first login needs them.
+        executor = self._get_executor()
+        for future in [executor.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._pid = None
+
+
+hash_pool = HashPool(POOL_WORKERS, MAX_PENDING)
+
+
+def hash_password(password):
+    return hash_pool.run(generate_password_hash, password, method=HASH_METHOD, salt_length=SALT_LENGTH)
+
+
+def verify_password(password_hash, password):
+    return hash_pool.run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    # Werkzeug stores the fully expanded method (e.g. pbkdf2:sha256:600000)
+    # before the first '$', so a changed PASSWORD_HASH_METHOD shows up here.
+    method, _, rest = password_hash.partition('$')
+    salt = rest.partition('$')[0]
+    return method != HASH_METHOD or len(salt) != SALT_LENGTH